@@ -0,0 +1,371 @@
+# aggregator.py
+#
+# Live fan-in of finalized ballots from many booths (see booth_sink.py):
+#
+#   python aggregator.py serve [--address 0.0.0.0:8765 | unix:/tmp/votes.sock] [--state aggregator_state.json]
+#   python aggregator.py snapshot [--address ...]        current results, result.py style
+#   python aggregator.py simulate [--booths 8] [--ballots 300]
+#       localhost run with simulated booths, the aggregator stopped and
+#       restarted part way; checks the final tallies against what was sent
+#
+# One asyncio task per connection parses lines into a bounded queue; when
+# it is full the readers stop reading, which pushes back on the booths'
+# sockets. A single consumer applies the queue in batches, appends newly
+# counted ballots to <state>.log (flushed and fsynced once per batch) and
+# only then acks them. Ballot ids already counted are acked but not counted
+# again. The log is folded into the <state> snapshot every few seconds. Log
+# appends and snapshot saves run on one thread of their own, in the order
+# they were asked for, so a save never truncates the log under an append.
+
+import os
+import sys
+import json
+import time
+import random
+import socket
+import asyncio
+import argparse
+import tempfile
+import threading
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from booth_sink import BoothSink, parse_address, request_snapshot
+from result import print_results
+
+DEFAULT_ADDRESS = "127.0.0.1:8765"
+STATE_FILE = "aggregator_state.json"
+LINE_LIMIT = 1024 * 1024  # longest request line (a batch of ballots)
+
+
+def _ranges(numbers):
+    # [1, 2, 3, 7] -> [[1, 3], [7, 7]]; keeps the counted-id sets small on disk
+    out = []
+    for n in sorted(numbers):
+        if out and n == out[-1][1] + 1:
+            out[-1][1] = n
+        else:
+            out.append([n, n])
+    return out
+
+
+class Aggregator:
+    def __init__(self, state_path=None, queue_size=1024, batch=256, save_every=5.0):
+        self.state_path = state_path
+        self.queue_size = queue_size
+        self.batch = batch
+        self.save_every = save_every
+        self.vote_counts = defaultdict(Counter)
+        self.seen = defaultdict(set)  # booth -> ballot numbers counted
+        self._log = None
+        self._io = None  # the thread for log writes and saves while serving
+        self._loop = None
+        self._main = None
+
+        # stats
+        self.ballots = 0
+        self.duplicates = 0
+        self.rejected = 0
+        self.batches = 0
+        self.connections = 0
+        self.peak_queue = 0
+
+    # ---------- tallying ----------
+
+    def apply(self, bid, votes):
+        # True if counted, False if this id was counted before.
+        # Raises ValueError for a malformed ballot.
+        booth, _, number = bid.rpartition(":")
+        number = int(number)
+        if not booth or not isinstance(votes, dict):
+            raise ValueError(bid)
+        seen = self.seen[booth]
+        if number in seen:
+            self.duplicates += 1
+            return False
+        seen.add(number)
+        for position, candidate in votes.items():
+            if candidate:
+                self.vote_counts[position][candidate] += 1
+        self.ballots += 1
+        return True
+
+    def snapshot(self):
+        return {
+            "type": "snapshot",
+            "ts": time.time(),
+            "ballots": self.ballots,
+            "duplicates": self.duplicates,
+            "rejected": self.rejected,
+            "booths": {booth: len(numbers) for booth, numbers in self.seen.items()},
+            "tallies": {position: dict(counts) for position, counts in self.vote_counts.items()},
+        }
+
+    # ---------- persistence ----------
+
+    def load(self):
+        # snapshot first, then replay the log (ids already in the snapshot are skipped)
+        if not self.state_path:
+            return
+        if os.path.exists(self.state_path):
+            with open(self.state_path, encoding="utf-8") as sf:
+                state = json.load(sf)
+            for position, counts in state["tallies"].items():
+                self.vote_counts[position].update(counts)
+            for booth, ranges in state["seen"].items():
+                for lo, hi in ranges:
+                    self.seen[booth].update(range(lo, hi + 1))
+            self.ballots = state["ballots"]
+        log_path = self.state_path + ".log"
+        if os.path.exists(log_path):
+            with open(log_path, encoding="utf-8") as lf:
+                for line in lf:
+                    if not line.endswith("\n"):
+                        break  # torn write
+                    try:
+                        rec = json.loads(line)
+                        self.apply(rec["id"], rec["votes"])
+                    except (ValueError, KeyError):
+                        continue
+        self.duplicates = 0
+        self._log = open(log_path, "a", encoding="utf-8")
+
+    def _write_log(self, items):
+        self._log.write("".join(json.dumps(item) + "\n" for item in items))
+        self._log.flush()
+        os.fsync(self._log.fileno())
+
+    def save(self):
+        # fold the log into the snapshot file, then empty the log
+        if self.state_path:
+            self._store(self._state())
+
+    async def _save(self):
+        # The state is taken here on the loop; the files are written on the
+        # log thread after every log write queued before it. A ballot counted
+        # after this point has its log write queued after the truncate.
+        if self.state_path:
+            await self._loop.run_in_executor(self._io, self._store, self._state())
+
+    def _state(self):
+        return {
+            "tallies": {position: dict(counts) for position, counts in self.vote_counts.items()},
+            "seen": {booth: _ranges(numbers) for booth, numbers in self.seen.items()},
+            "ballots": self.ballots,
+        }
+
+    def _store(self, state):
+        tmp = self.state_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as sf:
+            json.dump(state, sf)
+            sf.flush()
+            os.fsync(sf.fileno())
+        os.replace(tmp, self.state_path)
+        if self._log:
+            self._log.truncate(0)
+
+    # ---------- server ----------
+
+    async def serve(self, address, started=None):
+        self._loop = asyncio.get_running_loop()
+        self._main = asyncio.current_task()
+        self.queue = asyncio.Queue(self.queue_size)
+        self._io = ThreadPoolExecutor(max_workers=1, thread_name_prefix="aggregator-log")
+        self.load()
+
+        family, addr = parse_address(address)
+        if family == getattr(socket, "AF_UNIX", None):
+            if os.path.exists(addr):
+                os.unlink(addr)  # stale socket from a previous run
+            server = await asyncio.start_unix_server(self._handle, addr, limit=LINE_LIMIT)
+        else:
+            server = await asyncio.start_server(self._handle, *addr, limit=LINE_LIMIT)
+        tasks = [asyncio.create_task(self._consume()), asyncio.create_task(self._save_loop())]
+        if started is not None:
+            started.set()
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            for task in tasks:
+                task.cancel()
+            server.close()
+            await self._save()  # after any log write still running
+            self._io.shutdown()
+            if self._log:
+                self._log.close()
+
+    async def _handle(self, reader, writer):
+        self.connections += 1
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    msg = json.loads(line)
+                except ValueError:
+                    self._reply(writer, {"type": "error", "error": "not JSON"})
+                    continue
+                kind = msg.get("type")
+                if kind == "ballots":
+                    for item in msg.get("items", ()):
+                        await self.queue.put((writer, item))  # blocks while the queue is full
+                    self.peak_queue = max(self.peak_queue, self.queue.qsize())
+                elif kind == "snapshot":
+                    self._reply(writer, self.snapshot())
+                elif kind != "hello":
+                    self._reply(writer, {"type": "error", "error": f"unknown type {kind!r}"})
+        except (ConnectionError, asyncio.LimitOverrunError, ValueError):
+            pass
+        except asyncio.CancelledError:
+            pass  # server shutting down; the booth reconnects and resends
+        finally:
+            self.connections -= 1
+            writer.close()
+
+    def _reply(self, writer, msg):
+        if not writer.is_closing():
+            writer.write((json.dumps(msg) + "\n").encode("utf-8"))
+
+    async def _consume(self):
+        while True:
+            batch = [await self.queue.get()]
+            while len(batch) < self.batch and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+
+            counted = []
+            acks = defaultdict(lambda: ([], []))  # writer -> (ids, rejected)
+            for writer, item in batch:
+                bid = item.get("id") if isinstance(item, dict) else None
+                try:
+                    if self.apply(bid, item.get("votes")):
+                        counted.append(item)
+                except (ValueError, AttributeError, TypeError):
+                    self.rejected += 1
+                    acks[writer][1].append(str(bid))
+                acks[writer][0].append(bid)
+            if counted and self._log:
+                # durable before the ack
+                await self._loop.run_in_executor(self._io, self._write_log, counted)
+            self.batches += 1
+            for writer, (ids, rejected) in acks.items():
+                self._reply(writer, {"type": "ack", "ids": ids, "rejected": rejected})
+
+    async def _save_loop(self):
+        while True:
+            await asyncio.sleep(self.save_every)
+            await self._save()
+
+    # ---------- running in a thread (simulate / embedding) ----------
+
+    def start_in_thread(self, address):
+        started = threading.Event()
+
+        def run():
+            try:
+                asyncio.run(self.serve(address, started))
+            except asyncio.CancelledError:
+                pass
+
+        self._thread = threading.Thread(target=run, name="aggregator", daemon=True)
+        self._thread.start()
+        if not started.wait(5):
+            raise RuntimeError(f"aggregator did not start on {address}")
+
+    def stop(self):
+        self._loop.call_soon_threadsafe(self._main.cancel)
+        self._thread.join(5)
+
+
+# ---------- simulation ----------
+
+def simulate(booths=8, ballots=300, seed=0, address=None):
+    # Booths vote in rounds; the aggregator goes down for the middle third
+    # and comes back from its state file. Returns True if the final
+    # snapshot matches the ballots the booths cast.
+    from ballot import load_ballot
+
+    ballot = load_ballot()
+    rng = random.Random(seed)
+    with tempfile.TemporaryDirectory(prefix="aggregator_sim_") as tmp:
+        if address is None:
+            address = f"unix:{tmp}/aggregator.sock" if hasattr(socket, "AF_UNIX") else DEFAULT_ADDRESS
+        state = os.path.join(tmp, STATE_FILE)
+        agg = Aggregator(state_path=state, save_every=0.5)
+        agg.start_in_thread(address)
+        sinks = [BoothSink(address, f"booth{i}", os.path.join(tmp, f"outbox{i}.jsonl"), timeout=2.0,
+                           retry_max_s=0.5) for i in range(booths)]
+
+        expected = defaultdict(Counter)
+        t0 = time.perf_counter()
+        for n in range(1, ballots + 1):
+            if n == ballots // 3:
+                agg.stop()
+                print(f"… aggregator stopped after round {n - 1}")
+            if n == 2 * ballots // 3:
+                agg = Aggregator(state_path=state, save_every=0.5)
+                agg.start_in_thread(address)
+                print(f"… aggregator restarted at round {n}")
+            for sink in sinks:
+                votes = {position: rng.choice(names)
+                         for position, names in zip(ballot.positions, ballot.candidates)
+                         if rng.random() > 0.02}  # a few positions left blank
+                sink.submit(n, votes)
+                for position, candidate in votes.items():
+                    expected[position][candidate] += 1
+                if n == 1 and sink is sinks[0]:
+                    first = votes
+            if n == 1:
+                sinks[0].wait_idle(5)
+                sinks[0].submit(1, first)  # a resend of a counted id: must not count twice
+
+        for sink in sinks:
+            if not sink.wait_idle(30):
+                print(f"❌ {sink.booth_id} still has {sink.pending()} ballot(s) queued")
+        elapsed = time.perf_counter() - t0
+        snapshot = request_snapshot(address)
+        agg.stop()
+
+    tallies = {position: Counter(counts) for position, counts in snapshot["tallies"].items()}
+    ok = tallies == dict(expected)
+    print(f"{booths} booths x {ballots} ballots in {elapsed:.2f} s; aggregator counted "
+          f"{snapshot['ballots']:,} ({sum(s.resent for s in sinks)} resent, peak queue {agg.peak_queue})")
+    print("✅ Tallies match the ballots cast" if ok else "❌ Tallies differ from the ballots cast")
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Live ballot aggregation across booths.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("serve", help="run the aggregation server")
+    p.add_argument("--address", default=DEFAULT_ADDRESS, help="host:port or unix:/path")
+    p.add_argument("--state", default=STATE_FILE, help="snapshot file (plus <state>.log)")
+    p.add_argument("--queue", type=int, default=1024, help="ballots buffered before booths are slowed")
+    p.add_argument("--batch", type=int, default=256)
+
+    p = sub.add_parser("snapshot", help="print the running results")
+    p.add_argument("--address", default=DEFAULT_ADDRESS)
+
+    p = sub.add_parser("simulate", help="localhost run with simulated booths")
+    p.add_argument("--booths", type=int, default=8)
+    p.add_argument("--ballots", type=int, default=300, help="ballots per booth")
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--address", help="default: a Unix socket in a temp dir")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        agg = Aggregator(state_path=args.state, queue_size=args.queue, batch=args.batch)
+        print(f"Aggregating on {args.address} (state: {args.state})")
+        try:
+            asyncio.run(agg.serve(args.address))
+        except KeyboardInterrupt:
+            pass
+        print(f"{agg.ballots:,} ballots from {len(agg.seen)} booth(s)")
+    elif args.command == "snapshot":
+        snapshot = request_snapshot(args.address)
+        print_results(defaultdict(Counter, {p: Counter(c) for p, c in snapshot["tallies"].items()}))
+        print(f"\n{snapshot['ballots']:,} ballots from {len(snapshot['booths'])} booth(s)")
+    else:
+        sys.exit(0 if simulate(args.booths, args.ballots, args.seed, args.address) else 1)
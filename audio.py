@@ -0,0 +1,119 @@
+# audio.py
+
+import sys
+import time
+import heapq
+import platform
+import threading
+import traceback
+
+# ---------- Backends: beep(freq_hz, dur_ms) blocks while the tone plays ----------
+
+class WinsoundBackend:
+    def __init__(self):
+        import winsound
+        self._beep = winsound.Beep
+
+    def beep(self, freq, dur):
+        self._beep(freq, dur)
+
+
+class BellBackend:
+    # Terminal bell: no pitch control, so just hold for the duration
+    def beep(self, freq, dur):
+        sys.stdout.write("\a")
+        sys.stdout.flush()
+        time.sleep(dur / 1000)
+
+
+class NullBackend:
+    def beep(self, freq, dur):
+        pass
+
+
+class RecordingBackend:
+    # For tests / headless runs: remembers what would have played
+    def __init__(self):
+        self.beeps = []  # (perf_counter, freq, dur)
+
+    def beep(self, freq, dur):
+        self.beeps.append((time.perf_counter(), freq, dur))
+
+
+def default_backend():
+    if platform.system() == "Windows":
+        return WinsoundBackend()
+    return BellBackend()
+
+
+# ---------- Worker ----------
+
+LONG, SHORT = 0, 1  # priorities: lower plays first
+
+
+class AudioWorker:
+    # One long-lived thread plays every beep, so callers never block and the
+    # thread count stays flat. Short beeps already waiting are merged into
+    # one; a long beep drops pending short ones and jumps the queue.
+
+    def __init__(self, backend=None, short=(1000, 100), long=(1500, 1000)):
+        self.backend = backend  # None: default_backend(), created on the first beep
+        self.short = short
+        self.long = long
+        self._pending = []  # heap of (priority, seq, freq, dur)
+        self._seq = 0
+        self._playing = False
+        self._cond = threading.Condition()
+
+        # stats
+        self.played = 0
+        self.merged = 0
+        self.preempted = 0
+
+        threading.Thread(target=self._run, name="audio", daemon=True).start()
+
+    def short_beep(self):
+        self._submit(SHORT, *self.short)
+
+    def long_beep(self):
+        self._submit(LONG, *self.long)
+
+    def _submit(self, priority, freq, dur):
+        with self._cond:
+            if priority == SHORT and any(p == SHORT for p, *_ in self._pending):
+                self.merged += 1
+                return
+            if priority == LONG:
+                kept = [b for b in self._pending if b[0] != SHORT]
+                self.preempted += len(self._pending) - len(kept)
+                self._pending = kept
+                heapq.heapify(self._pending)
+            self._seq += 1
+            heapq.heappush(self._pending, (priority, self._seq, freq, dur))
+            self._cond.notify()
+
+    def wait_idle(self, timeout=None):
+        # Block until everything queued has played (tests / shutdown)
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._pending and not self._playing, timeout)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._pending)
+                _, _, freq, dur = heapq.heappop(self._pending)
+                self._playing = True
+            try:
+                if self.backend is None:
+                    self.backend = default_backend()
+                self.backend.beep(freq, dur)
+            except Exception:
+                traceback.print_exc()
+            with self._cond:
+                self._playing = False
+                self.played += 1
+                self._cond.notify_all()
+
+    def summary(self):
+        return (f"Audio: {self.played} beeps played, {self.merged} merged, "
+                f"{self.preempted} pre-empted")
@@ -0,0 +1,165 @@
+# ballot.py
+#
+# Ballot definition (ballot.json) -> validated, compiled tables.
+#
+#   {"positions": [
+#       {"name": "Head Boy",
+#        "candidates": [{"name": "Fahmi Hamdhan", "key": "2"},
+#                       {"name": "Rayan Muhammed VP", "key": "3", "scan_code": 4}]},
+#       ...]}
+#
+# Every key name (and optional scan code) compiles to one packed int,
+# (position index << 16) | candidate index, so a keypress is one dict or
+# array lookup whatever the size of the ballot.
+
+import os
+import json
+from array import array
+
+BALLOT_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ballot.json")
+MAX_CANDIDATES = 1 << 16
+
+
+class BallotError(ValueError):
+    pass
+
+
+def pack(pos, cand):
+    return (pos << 16) | cand
+
+
+def unpack(code):
+    return code >> 16, code & 0xFFFF
+
+
+class BallotState:
+    # In-progress ballot: candidate index per position, -1 = not voted yet
+
+    __slots__ = ("choices", "count", "_blank")
+
+    def __init__(self, n_positions):
+        self._blank = array("i", [-1]) * n_positions
+        self.choices = array("i", self._blank)
+        self.count = 0
+
+    def select(self, pos, cand):
+        # False if this position already has a vote
+        if self.choices[pos] >= 0:
+            return False
+        self.choices[pos] = cand
+        self.count += 1
+        return True
+
+    def clear(self):
+        if self.count:
+            self.choices[:] = self._blank
+            self.count = 0
+
+    def __len__(self):
+        return self.count
+
+
+class Ballot:
+    def __init__(self, positions, candidates, keys, scan_codes):
+        self.positions = positions        # [position name]
+        self.candidates = candidates      # [[candidate name], ...] per position
+        self.candidate_index = [{name: i for i, name in enumerate(names)} for names in candidates]
+        self.key_codes = keys             # key name -> packed code
+        self.scan_table = array("i", [-1]) * (max(scan_codes, default=-1) + 1)
+        for scan_code, code in scan_codes.items():
+            self.scan_table[scan_code] = code
+
+    def lookup(self, name, scan_code=None):
+        # packed code for a key event, or -1 if the key isn't on the ballot
+        if scan_code is not None and 0 <= scan_code < len(self.scan_table):
+            code = self.scan_table[scan_code]
+            if code >= 0:
+                return code
+        return self.key_codes.get(name, -1)
+
+    def index_of(self, position, candidate):
+        # (pos, cand) for names, e.g. from the journal; None if not on the ballot
+        try:
+            pos = self.positions.index(position)
+        except ValueError:
+            return None
+        cand = self.candidate_index[pos].get(candidate)
+        return None if cand is None else (pos, cand)
+
+    def new_state(self):
+        return BallotState(len(self.positions))
+
+    def row(self, state):
+        # CSV row for a ballot; positions not voted are blank
+        return [self.candidates[pos][cand] if cand >= 0 else ""
+                for pos, cand in enumerate(state.choices)]
+
+    def key_mapping(self):
+        # key -> (candidate, position), the shape of the old KEY_MAPPING
+        mapping = {}
+        for key, code in self.key_codes.items():
+            pos, cand = unpack(code)
+            mapping[key] = (self.candidates[pos][cand], self.positions[pos])
+        return mapping
+
+
+def compile_ballot(definition):
+    errors = []
+    positions, candidates, keys, scan_codes = [], [], {}, {}
+
+    entries = definition.get("positions") if isinstance(definition, dict) else None
+    if not isinstance(entries, list) or not entries:
+        raise BallotError("Invalid ballot definition: needs a non-empty \"positions\" list")
+
+    for pos, entry in enumerate(entries):
+        name = entry.get("name") if isinstance(entry, dict) else None
+        if not isinstance(name, str) or not name:
+            errors.append(f"position #{pos + 1}: missing name")
+            name = f"#{pos + 1}"
+        elif name in positions:
+            errors.append(f"position {name!r} is listed twice")
+        positions.append(name)
+
+        names = []
+        cands = entry.get("candidates") if isinstance(entry, dict) else None
+        if not isinstance(cands, list) or not cands:
+            errors.append(f"{name}: needs at least one candidate")
+            cands = []
+        if len(cands) >= MAX_CANDIDATES:
+            errors.append(f"{name}: more than {MAX_CANDIDATES - 1} candidates")
+            cands = []
+        for cand, c in enumerate(cands):
+            c = c if isinstance(c, dict) else {}
+            cname, key, scan_code = c.get("name"), c.get("key"), c.get("scan_code")
+            if not isinstance(cname, str) or not cname:
+                errors.append(f"{name}: candidate #{cand + 1} has no name")
+            elif cname in names:
+                errors.append(f"{name}: candidate {cname!r} is listed twice")
+            names.append(cname)
+            if not isinstance(key, str) or not key:
+                errors.append(f"{name} / {cname}: missing key")
+            elif key in keys:
+                errors.append(f"key {key!r} is used by more than one candidate")
+            else:
+                keys[key] = pack(pos, cand)
+            if scan_code is not None:
+                if not isinstance(scan_code, int) or not 0 <= scan_code < MAX_CANDIDATES:
+                    errors.append(f"{name} / {cname}: bad scan_code {scan_code!r}")
+                elif scan_code in scan_codes:
+                    errors.append(f"scan code {scan_code} is used by more than one candidate")
+                else:
+                    scan_codes[scan_code] = pack(pos, cand)
+        candidates.append(names)
+
+    if errors:
+        raise BallotError("Invalid ballot definition:\n  - " + "\n  - ".join(errors))
+    return Ballot(positions, candidates, keys, scan_codes)
+
+
+def load_ballot(path=BALLOT_FILE):
+    try:
+        with open(path, encoding="utf-8") as bf:
+            definition = json.load(bf)
+    except (OSError, ValueError) as e:
+        raise BallotError(f"Cannot read ballot definition {path}: {e}")
+    return compile_ballot(definition)
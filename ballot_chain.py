@@ -0,0 +1,355 @@
+# ballot_chain.py
+#
+# Tamper-evident log for votes.csv. Every ballot row extends a hash chain,
+#
+#   h[0] = sha256("voting-chain-v1" + header line)
+#   h[i] = sha256(h[i-1] + bytes of row i as written)
+#
+# stored one fixed-width line per row in votes_chain.log together with the
+# CSV offset where the row ends. Every CHECKPOINT_EVERY rows (and at shutdown)
+# the current (row, hash) is signed with an HMAC key into votes_chain.sig.
+# Editing, inserting or deleting a row breaks the chain from that row on;
+# rebuilding the chain to hide it breaks the signatures unless the key is
+# known.
+#
+# So the key must not sit with the votes: anyone who can edit votes.csv and
+# read the key can rebuild the chain and re-sign every checkpoint, and
+# verify would pass. KEY_FILE defaults to the user's home directory, out of
+# the election directory; better is removable media that only staff hold
+# (key_exposed() tells when it is next to the chain). What the key can't
+# cover is anyone who reads it from the running machine, or from wherever
+# it is kept. Against them only a head recorded off the machine helps: the
+# staff panel shows the chain's row count and hash; write it on the
+# close-of-poll form (or anywhere the booth can't reach), and
+# `verify --anchor ROW:HASH` checks the chain still has it.
+#
+#   python ballot_chain.py verify [--csv votes.csv] [--backup backup_votes.csv] [--workers N]
+#                                 [--anchor ROW:HASH ...]
+#
+# checks both copies against the chain in parallel row ranges (the stored
+# per-row hashes let any range be checked on its own) and reports the first
+# row where each copy diverges.
+#
+#   python ballot_chain.py adopt [--csv votes.csv]
+#
+# chains every row after the end of the chain, for a votes.csv from before
+# the chain existed. The voting machine itself only chains rows its journal
+# sealed (see adopt()), so check the rows first: this signs whatever is there.
+
+import os
+import sys
+import hmac
+import hashlib
+import argparse
+
+CHAIN_FILE = "votes_chain.log"
+SIG_FILE = "votes_chain.sig"
+KEY_FILE = os.path.join(os.path.expanduser("~"), "voting_chain.key")  # not next to the votes
+ANCHOR_HEX = 16  # hash digits shown for a head to write down
+CHECKPOINT_EVERY = 500
+GENESIS = b"voting-chain-v1"
+LINE_LEN = 64 + 1 + 12 + 1  # "<sha256 hex> <end offset>\n"
+ROWS_PER_JOB = 50_000
+
+
+def genesis_hash(header_line):
+    return hashlib.sha256(GENESIS + header_line).digest()
+
+
+def _read_header(csv_path):
+    with open(csv_path, "rb") as f:
+        return f.readline()
+
+
+def load_key(path, create=False):
+    # None if there is no key (verification then skips the signatures)
+    if not os.path.exists(path):
+        if not create:
+            return None
+        with open(path, "w") as kf:
+            kf.write(os.urandom(32).hex() + "\n")
+    with open(path) as kf:
+        return bytes.fromhex(kf.read().strip())
+
+
+def sign(key, row, digest):
+    return hmac.new(key, f"{row}:{digest.hex()}".encode("ascii"), hashlib.sha256).hexdigest()
+
+
+def key_exposed(key_path, chain_path):
+    # True if the key is in the chain's directory (or below it), i.e. goes
+    # wherever the votes go
+    election_dir = os.path.dirname(os.path.abspath(chain_path))
+    key_dir = os.path.dirname(os.path.abspath(key_path))
+    return os.path.commonpath([election_dir, key_dir]) == election_dir
+
+
+def format_anchor(rows, digest):
+    return f"{rows}:{digest.hex()[:ANCHOR_HEX]}"
+
+
+class BallotChain:
+    # Writer side, used by _finalize_votes: append(line) after the row is in the CSVs
+
+    def __init__(self, csv_path, chain_path=CHAIN_FILE, sig_path=SIG_FILE, key_path=KEY_FILE,
+                 checkpoint_every=CHECKPOINT_EVERY, header=None):
+        # header: the CSV's first line, when csv_path is None (rows kept elsewhere)
+        self.csv_path = csv_path
+        self.checkpoint_every = checkpoint_every
+        self.key = load_key(key_path, create=True)
+        if header is None:
+            header = _read_header(csv_path)
+        self.header_len = len(header)
+
+        self._chain = open(chain_path, "a+b")
+        size = self._chain.seek(0, os.SEEK_END)
+        if size % LINE_LEN:
+            self._chain.truncate(size - size % LINE_LEN)  # torn last line from a crash
+        self.rows = size // LINE_LEN
+        if self.rows:
+            self._chain.seek((self.rows - 1) * LINE_LEN)
+            last = self._chain.read(LINE_LEN)
+            self.hash, self.offset = bytes.fromhex(last[:64].decode()), int(last[65:77])
+        else:
+            self.hash, self.offset = genesis_hash(header), self.header_len
+        self._sig = open(sig_path, "a")
+        self.signed_rows = self.rows
+        self.head = (self.rows, self.hash)  # read from the Tk thread; set in one assignment
+
+    def adopt(self, lines, sealed):
+        # Rows written just before a crash, before they were chained. lines:
+        # the rows after the end of the chain, in order; sealed: (end offset,
+        # sha256 hex) of each ballot the journal sealed past the chain. Rows
+        # are chained only while they are exactly those ballots, in place;
+        # anything else stays unchained for verify to report. Returns how
+        # many were chained.
+        sealed = sorted(sealed)
+        n = 0
+        for line in lines:
+            if n == len(sealed) or sealed[n] != (self.offset + len(line), hashlib.sha256(line).hexdigest()):
+                break
+            self.append(line)
+            n += 1
+        if n:
+            print(f"Hash chain: added {n} row(s) written before the last shutdown")
+        if n < len(lines):
+            print(f"⚠ {len(lines) - n} row(s) after the hash chain were not sealed by this machine's "
+                  f"journal: left unchained (run ballot_chain.py verify)")
+        return n
+
+    def append(self, line):
+        # line: the row's bytes exactly as written to the CSV
+        self.hash = hashlib.sha256(self.hash + line).digest()
+        self.offset += len(line)
+        self.rows += 1
+        self.head = (self.rows, self.hash)
+        self._chain.write(b"%s %012d\n" % (self.hash.hex().encode("ascii"), self.offset))
+        self._chain.flush()
+        if self.rows - self.signed_rows >= self.checkpoint_every:
+            self.checkpoint()
+
+    def checkpoint(self):
+        if self.rows == self.signed_rows:
+            return
+        os.fsync(self._chain.fileno())
+        self._sig.write(f"{self.rows},{self.hash.hex()},{sign(self.key, self.rows, self.hash)}\n")
+        self._sig.flush()
+        os.fsync(self._sig.fileno())
+        self.signed_rows = self.rows
+
+    def close(self):
+        self.checkpoint()
+        self._chain.close()
+        self._sig.close()
+
+
+# ---------- Verification ----------
+
+def _verify_range(job):
+    # Returns (index of the first bad row in [start, end), or None; reason)
+    csv_path, chain_path, start, end, prev_hash, prev_offset = job
+    with open(chain_path, "rb") as cf:
+        cf.seek(start * LINE_LEN)
+        chain = cf.read((end - start) * LINE_LEN)
+    end_offset = int(chain[-LINE_LEN + 65:-1])
+    with open(csv_path, "rb") as f:
+        f.seek(prev_offset)
+        data = f.read(end_offset - prev_offset)
+
+    h, pos = prev_hash, 0
+    sha256 = hashlib.sha256
+    for i in range(end - start):
+        entry = chain[i * LINE_LEN:(i + 1) * LINE_LEN]
+        row_end = int(entry[65:77]) - prev_offset
+        if row_end > len(data):
+            return start + i, "missing (file cut short)"
+        h = sha256(h + data[pos:row_end]).digest()
+        if h.hex().encode("ascii") != entry[:64]:
+            return start + i, "edited, inserted or deleted"
+        pos = row_end
+    return None, None
+
+
+def _row_text(csv_path, chain_path, row):
+    # the row's text in the CSV as the chain expects it to be positioned
+    with open(chain_path, "rb") as cf:
+        cf.seek(max(0, row - 1) * LINE_LEN)
+        start = int(cf.read(LINE_LEN)[65:77]) if row else len(_read_header(csv_path))
+    with open(csv_path, "rb") as f:
+        f.seek(start)
+        return f.readline().decode("utf-8", "replace").rstrip("\r\n")
+
+
+def verify(csv_path, chain_path=CHAIN_FILE, sig_path=SIG_FILE, key=None, pool=None, anchors=()):
+    # Returns a list of problems (empty = the file matches the chain).
+    # Signed checkpoints are checked too when the key is given, and the
+    # chain against anchors: "ROW:HASH" heads recorded off the machine.
+    problems = []
+    if not os.path.exists(chain_path):
+        return [f"no hash chain at {chain_path}"]
+    rows = os.path.getsize(chain_path) // LINE_LEN
+    header = _read_header(csv_path)
+    genesis = genesis_hash(header)
+
+    # Stored hash + offset at the start of every job range
+    ranges = [(s, min(s + ROWS_PER_JOB, rows)) for s in range(0, rows, ROWS_PER_JOB)]
+    starts = []
+    with open(chain_path, "rb") as cf:
+        for s, _ in ranges:
+            if s == 0:
+                starts.append((genesis, len(header)))
+            else:
+                cf.seek((s - 1) * LINE_LEN)
+                entry = cf.read(LINE_LEN)
+                starts.append((bytes.fromhex(entry[:64].decode()), int(entry[65:77])))
+        if rows:
+            cf.seek((rows - 1) * LINE_LEN)
+            end_offset = int(cf.read(LINE_LEN)[65:77])
+        else:
+            end_offset = len(header)
+
+    jobs = [(csv_path, chain_path, s, e, h, o) for (s, e), (h, o) in zip(ranges, starts)]
+    results = pool.map(_verify_range, jobs) if pool else map(_verify_range, jobs)
+    for bad, reason in results:
+        if bad is not None:
+            text = _row_text(csv_path, chain_path, bad)
+            problems.append(f"{csv_path}: row {bad + 1} (line {bad + 2}) {reason}: {text!r}")
+            break  # later ranges chain from stored hashes; the first divergence is what matters
+
+    size = os.path.getsize(csv_path)
+    if not problems and size > end_offset:
+        problems.append(f"{csv_path}: {size - end_offset} byte(s) after the last chained row (not in the chain)")
+
+    # Signed checkpoints: each must match the chain at its row
+    if key is not None and os.path.exists(sig_path):
+        with open(sig_path) as sf, open(chain_path, "rb") as cf:
+            for n, line in enumerate(sf, 1):
+                try:
+                    row, digest_hex, mac = line.strip().split(",")
+                    row, digest = int(row), bytes.fromhex(digest_hex)
+                except ValueError:
+                    problems.append(f"{sig_path}: line {n} unreadable")
+                    continue
+                if not hmac.compare_digest(mac, sign(key, row, digest)):
+                    problems.append(f"{sig_path}: checkpoint at row {row} has a bad signature")
+                elif row > rows:
+                    problems.append(f"{chain_path}: chain ends at row {rows}, checkpoint signed row {row}")
+                else:
+                    cf.seek((row - 1) * LINE_LEN)
+                    if cf.read(64) != digest_hex.encode("ascii"):
+                        problems.append(f"{chain_path}: row {row} differs from its signed checkpoint "
+                                        "(chain rebuilt after a row at or before it was changed)")
+
+    with open(chain_path, "rb") as cf:
+        for anchor in anchors:
+            row, _, prefix = anchor.partition(":")
+            try:
+                row = int(row)
+            except ValueError:
+                problems.append(f"anchor {anchor!r} unreadable (ROW:HASH)")
+                continue
+            if not 0 < row <= rows:
+                problems.append(f"{chain_path}: chain ends at row {rows}, anchor recorded row {row}")
+                continue
+            cf.seek((row - 1) * LINE_LEN)
+            if len(prefix) < 8 or not cf.read(64).decode("ascii").startswith(prefix.lower()):
+                problems.append(f"{chain_path}: row {row} differs from the recorded anchor {anchor} "
+                                "(chain rebuilt since it was written down)")
+    return problems
+
+
+def chain_stats(chain_path=CHAIN_FILE, sig_path=SIG_FILE):
+    rows = os.path.getsize(chain_path) // LINE_LEN if os.path.exists(chain_path) else 0
+    signed = 0
+    if os.path.exists(sig_path):
+        with open(sig_path) as sf:
+            for line in sf:
+                try:
+                    signed = max(signed, int(line.split(",")[0]))
+                except ValueError:
+                    pass
+    return rows, signed
+
+
+if __name__ == "__main__":
+    from storage import MAIN_CSV, BACKUP_CSV
+
+    parser = argparse.ArgumentParser(description="Verify the votes hash chain.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("verify", help="check votes.csv and its backup against the chain")
+    p.add_argument("--csv", default=MAIN_CSV)
+    p.add_argument("--backup", default=BACKUP_CSV, help="'' to skip")
+    p.add_argument("--chain", default=CHAIN_FILE)
+    p.add_argument("--sig", default=SIG_FILE)
+    p.add_argument("--key", default=KEY_FILE)
+    p.add_argument("--workers", type=int, default=0, help="processes (0 = all cores)")
+    p.add_argument("--anchor", action="append", default=[],
+                   help="ROW:HASH head recorded off the machine (staff panel); repeatable")
+    p = sub.add_parser("adopt", help="chain every row after the end of the chain (pre-chain votes.csv)")
+    p.add_argument("--csv", default=MAIN_CSV)
+    p.add_argument("--chain", default=CHAIN_FILE)
+    p.add_argument("--sig", default=SIG_FILE)
+    p.add_argument("--key", default=KEY_FILE)
+    args = parser.parse_args()
+
+    if args.command == "adopt":
+        chain = BallotChain(args.csv, args.chain, args.sig, args.key)
+        with open(args.csv, "rb") as f:
+            f.seek(chain.offset)
+            lines = [line for line in f.readlines() if line.endswith(b"\n")]
+        for line in lines:
+            chain.append(line)
+        chain.close()
+        print(f"Chained {len(lines):,} row(s); chain now {chain.rows:,} rows")
+        sys.exit(0)
+
+    import time
+    from concurrent.futures import ProcessPoolExecutor  # multiprocessing: only the verifier needs it
+
+    t0 = time.perf_counter()
+    rows, signed = chain_stats(args.chain, args.sig)
+    key = load_key(args.key)
+    with ProcessPoolExecutor(max_workers=args.workers or os.cpu_count()) as pool:
+        problems = verify(args.csv, args.chain, args.sig, key, pool=pool, anchors=args.anchor)
+        backup_problems = []
+        if args.backup and os.path.exists(args.backup):
+            backup_problems = verify(args.backup, args.chain, pool=pool)
+    elapsed = time.perf_counter() - t0
+
+    print(f"Chain: {rows:,} rows, signed through row {signed:,} ({elapsed:.2f} s)")
+    if rows:
+        with open(args.chain, "rb") as cf:
+            cf.seek((rows - 1) * LINE_LEN)
+            print(f"  head {format_anchor(rows, bytes.fromhex(cf.read(64).decode()))} "
+                  "(compare with the anchor written down at close of poll)")
+    if key is None:
+        print(f"  no key at {args.key}: chain checked, signatures not verified")
+    if rows > signed:
+        print(f"  {rows - signed:,} row(s) after the last signed checkpoint")
+    for problem in problems + backup_problems:
+        print(f"❌ {problem}")
+    if not problems and backup_problems:
+        print(f"❌ {args.backup} does not match {args.csv}")
+    if not problems and not backup_problems:
+        print("✅ Votes match the hash chain" + (" (main and backup)" if args.backup else ""))
+    sys.exit(1 if problems or backup_problems else 0)
@@ -0,0 +1,112 @@
+# ballot_store.py
+#
+# Compact columnar ballot file:
+#
+#   magic "VBAL" | version u16 | index width u8 (1 or 2) | pad u8
+#   header length u32 | ballot count u64 | header JSON | zero pad to 8 bytes
+#   one column per position: <ballot count> little-endian indices
+#
+# The JSON header holds "positions", "candidates" (one list per position)
+# and "position_order". Index 0 is a blank vote, index k is
+# candidates[position][k - 1]. Candidates and positions are numbered in
+# order of first appearance so tallies come out in the same order as
+# result.py's CSV path.
+
+import csv
+import sys
+import json
+import mmap
+import struct
+import argparse
+from array import array
+from collections import Counter, defaultdict
+
+MAGIC = b"VBAL"
+VERSION = 1
+PREFIX = struct.Struct("<4sHBxIQ")
+
+
+def convert_csv(csv_path, out_path):
+    with open(csv_path, newline="", encoding="utf-8") as f:
+        reader = csv.reader(f)
+        positions = next(reader, [])
+        n_pos = len(positions)
+        lookup = [{} for _ in positions]       # candidate -> index, per position
+        columns = [array("B") for _ in positions]
+        position_order = []
+        n = 0
+        for row in reader:
+            if not row:
+                continue
+            for i in range(n_pos):
+                cand = row[i] if i < len(row) else ""
+                if not cand:
+                    columns[i].append(0)
+                    continue
+                idx = lookup[i].get(cand)
+                if idx is None:
+                    if not lookup[i]:
+                        position_order.append(i)
+                    idx = lookup[i][cand] = len(lookup[i]) + 1
+                    if idx == 256:
+                        # more than 255 candidates: widen every column
+                        columns = [array("H", col) for col in columns]
+                columns[i].append(idx)
+            n += 1
+
+    width = columns[0].itemsize if columns else 1
+    header = json.dumps({
+        "positions": positions,
+        "candidates": [list(table) for table in lookup],
+        "position_order": position_order,
+    }).encode("utf-8")
+    pad = -(PREFIX.size + len(header)) % 8
+
+    with open(out_path, "wb") as out:
+        out.write(PREFIX.pack(MAGIC, VERSION, width, len(header), n))
+        out.write(header)
+        out.write(b"\0" * pad)
+        for col in columns:
+            if sys.byteorder != "little":
+                col.byteswap()
+            col.tofile(out)
+    return n
+
+
+def read_header(mm):
+    magic, version, width, header_len, n = PREFIX.unpack_from(mm, 0)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("not a ballot store (bad magic/version)")
+    start = PREFIX.size
+    header = json.loads(bytes(mm[start:start + header_len]).decode("utf-8"))
+    data_offset = start + header_len + (-(start + header_len) % 8)
+    return header, width, n, data_offset
+
+
+def tally_binary(path):
+    import numpy as np
+
+    vote_counts = defaultdict(Counter)
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        header, width, n, offset = read_header(mm)
+        dtype = np.dtype("<u1" if width == 1 else "<u2")
+        positions, candidates = header["positions"], header["candidates"]
+
+        for i in header["position_order"]:
+            col = np.frombuffer(mm, dtype=dtype, count=n, offset=offset + i * n * width)
+            counts = np.bincount(col, minlength=len(candidates[i]) + 1).tolist()
+            del col  # release the mmap view before the map is closed
+            vote_counts[positions[i]] = Counter(
+                {cand: counts[k] for k, cand in enumerate(candidates[i], 1) if counts[k]}
+            )
+    return vote_counts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert a votes CSV to the binary ballot store.")
+    parser.add_argument("csv_file", nargs="?", default="votes.csv")
+    parser.add_argument("out_file", nargs="?", default="votes.bin")
+    args = parser.parse_args()
+
+    n = convert_csv(args.csv_file, args.out_file)
+    print(f"Wrote {n} ballots to {args.out_file}")
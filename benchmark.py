@@ -0,0 +1,420 @@
+# benchmark.py
+#
+# Performance benchmarks, one suite per sub-command:
+#
+#   python benchmark.py tally [--rows N] [--workers 1,2,4,8] [votes.csv]
+#       CSV tally throughput and scaling across worker counts
+#
+#   python benchmark.py ballots [--voters N] [--storage csv|sqlite] [--save-baseline] [--tolerance 0.25]
+#                               [--slow-fsync-ms N]
+#       headless voting: ballots/s, keypress latency, bytes written per ballot,
+#       compared against bench_baseline.json. --slow-fsync-ms makes every
+#       fsync off the Tk thread (vote writer, journal F records) that slow,
+#       as on a slow USB stick: keypress latency should not move.
+#
+#   python benchmark.py metrics [--calls N]
+#       per-call overhead of the METRICS.timed instrumentation
+#
+#   python benchmark.py keys [--sizes 6x3,50x10,200x50,500x100]
+#       per-key dispatch cost as the ballot grows (positions x candidates)
+#
+#   python benchmark.py symbols [--repeat 3]
+#       symbol load time and memory: runtime PIL resize vs compiled ppm / png
+#
+#   python benchmark.py chain [--rows 1000000] [--workers 1,4,0]
+#       hash-chain verification time for a large votes archive
+#
+#   python benchmark.py throughput [--voters N] [--staff-ms 3000] [--walkup-ms 1500]
+#       voters per hour on the virtual clock, Start Voting per voter vs auto-arm
+
+import os
+import csv
+import json
+import time
+import random
+import argparse
+import tempfile
+import threading
+
+BASELINE_FILE = "bench_baseline.json"
+METRICS_OVERHEAD_LIMIT_US = 3.0
+
+
+def make_archive(path, rows, seed=0):
+    # Synthetic votes.csv in the format _finalize_votes writes
+    from ballot import load_ballot
+
+    ballot = load_ballot()
+    rng = random.Random(seed)
+    with open(path, "w", newline="") as cf:
+        writer = csv.writer(cf)
+        writer.writerow(ballot.positions)
+        for _ in range(rows):
+            writer.writerow([rng.choice(names) for names in ballot.candidates])
+
+
+def _ordered(vote_counts):
+    # what print_results depends on: position order, candidate order, counts
+    return [(pos, list(c.items())) for pos, c in vote_counts.items()]
+
+
+def bench_tally(args):
+    from result import tally_csv, tally_csv_parallel
+
+    path = args.file
+    if path is None:
+        fd, path = tempfile.mkstemp(suffix=".csv")
+        os.close(fd)
+        print(f"Generating {args.rows:,} ballots…")
+        make_archive(path, args.rows)
+
+    try:
+        t0 = time.perf_counter()
+        expected = _ordered(tally_csv(path))
+        base = time.perf_counter() - t0
+
+        print(f"\n{'engine':<20}{'time (s)':>10}{'rows/s':>14}{'speedup':>9}")
+        rows = None
+        for workers in args.workers:
+            t0 = time.perf_counter()
+            vote_counts, rows = tally_csv_parallel(path, workers)
+            elapsed = time.perf_counter() - t0
+            if _ordered(vote_counts) != expected:
+                raise SystemExit(f"Mismatch with DictReader tally at {workers} workers")
+            print(f"{f'chunked x{workers}':<20}{elapsed:>10.2f}{rows / elapsed:>14,.0f}{base / elapsed:>8.1f}x")
+        print(f"{'DictReader (old)':<20}{base:>10.2f}{rows / base:>14,.0f}{1:>8.1f}x")
+    finally:
+        if args.file is None:
+            os.remove(path)
+
+
+def _percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p * len(values)))] if values else 0.0
+
+
+def _bytes_written():
+    # bytes this process has passed to write() so far (Linux); None elsewhere
+    try:
+        with open("/proc/self/io") as io:
+            for line in io:
+                if line.startswith("wchar:"):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+
+
+def _check_baseline(results, baseline, tolerance):
+    # higher-is-better and lower-is-better metrics, compared with a margin
+    regressions = []
+    for key, higher_is_better in (("ballots_per_s", True), ("key_p50_us", False),
+                                  ("key_p99_us", False), ("bytes_per_ballot", False)):
+        old, new = baseline.get(key), results.get(key)
+        if not old or new is None:
+            continue
+        if higher_is_better and new < old * (1 - tolerance):
+            regressions.append(f"{key}: {new:,.1f} vs baseline {old:,.1f}")
+        if not higher_is_better and new > old * (1 + tolerance):
+            regressions.append(f"{key}: {new:,.1f} vs baseline {old:,.1f}")
+    return regressions
+
+
+def bench_ballots(args):
+    import voting_machine
+    from headless import Headless
+
+    voting_machine.STORAGE_BACKEND = args.storage
+    real_fsync = os.fsync
+    if args.slow_fsync_ms:
+        def slow_fsync(fd):
+            if threading.current_thread() is not threading.main_thread():
+                time.sleep(args.slow_fsync_ms / 1000)
+            real_fsync(fd)
+        os.fsync = slow_fsync
+    try:
+        with Headless(seed=args.seed) as sim:
+            sim.run_voters(20)  # warm up
+            sim.key_latencies.clear()
+            written = _bytes_written()
+            t0 = time.perf_counter()
+            sim.run_voters(args.voters)
+            elapsed = time.perf_counter() - t0
+            if written is not None:
+                written = _bytes_written() - written
+            latencies = sim.key_latencies
+    finally:
+        os.fsync = real_fsync
+
+    results = {
+        "voters": args.voters,
+        "ballots_per_s": args.voters / elapsed,
+        "key_p50_us": _percentile(latencies, 0.50) * 1e6,
+        "key_p90_us": _percentile(latencies, 0.90) * 1e6,
+        "key_p99_us": _percentile(latencies, 0.99) * 1e6,
+        "key_max_us": max(latencies) * 1e6,
+        "bytes_per_ballot": written / args.voters if written is not None else None,
+    }
+
+    print(f"Voters:            {args.voters:,} ({len(latencies):,} keypresses)")
+    print(f"Ballots/s:         {results['ballots_per_s']:,.0f}")
+    print(f"Keypress latency:  p50 {results['key_p50_us']:.0f} µs  p90 {results['key_p90_us']:.0f} µs  "
+          f"p99 {results['key_p99_us']:.0f} µs  max {results['key_max_us']:.0f} µs")
+    if written is not None:
+        print(f"Bytes written:     {results['bytes_per_ballot']:,.0f} per ballot")
+    if args.slow_fsync_ms:
+        print(f"(fsync off the Tk thread slowed to {args.slow_fsync_ms} ms; not compared with the baseline)")
+        return
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as bf:
+            json.dump(results, bf, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as bf:
+            regressions = _check_baseline(results, json.load(bf), args.tolerance)
+        if regressions:
+            print("❌ Regression against baseline:")
+            for r in regressions:
+                print(f"  {r}")
+            raise SystemExit(1)
+        print("✅ Within baseline tolerance")
+
+
+def bench_metrics(args):
+    from metrics import Metrics
+
+    def noop(self, event):
+        return None
+
+    timed_noop = Metrics().timed("noop")(noop)
+
+    def per_call(func):
+        best = float("inf")
+        for _ in range(5):
+            t0 = time.perf_counter()
+            for _ in range(args.calls):
+                func(None, None)
+            best = min(best, (time.perf_counter() - t0) / args.calls)
+        return best * 1e6
+
+    bare, timed = per_call(noop), per_call(timed_noop)
+    overhead = timed - bare
+    print(f"Bare call:      {bare:.3f} µs")
+    print(f"Timed call:     {timed:.3f} µs")
+    print(f"Overhead:       {overhead:.3f} µs per event (limit {METRICS_OVERHEAD_LIMIT_US} µs)")
+    if overhead > METRICS_OVERHEAD_LIMIT_US:
+        raise SystemExit("❌ Instrumentation overhead above limit")
+
+
+def bench_keys(args):
+    from ballot import compile_ballot, unpack
+
+    print(f"{'ballot':>12}{'keys':>8}{'ns/key':>10}{'row µs':>10}")
+    for size in args.sizes:
+        n_pos, n_cand = (int(x) for x in size.split("x"))
+        ballot = compile_ballot({"positions": [
+            {"name": f"P{p}", "candidates": [{"name": f"C{p}_{c}", "key": f"k{p}_{c}"} for c in range(n_cand)]}
+            for p in range(n_pos)
+        ]})
+        rng = random.Random(0)
+        # one voter: a key per position in order, plus a re-press of a voted position
+        presses = []
+        for p in range(n_pos):
+            presses.append(f"k{p}_{rng.randrange(n_cand)}")
+            presses.append(f"k{rng.randrange(p + 1)}_{rng.randrange(n_cand)}")
+
+        state = ballot.new_state()
+        lookup, select = ballot.lookup, state.select
+        rounds = max(1, 200_000 // len(presses))
+        t0 = time.perf_counter()
+        for _ in range(rounds):
+            for name in presses:
+                code = lookup(name, None)
+                if code >= 0:
+                    select(*unpack(code))
+            state.clear()
+        per_key = (time.perf_counter() - t0) / (rounds * len(presses))
+
+        for name in presses:
+            code = lookup(name, None)
+            select(*unpack(code))
+        t0 = time.perf_counter()
+        for _ in range(200):
+            ballot.row(state)
+        per_row = (time.perf_counter() - t0) / 200
+
+        print(f"{size:>12}{len(ballot.key_codes):>8}{per_key * 1e9:>10.0f}{per_row * 1e6:>10.1f}")
+
+
+def _rss_bytes():
+    # resident set size of this process (Linux); None elsewhere
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _load_symbols(compiled_dir):
+    # Runs in a fresh process so imports and RSS start from zero.
+    # compiled_dir None = the PIL path.
+    import tkinter as tk
+    from ballot import load_ballot
+    from symbol_cache import SymbolCache, SYMBOL_SIZE
+
+    rss0 = _rss_bytes()
+    candidates = [name for names in load_ballot().candidates for name in names]
+    cache = SymbolCache(1 << 40, compiled_dir=compiled_dir)
+    t0 = time.perf_counter()
+    decoded = {c: cache.decode(c, SYMBOL_SIZE) for c in candidates}
+    decode_s = time.perf_counter() - t0
+
+    photo_s = None
+    try:
+        root = tk.Tk()
+        root.withdraw()
+        t0 = time.perf_counter()
+        cache.preload(decoded, SYMBOL_SIZE)
+        photo_s = time.perf_counter() - t0
+    except tk.TclError:
+        pass  # no display: decode side only
+    rss1 = _rss_bytes()
+    return {
+        "symbols": len(candidates),
+        "decode_ms": decode_s * 1000,
+        "photo_ms": photo_s * 1000 if photo_s is not None else None,
+        "rss_mib": (rss1 - rss0) / 2**20 if rss0 is not None else None,
+    }
+
+
+def bench_symbols(args):
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+    from compile_symbols import compile_symbols
+    from symbol_cache import SYMBOL_SIZE
+
+    with tempfile.TemporaryDirectory() as tmp:
+        variants = [("PIL resize", None)]
+        for fmt in ("ppm", "png"):
+            out = os.path.join(tmp, fmt)
+            compile_symbols([SYMBOL_SIZE], fmt, out)
+            size = sum(os.path.getsize(os.path.join(out, f)) for f in os.listdir(out) if f.endswith(fmt))
+            variants.append((f"compiled {fmt} ({size / 2**20:.1f} MiB)", out))
+
+        print(f"{'variant':<28}{'decode ms':>11}{'photo ms':>10}{'total ms':>10}{'RSS MiB':>9}")
+        ctx = multiprocessing.get_context("spawn")
+        for name, compiled_dir in variants:
+            runs = []
+            for _ in range(args.repeat):
+                with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+                    runs.append(pool.submit(_load_symbols, compiled_dir).result())
+            best = min(runs, key=lambda r: r["decode_ms"] + (r["photo_ms"] or 0))
+            photo = best["photo_ms"]
+            total = best["decode_ms"] + (photo or 0)
+            rss = best["rss_mib"]
+            print(f"{name:<28}{best['decode_ms']:>11.1f}"
+                  f"{photo if photo is not None else float('nan'):>10.1f}{total:>10.1f}"
+                  f"{rss if rss is not None else float('nan'):>9.1f}")
+        if photo is None:
+            print("(no display: Tk PhotoImage creation not measured)")
+
+
+def bench_chain(args):
+    from concurrent.futures import ProcessPoolExecutor
+    from ballot_chain import BallotChain, verify, load_key
+
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, "votes.csv")
+        chain_path, sig_path, key_path = (os.path.join(tmp, n) for n in ("chain.log", "chain.sig", "chain.key"))
+        make_archive(csv_path, args.rows)
+        t0 = time.perf_counter()
+        chain = BallotChain(csv_path, chain_path, sig_path, key_path)
+        with open(csv_path, "rb") as f:
+            f.readline()  # header
+            for line in f:
+                chain.append(line)
+        chain.close()
+        print(f"Chained {args.rows:,} rows in {time.perf_counter() - t0:.2f} s")
+        key = load_key(key_path)
+
+        for workers in args.workers:
+            t0 = time.perf_counter()
+            with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+                problems = verify(csv_path, chain_path, sig_path, key, pool=pool)
+            elapsed = time.perf_counter() - t0
+            print(f"  {workers or os.cpu_count():>2} workers: {elapsed:.2f} s "
+                  f"({args.rows / elapsed:,.0f} rows/s){' ❌ ' + problems[0] if problems else ''}")
+
+
+def bench_throughput(args):
+    # Virtual time, so this measures dead time between voters, not CPU
+    import voting_machine
+    from headless import Headless
+
+    results = {}
+    for auto in (False, True):
+        voting_machine.AUTO_ARM = auto
+        with Headless(seed=args.seed, staff_ms=args.staff_ms, walkup_ms=args.walkup_ms) as sim:
+            sim.run_voter()  # first Start Voting click isn't part of the steady state
+            t0, done0 = sim.clock.now, sim.machine.total_students
+            sim.run_voters(args.voters)
+            hours = (sim.clock.now - t0) / 3.6e6
+            voted = sim.machine.total_students - done0
+        results[auto] = voted / hours
+        label = "auto-arm" if auto else "Start Voting per voter"
+        print(f"  {label:<24} {results[auto]:6.0f} voters/hour "
+              f"({(sim.clock.now - t0) / 1000 / args.voters:.1f} s per voter, {voted} ballots)")
+    voting_machine.AUTO_ARM = False
+    print(f"Auto-arm: {results[True] / results[False] - 1:+.0%} voters/hour")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Voting machine benchmarks.")
+    sub = parser.add_subparsers(dest="suite", required=True)
+
+    p = sub.add_parser("tally", help="CSV tally throughput and worker scaling")
+    p.add_argument("file", nargs="?", help="votes CSV to tally (default: generate one)")
+    p.add_argument("--rows", type=int, default=1_000_000, help="ballots to generate")
+    p.add_argument("--workers", default="1,2,4,8",
+                   type=lambda s: [int(w) for w in s.split(",")], help="comma-separated worker counts")
+    p.set_defaults(func=bench_tally)
+
+    p = sub.add_parser("ballots", help="headless voting throughput and keypress latency")
+    p.add_argument("--voters", type=int, default=2000)
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--storage", choices=("csv", "sqlite"), default="csv", help="ballot storage backend")
+    p.add_argument("--baseline", default=BASELINE_FILE)
+    p.add_argument("--save-baseline", action="store_true", help="record this run as the baseline")
+    p.add_argument("--tolerance", type=float, default=0.25, help="allowed regression (fraction)")
+    p.add_argument("--slow-fsync-ms", type=float, default=0,
+                   help="delay every fsync off the Tk thread (slow disk); keypress latency should not change")
+    p.set_defaults(func=bench_ballots)
+
+    p = sub.add_parser("metrics", help="overhead of hot-path instrumentation")
+    p.add_argument("--calls", type=int, default=200_000)
+    p.set_defaults(func=bench_metrics)
+
+    p = sub.add_parser("keys", help="per-key dispatch cost against ballot size")
+    p.add_argument("--sizes", default="6x3,50x10,200x50,500x100",
+                   type=lambda s: s.split(","), help="comma-separated POSITIONSxCANDIDATES")
+    p.set_defaults(func=bench_keys)
+
+    p = sub.add_parser("symbols", help="symbol load time and memory, PIL vs compiled assets")
+    p.add_argument("--repeat", type=int, default=3, help="fresh processes per variant (best is kept)")
+    p.set_defaults(func=bench_symbols)
+
+    p = sub.add_parser("chain", help="hash-chain verification time")
+    p.add_argument("--rows", type=int, default=1_000_000)
+    p.add_argument("--workers", default="1,4,0",
+                   type=lambda s: [int(w) for w in s.split(",")], help="comma-separated, 0 = all cores")
+    p.set_defaults(func=bench_chain)
+
+    p = sub.add_parser("throughput", help="voters per hour, manual start vs auto-arm")
+    p.add_argument("--voters", type=int, default=500)
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--staff-ms", type=int, default=3000, help="ballot done -> staff clicks Start Voting")
+    p.add_argument("--walkup-ms", type=int, default=1500, help="ballot done -> next voter at the keypad")
+    p.set_defaults(func=bench_throughput)
+
+    args = parser.parse_args()
+    args.func(args)
@@ -0,0 +1,220 @@
+# booth_sink.py
+#
+# Optional live feed of finalized ballots from a booth to aggregator.py.
+# The vote CSVs stay the record; this only streams a copy.
+#
+# Every ballot is appended to an outbox file before it is queued, so a
+# restart doesn't lose what the aggregator hasn't confirmed yet. One
+# background thread sends batches and waits for the acks; while the
+# aggregator is unreachable ballots just wait in the queue and the booth
+# keeps voting. Ballot ids are "<booth>:<journal ballot id>" and the
+# aggregator counts an id only once, so resending is always safe.
+#
+# Wire format (both ways): one JSON object per line.
+#   -> {"type": "hello", "booth": "B1"}
+#   -> {"type": "ballots", "items": [{"id": "B1:7", "votes": {position: candidate}}]}
+#   <- {"type": "ack", "ids": ["B1:7"], "rejected": []}
+#   -> {"type": "snapshot"}   <- {"type": "snapshot", "tallies": {...}, ...}
+
+import os
+import json
+import time
+import socket
+import threading
+import traceback
+from itertools import islice
+from collections import OrderedDict
+
+
+def parse_address(address):
+    # "host:port" -> TCP, "unix:/path/to.sock" -> Unix socket
+    if address.startswith("unix:"):
+        return socket.AF_UNIX, address[5:]
+    host, _, port = address.rpartition(":")
+    return socket.AF_INET, (host or "127.0.0.1", int(port))
+
+
+def connect(address, timeout):
+    family, addr = parse_address(address)
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        sock.connect(addr)
+    except OSError:
+        sock.close()
+        raise
+    return sock
+
+
+def request_snapshot(address, timeout=5.0):
+    # Current tallies from a running aggregator
+    with connect(address, timeout) as sock:
+        sock.sendall(b'{"type": "snapshot"}\n')
+        with sock.makefile("r", encoding="utf-8") as reader:
+            return json.loads(reader.readline())
+
+
+class BoothSink:
+    def __init__(self, address, booth_id, outbox_path=None, batch=64, timeout=5.0, retry_max_s=5.0):
+        self.address = address
+        self.booth_id = booth_id
+        self.outbox_path = outbox_path
+        self.batch = batch
+        self.timeout = timeout
+        self.retry_max_s = retry_max_s
+        self._pending = OrderedDict()  # ballot id -> votes, not acked yet
+        self._in_flight = ()
+        self._cond = threading.Condition()
+        self._sock = None
+        self._reader = None
+        self._outbox = None
+
+        # stats
+        self.sent = 0
+        self.acked = 0
+        self.rejected = 0
+        self.resent = 0       # ballots in flight when a connection failed
+        self.connects = 0
+        self.failures = 0
+
+        if outbox_path:
+            self._load_outbox()
+            self._outbox = open(outbox_path, "a", encoding="utf-8")
+
+        threading.Thread(target=self._run, name="booth-sink", daemon=True).start()
+
+    def submit(self, ballot_id, votes):
+        # Tk thread: votes is {position: candidate}, unvoted positions left out
+        bid = f"{self.booth_id}:{ballot_id}"
+        with self._cond:
+            if self._outbox:
+                self._outbox.write(json.dumps({"b": bid, "v": votes}) + "\n")
+                self._outbox.flush()
+            self._pending[bid] = votes
+            self._cond.notify()
+
+    def pending(self):
+        return len(self._pending)
+
+    def wait_idle(self, timeout=None):
+        # Block until everything submitted has been acked (tests / simulate)
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._pending, timeout)
+
+    def close(self):
+        with self._cond:
+            if self._outbox:
+                self._outbox.close()
+                self._outbox = None
+
+    # ---------- outbox ----------
+
+    def _load_outbox(self):
+        # "b" lines queue a ballot, "a" lines ack ids; a torn last line is skipped
+        if not os.path.exists(self.outbox_path):
+            return
+        with open(self.outbox_path, encoding="utf-8") as of:
+            for line in of:
+                if not line.endswith("\n"):
+                    break
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    continue
+                if "b" in rec:
+                    self._pending[rec["b"]] = rec["v"]
+                for bid in rec.get("a", ()):
+                    self._pending.pop(bid, None)
+
+    def _acked(self, ids, rejected):
+        # caller holds self._cond
+        done = [bid for bid in ids if self._pending.pop(bid, None) is not None]
+        self.acked += len(done)
+        if rejected:
+            self.rejected += len(rejected)
+            print(f"Aggregator rejected ballot(s): {', '.join(rejected)}")
+        if self._outbox and done:
+            if not self._pending:
+                self._outbox.truncate(0)  # everything confirmed: start empty
+            else:
+                self._outbox.write(json.dumps({"a": done}) + "\n")
+            self._outbox.flush()
+        self._cond.notify_all()
+
+    # ---------- sender thread ----------
+
+    def _run(self):
+        delay = 0.1
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._pending)
+            try:
+                self._send_batch()
+                delay = 0.1
+            except (OSError, ValueError) as e:
+                self.failures += 1
+                self.resent += len(self._in_flight)
+                if self.failures == 1 or self._sock is not None:
+                    print(f"Aggregator unreachable ({e}); {len(self._pending)} ballot(s) queued")
+                self._disconnect()
+                time.sleep(delay)
+                delay = min(delay * 2, self.retry_max_s)
+            except Exception:
+                traceback.print_exc()
+                self._disconnect()
+                time.sleep(self.retry_max_s)
+
+    def _send_batch(self):
+        if self._sock is None:
+            self._sock = connect(self.address, self.timeout)
+            self._reader = self._sock.makefile("r", encoding="utf-8")
+            self._write({"type": "hello", "booth": self.booth_id})
+            self.connects += 1
+
+        with self._cond:
+            batch = list(islice(self._pending.items(), self.batch))
+        self._in_flight = waiting = {bid for bid, _ in batch}
+        self._write({"type": "ballots", "items": [{"id": bid, "votes": v} for bid, v in batch]})
+        self.sent += len(batch)
+
+        while waiting:
+            line = self._reader.readline()
+            if not line:
+                raise ConnectionError("aggregator closed the connection")
+            msg = json.loads(line)
+            if msg.get("type") == "ack":
+                with self._cond:
+                    self._acked(msg["ids"], msg.get("rejected"))
+                waiting.difference_update(msg["ids"])
+        self._in_flight = ()
+
+    def _write(self, msg):
+        self._sock.sendall((json.dumps(msg) + "\n").encode("utf-8"))
+
+    def _disconnect(self):
+        self._in_flight = ()
+        if self._sock is not None:
+            try:
+                self._reader.close()
+                self._sock.close()
+            except OSError:
+                pass
+            self._sock = self._reader = None
+
+    def stats(self):
+        return {
+            "pending": len(self._pending),
+            "sent": self.sent,
+            "acked": self.acked,
+            "rejected": self.rejected,
+            "resent": self.resent,
+            "connects": self.connects,
+            "failures": self.failures,
+            "connected": self._sock is not None,
+        }
+
+    def summary(self):
+        s = self.stats()
+        return (f"Aggregator feed: {s['acked']} acked, {s['pending']} queued, "
+                f"{s['resent']} resent, {s['connects']} connects / {s['failures']} failures "
+                f"({'connected' if s['connected'] else 'disconnected'})")
@@ -0,0 +1,130 @@
+# compile_symbols.py
+#
+# Build step for candidate symbols: every candidate in ballot.json gets its
+# symbols/<Name>.png scaled once to each display size and written to
+# symbols_compiled/ in a format tk.PhotoImage reads without PIL:
+#
+#   ppm  (default) flattened onto the white window background; no decompression
+#   png  keeps transparency; needs Tk 8.6+
+#
+# symbols_compiled/manifest.json records the sha256 of every source and output,
+# so re-running only rebuilds what changed:
+#
+#   python compile_symbols.py [--sizes 400x400,200x200] [--format ppm] [--force]
+
+import os
+import sys
+import json
+import hashlib
+import argparse
+
+import symbol_cache
+from ballot import BALLOT_FILE, load_ballot
+from symbol_cache import COMPILED_DIR, MANIFEST_FILE, SYMBOL_SIZE
+
+MANIFEST_VERSION = 1
+
+
+def sha256_of(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def output_name(candidate, size, fmt):
+    return f"{candidate.replace(' ', '_')}_{size[0]}x{size[1]}.{fmt}"
+
+
+def read_manifest(out_dir):
+    try:
+        with open(os.path.join(out_dir, MANIFEST_FILE)) as mf:
+            manifest = json.load(mf)
+    except (OSError, ValueError):
+        return {}
+    if manifest.get("version") != MANIFEST_VERSION:
+        return {}
+    return {(e["candidate"], tuple(e["size"]), e["format"]): e for e in manifest.get("entries", [])}
+
+
+def render(source, size, fmt, path):
+    # Same resize as the runtime PIL path, so compiled and live images match
+    img = symbol_cache.Image.open(source).convert("RGBA").resize(size)
+    if fmt == "ppm":
+        flat = symbol_cache.Image.new("RGB", size, "white")
+        flat.paste(img, mask=img.getchannel("A"))
+        img = flat
+    tmp = path + ".tmp"
+    img.save(tmp, format=fmt.upper())
+    os.replace(tmp, path)
+
+
+def compile_symbols(sizes, fmt="ppm", out_dir=COMPILED_DIR, force=False, ballot_file=BALLOT_FILE):
+    cache = symbol_cache.SymbolCache(0)
+    old = read_manifest(out_dir)
+    os.makedirs(out_dir, exist_ok=True)
+    candidates = sorted({c for names in load_ballot(ballot_file).candidates for c in names})
+
+    entries, built, current, missing = [], 0, 0, []
+    for candidate in candidates:
+        source = cache.path_for(candidate)
+        if not os.path.exists(source):
+            missing.append(candidate)
+            continue
+        source_hash = sha256_of(source)
+        st = os.stat(source)
+        for size in sizes:
+            name = output_name(candidate, size, fmt)
+            path = os.path.join(out_dir, name)
+            prev = old.get((candidate, size, fmt))
+            stale = (force or prev is None or prev["source_sha256"] != source_hash
+                     or not os.path.exists(path) or sha256_of(path) != prev["output_sha256"])
+            if stale:
+                symbol_cache.import_pil()
+                render(source, size, fmt, path)
+                built += 1
+            else:
+                current += 1
+            entries.append({
+                "candidate": candidate,
+                "size": list(size),
+                "format": fmt,
+                "source": source,
+                "source_sha256": source_hash,
+                # cheap freshness check for the machine at startup
+                "source_size": st.st_size,
+                "source_mtime_ns": st.st_mtime_ns,
+                "output": name,
+                "output_sha256": sha256_of(path) if stale else prev["output_sha256"],
+            })
+
+    # keep entries for other formats so switching back and forth doesn't rebuild
+    entries += [e for key, e in old.items() if key[2] != fmt and os.path.exists(os.path.join(out_dir, e["output"]))]
+    tmp = os.path.join(out_dir, MANIFEST_FILE + ".tmp")
+    with open(tmp, "w") as mf:
+        json.dump({"version": MANIFEST_VERSION, "entries": entries}, mf, indent=1)
+    os.replace(tmp, os.path.join(out_dir, MANIFEST_FILE))
+    return built, current, missing
+
+
+def parse_size(text):
+    w, h = (int(x) for x in text.lower().split("x"))
+    return (w, h)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pre-scale candidate symbols for the voting machine.")
+    parser.add_argument("--sizes", default=f"{SYMBOL_SIZE[0]}x{SYMBOL_SIZE[1]}",
+                        type=lambda s: [parse_size(x) for x in s.split(",")],
+                        help="comma-separated WxH display sizes")
+    parser.add_argument("--format", choices=("ppm", "png"), default="ppm")
+    parser.add_argument("--out", default=COMPILED_DIR)
+    parser.add_argument("--force", action="store_true", help="rebuild everything")
+    args = parser.parse_args()
+
+    built, current, missing = compile_symbols(args.sizes, args.format, args.out, args.force)
+    print(f"Symbols: {built} built, {current} up to date -> {args.out}")
+    if missing:
+        print(f"⚠ No symbol file for: {', '.join(missing)}")
+        sys.exit(1)
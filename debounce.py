@@ -0,0 +1,106 @@
+# debounce.py
+#
+# Time-based key debounce used by on_key_press, with thresholds from
+# debounce.json (written by `python keyboard_testing.py report --write`).
+# Each key is its own little state machine, driven by the keyboard
+# library's down/up events and their timestamps:
+#
+#   UP   --down-->  DOWN   press accepted, unless it comes within chatter_ms
+#                          of this key's release (contact bounce)
+#   DOWN --down-->  DOWN   auto-repeat while held: ignored. A down more than
+#                          repeat_window_ms after the previous one means the
+#                          release was lost, so it counts as a new press.
+#   any  --up---->  UP     release time remembered for the chatter check
+
+import os
+import json
+
+DEBOUNCE_FILE = "debounce.json"
+
+# Safe for common USB keypads when nothing has been measured
+DEFAULTS = {"chatter_ms": 30, "repeat_window_ms": 1000}
+
+_UP, _DOWN = 0, 1
+
+
+def load_config(path=DEBOUNCE_FILE):
+    # DEFAULTS overlaid with whatever thresholds the file has
+    config = dict(DEFAULTS)
+    if os.path.exists(path):
+        try:
+            with open(path) as df:
+                saved = json.load(df)
+            config.update({k: float(saved[k]) for k in DEFAULTS if k in saved})
+        except (OSError, ValueError, TypeError) as e:
+            print(f"⚠ Ignoring {path} ({e}); using default debounce")
+    return config
+
+
+def save_config(config, path=DEBOUNCE_FILE, **extra):
+    # thresholds plus anything worth keeping next to them (keypad, trace, date)
+    with open(path, "w") as df:
+        json.dump({**{k: config[k] for k in DEFAULTS}, **extra}, df, indent=2)
+        df.write("\n")
+
+
+class Debouncer:
+    def __init__(self, config=None):
+        config = config or DEFAULTS
+        self.chatter_s = config["chatter_ms"] / 1000
+        self.repeat_window_s = config["repeat_window_ms"] / 1000
+        self._keys = {}  # name -> [state, last down time, last up time]
+
+        # stats
+        self.accepted = 0
+        self.repeats = 0
+        self.chatter = 0
+        self.lost_ups = 0
+
+    def feed(self, name, event_type, t):
+        # True if this event is a press to act on; t in seconds
+        key = self._keys.get(name)
+        if key is None:
+            key = self._keys[name] = [_UP, None, None]
+
+        if event_type != "down":
+            key[0], key[2] = _UP, t
+            return False
+
+        state, last_down, last_up = key
+        key[1] = t
+        if state == _DOWN:
+            if t - last_down <= self.repeat_window_s:
+                self.repeats += 1
+                return False
+            self.lost_ups += 1
+        elif last_up is not None and t - last_up < self.chatter_s:
+            key[0] = _DOWN  # still bouncing: a repeat of the press already counted
+            self.chatter += 1
+            return False
+        key[0] = _DOWN
+        self.accepted += 1
+        return True
+
+    def accept(self, event):
+        # keyboard library event; events without a timestamp never bounce
+        t = getattr(event, "time", None)
+        if t is None:
+            return event.event_type == "down"
+        return self.feed(event.name, event.event_type, t)
+
+    def reset(self):
+        # between ballots: whatever was held doesn't carry over
+        self._keys.clear()
+
+    def stats(self):
+        return {
+            "accepted": self.accepted,
+            "repeats": self.repeats,
+            "chatter": self.chatter,
+            "lost_ups": self.lost_ups,
+        }
+
+    def summary(self):
+        return (f"Debounce: {self.accepted} presses, {self.repeats} auto-repeats and "
+                f"{self.chatter} bounces ignored, {self.lost_ups} lost releases "
+                f"(chatter {self.chatter_s * 1000:.0f} ms, repeat window {self.repeat_window_s * 1000:.0f} ms)")
@@ -0,0 +1,120 @@
+# display.py
+#
+# One DisplayScheduler per window (student screen, Keyboard Test). Handlers
+# call show() with what the labels should say; nothing is drawn right away.
+#
+#   - updates land in one pending state and are applied by a single redraw
+#     when Tk next goes idle, so a burst of keys handled in one pass costs
+#     one redraw, and options a label already has are not set again
+#   - there is one "clear" deadline per window: a new show() moves it
+#     instead of stacking timers, so an old vote's timer can't wipe the
+#     symbol of the next one
+#   - the cleared state uses a preallocated blank image the size of the
+#     symbols (the image slot), so the label keeps its size and the window
+#     isn't re-laid out on every clear
+#
+# Time from show() to the redraw that applied it is recorded in the
+# "<name>_feedback" metrics histogram.
+
+import time
+
+from metrics import METRICS
+
+
+class DisplayScheduler:
+    def __init__(self, window, labels, blank, name="display"):
+        # labels: {slot name: Label}; blank: {slot name: options when cleared}.
+        # The labels are expected to be created showing the blank options.
+        self.window = window
+        self.labels = labels
+        self.blank = blank
+        self.name = name
+        self._shown = {slot: dict(options) for slot, options in blank.items()}
+        self._wanted = {}
+        self._redraw_after = None
+        self._clear_after = None
+        self._requested_ns = 0
+        self.latency = METRICS.histogram(name + "_feedback")
+
+        # stats
+        self.updates = 0
+        self.redraws = 0
+        self.configs = 0
+        self.unchanged = 0        # slot updates skipped: already showing that
+        self.clears = 0
+        self.deadline_moves = 0   # clear deadline pushed back by a newer update
+
+    def show(self, clear_after_ms=None, **slots):
+        # slots: slot name -> options, e.g. show(2000, symbol={"image": img, "text": ""})
+        for slot, options in slots.items():
+            self._wanted.setdefault(slot, {}).update(options)
+        self.updates += 1
+        if self._redraw_after is None:
+            self._requested_ns = time.perf_counter_ns()
+            self._redraw_after = self.window.after_idle(self._redraw)
+        if clear_after_ms is not None:
+            self.clear_after(clear_after_ms)
+
+    def clear_after(self, ms):
+        if self._clear_after is not None:
+            self.window.after_cancel(self._clear_after)
+            self.deadline_moves += 1
+        self._clear_after = self.window.after(ms, self._on_deadline)
+
+    def clear(self):
+        # blank on the next redraw and forget any pending deadline
+        self._cancel_deadline()
+        self.show(**self.blank)
+
+    def cancel(self):
+        # the window is going away: drop the pending redraw and deadline
+        self._cancel_deadline()
+        if self._redraw_after is not None:
+            self.window.after_cancel(self._redraw_after)
+            self._redraw_after = None
+        self._wanted.clear()
+
+    def _cancel_deadline(self):
+        if self._clear_after is not None:
+            self.window.after_cancel(self._clear_after)
+            self._clear_after = None
+
+    def _on_deadline(self):
+        self._clear_after = None
+        self.clears += 1
+        self.show(**self.blank)
+
+    def _redraw(self):
+        self._redraw_after = None
+        wanted, self._wanted = self._wanted, {}
+        for slot, options in wanted.items():
+            shown = self._shown[slot]
+            changed = {k: v for k, v in options.items() if shown.get(k) is not v and shown.get(k) != v}
+            if changed:
+                self.labels[slot].config(**changed)
+                shown.update(changed)  # also keeps the PhotoImage referenced
+                self.configs += 1
+            else:
+                self.unchanged += 1
+        self.redraws += 1
+        self.latency.record(time.perf_counter_ns() - self._requested_ns)
+
+    def stats(self):
+        s = self.latency.summary()
+        return {
+            "updates": self.updates,
+            "redraws": self.redraws,
+            "configs": self.configs,
+            "unchanged": self.unchanged,
+            "clears": self.clears,
+            "deadline_moves": self.deadline_moves,
+            "feedback_p50_ms": s["p50_us"] / 1000,
+            "feedback_p99_ms": s["p99_us"] / 1000,
+        }
+
+    def summary(self):
+        s = self.stats()
+        return (f"Display {self.name}: {s['updates']} updates in {s['redraws']} redraws "
+                f"({s['configs']} label changes, {s['unchanged']} skipped), "
+                f"{s['clears']} clears, {s['deadline_moves']} deadlines moved, "
+                f"feedback p50 {s['feedback_p50_ms']:.2f} ms / p99 {s['feedback_p99_ms']:.2f} ms")
@@ -0,0 +1,191 @@
+# durable_writer.py
+#
+# Appends ballot rows to votes.csv and backup_votes.csv from one background
+# thread, so the Tk loop never waits on them. (It still fsyncs its own
+# journal records, but never behind this thread's; see vote_journal.py.)
+# Both files stay open. The thread takes everything queued as one group and
+# commits it with a single write + fsync per file, then calls each row's
+# done() callback (used to extend the hash chain and close the ballot in the
+# journal only once the row is on disk). Rows that arrive during an fsync
+# form the next group.
+#
+# max_latency_ms trades latency for bigger groups: the first row of a group
+# may wait that long for others to join it (0 = commit as soon as the
+# thread is free). max_batch caps a group either way.
+#
+# If a write fails (USB stick pulled, disk full) the group is kept and
+# retried every RETRY_S for the files that haven't got it yet; the error
+# is printed and shown in stats() until a commit succeeds. A failed file
+# is closed and reopened for the retry, and cut back to its size before
+# the group, so rows that reached it before the error aren't written twice.
+
+import os
+import time
+import threading
+import traceback
+from collections import deque
+
+from metrics import METRICS
+
+RETRY_S = 1.0
+
+
+class DurableWriter:
+    def __init__(self, paths, max_latency_ms=0, max_batch=256):
+        self.paths = list(paths)
+        self.max_latency_s = max_latency_ms / 1000
+        self.max_batch = max_batch
+        self._files = [open(p, "ab", buffering=0) for p in self.paths]  # None: reopen on retry
+        self._queue = deque()  # (data, done, submitted at ns)
+        self._in_flight = 0
+        self._closing = False
+        self._abandoned = False  # close() gave up waiting: done() no longer runs
+        self._cond = threading.Condition()
+        self.latency = METRICS.histogram("durable_commit")  # submit -> on disk
+        self.error = None
+
+        # stats
+        self.rows = 0
+        self.commits = 0
+        self.largest_batch = 0
+        self.peak_depth = 0
+        self.retries = 0
+        self.fsync_ns = 0
+
+        self._thread = threading.Thread(target=self._run, name="durable-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, data, done=None):
+        # Tk thread: queue one row's bytes; done() runs on the writer thread
+        with self._cond:
+            if self._closing:
+                raise ValueError("writer is closed")
+            self._queue.append((data, done, time.perf_counter_ns()))
+            self.peak_depth = max(self.peak_depth, len(self._queue) + self._in_flight)
+            self._cond.notify_all()
+
+    def depth(self):
+        # rows submitted and not yet on disk
+        return len(self._queue) + self._in_flight
+
+    def flush(self, timeout=None):
+        # Block until everything submitted is on disk; False on timeout
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._queue and not self._in_flight, timeout)
+
+    def close(self, timeout=None):
+        # Returns how many rows are not on disk (0: everything written). On
+        # timeout the thread keeps retrying in the background, but their
+        # done() callbacks are dropped: the caller is shutting down.
+        with self._cond:
+            self._closing = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            with self._cond:
+                self._abandoned = True
+                unwritten = self.depth()
+            print(f"⚠ Vote writer still has {unwritten} row(s) unwritten: {self.error}")
+            return unwritten
+        for f in self._files:
+            if f is not None:
+                f.close()
+        return 0
+
+    # ---------- writer thread ----------
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._queue or self._closing)
+                if not self._queue:
+                    return  # closing and nothing left
+                if self.max_latency_s and not self._closing:
+                    # let more rows join, up to the first one's latency budget
+                    deadline = self._queue[0][2] / 1e9 + self.max_latency_s
+                    self._cond.wait_for(lambda: len(self._queue) >= self.max_batch or self._closing,
+                                        max(0.0, deadline - time.perf_counter()))
+                batch = [self._queue.popleft() for _ in range(min(self.max_batch, len(self._queue)))]
+                self._in_flight = len(batch)
+
+            self._commit(batch)
+
+            now = time.perf_counter_ns()
+            for _, done, submitted in batch:
+                self.latency.record(now - submitted)
+                if done is not None and not self._abandoned:
+                    try:
+                        done()
+                    except Exception:
+                        traceback.print_exc()
+            with self._cond:
+                self._in_flight = 0
+                self.rows += len(batch)
+                self.commits += 1
+                self.largest_batch = max(self.largest_batch, len(batch))
+                self._cond.notify_all()
+
+    def _commit(self, batch):
+        data = b"".join(d for d, _, _ in batch)
+        pending = list(range(len(self.paths)))
+        start = {}  # file index -> its size before this group
+        while pending:
+            i = pending[0]
+            try:
+                f = self._files[i]
+                if f is None:
+                    f = self._files[i] = open(self.paths[i], "ab", buffering=0)
+                if i in start:
+                    # an earlier attempt may have left part of the group behind
+                    if os.fstat(f.fileno()).st_size > start[i]:
+                        os.ftruncate(f.fileno(), start[i])
+                else:
+                    start[i] = f.seek(0, os.SEEK_END)
+                view = memoryview(data)
+                while view:
+                    view = view[f.write(view):]
+                t0 = time.perf_counter_ns()
+                os.fsync(f.fileno())
+                self.fsync_ns += time.perf_counter_ns() - t0
+                pending.pop(0)
+            except OSError as e:
+                if self.error is None:
+                    print(f"❌ Writing {self.paths[i]} failed ({e}); retrying, {self.depth()} row(s) waiting")
+                self.error = e
+                self.retries += 1
+                self._drop(i)
+                time.sleep(RETRY_S)
+        self.error = None
+
+    def _drop(self, i):
+        # after an error the handle can't be trusted: reopen it on the next try
+        f, self._files[i] = self._files[i], None
+        if f is not None:
+            try:
+                f.close()
+            except OSError:
+                pass
+
+    def stats(self):
+        s = self.latency.summary()
+        return {
+            "depth": self.depth(),
+            "peak_depth": self.peak_depth,
+            "rows": self.rows,
+            "commits": self.commits,
+            "rows_per_commit": self.rows / self.commits if self.commits else 0.0,
+            "largest_batch": self.largest_batch,
+            "commit_p50_ms": s["p50_us"] / 1000,
+            "commit_p99_ms": s["p99_us"] / 1000,
+            "fsync_ms_per_commit": self.fsync_ns / len(self._files) / self.commits / 1e6 if self.commits else 0.0,
+            "retries": self.retries,
+            "error": str(self.error) if self.error else None,
+        }
+
+    def summary(self):
+        s = self.stats()
+        return (f"Vote writer: {s['rows']} rows in {s['commits']} commits "
+                f"({s['rows_per_commit']:.1f} per commit, largest {s['largest_batch']}), "
+                f"peak queue {s['peak_depth']}, commit p50 {s['commit_p50_ms']:.1f} ms / "
+                f"p99 {s['commit_p99_ms']:.1f} ms, fsync {s['fsync_ms_per_commit']:.1f} ms per file, "
+                f"{s['retries']} retries")
@@ -0,0 +1,372 @@
+# headless.py
+#
+# Drive VotingMachine without a display, PIN dialog or physical keyboard.
+# Tk, the dialogs and the keyboard hook are swapped for in-memory stand-ins
+# and every after() callback runs on a virtual clock, so a full election day
+# can be replayed in seconds:
+#
+#   with Headless() as sim:
+#       sim.run_voters(1000)
+#
+# Files are written to a scratch working directory (symbols/ and
+# symbols_compiled/ are linked in).
+
+import os
+import heapq
+import random
+import shutil
+import tempfile
+import time
+from types import SimpleNamespace
+
+import audio
+import key_dispatcher
+import symbol_cache
+import voting_machine
+from voting_machine import POSITIONS, KEY_MAPPING, STAFF_PIN
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Keys a voter might hit that aren't on the ballot
+INVALID_KEYS = ["a", "enter", "space", "tab", "1", "4", "8", "up", "f5"]
+
+
+# ---------- Virtual clock ----------
+
+class VirtualClock:
+    def __init__(self):
+        self.now = 0.0  # ms
+        self._heap = []
+        self._seq = 0
+        self._cancelled = set()
+
+    def after(self, ms, func=None, *args):
+        self._seq += 1
+        heapq.heappush(self._heap, (self.now + ms, self._seq, func, args))
+        return f"after#{self._seq}"
+
+    def after_cancel(self, after_id):
+        self._cancelled.add(int(after_id.split("#")[1]))
+
+    def pending(self):
+        return len(self._heap) - len(self._cancelled)
+
+    def advance(self, ms):
+        target = self.now + ms
+        while self._heap and self._heap[0][0] <= target:
+            due, seq, func, args = heapq.heappop(self._heap)
+            self.now = due
+            if seq in self._cancelled:
+                self._cancelled.discard(seq)
+            elif func is not None:
+                func(*args)
+        self.now = target
+
+
+# ---------- Tk stand-ins ----------
+
+class _Widget:
+    def __init__(self, master=None, **options):
+        self.master = master
+        self.clock = master.clock if master is not None else None
+        self.options = dict(options)
+        self.children = []
+        self.visible = True
+        if master is not None:
+            master.children.append(self)
+
+    def config(self, **options):
+        self.options.update(options)
+        var = self.options.get("textvariable")
+        if "text" in options and var is not None:
+            var.set(options["text"])
+
+    configure = config
+
+    def cget(self, key):
+        if key == "text" and "textvariable" in self.options:
+            return self.options["textvariable"].get()
+        return self.options.get(key, "")
+
+    def after(self, ms, func=None, *args):
+        return self.clock.after(ms, func, *args)
+
+    def after_idle(self, func, *args):
+        return self.clock.after(0, func, *args)
+
+    def after_cancel(self, after_id):
+        self.clock.after_cancel(after_id)
+
+    def winfo_children(self):
+        return list(self.children)
+
+    def destroy(self):
+        for child in list(self.children):
+            child.destroy()
+        if self.master is not None and self in self.master.children:
+            self.master.children.remove(self)
+
+    def grid(self, **kw):
+        self.visible = True
+
+    pack = grid
+
+    def grid_remove(self):
+        self.visible = False
+
+    def withdraw(self):
+        self.visible = False
+
+    def deiconify(self):
+        self.visible = True
+
+    def title(self, *a):
+        pass
+
+    def geometry(self, *a):
+        pass
+
+    def protocol(self, name, func):
+        self.options[name] = func
+
+    def mainloop(self):
+        pass
+
+
+class _Tk(_Widget):
+    clock = None  # set per simulation
+
+    def __init__(self, **options):
+        super().__init__(None, **options)
+        self.clock = _Tk.clock
+
+
+class _StringVar:
+    def __init__(self, master=None, value=""):
+        self.value = value
+
+    def set(self, value):
+        self.value = value
+
+    def get(self):
+        return self.value
+
+
+class _FakePhotoImage:
+    live = 0  # instances not yet garbage collected (soak.py watches this)
+
+    def __init__(self, img=None, file=None, width=None, height=None):
+        # compiled symbols come in as a file; assume the size they were built for
+        if img is not None:
+            self.size = img.size
+        elif width is not None:
+            self.size = (width, height)  # blank image slot
+        else:
+            self.size = voting_machine.SYMBOL_SIZE
+        self.file = file
+        _FakePhotoImage.live += 1
+
+    def __del__(self):
+        _FakePhotoImage.live -= 1
+
+    def width(self):
+        return self.size[0]
+
+    def height(self):
+        return self.size[1]
+
+
+fake_tk = SimpleNamespace(
+    Tk=_Tk, Toplevel=_Widget, Label=_Widget, Button=_Widget, Frame=_Widget,
+    StringVar=_StringVar, PhotoImage=_FakePhotoImage, TclError=voting_machine.tk.TclError,
+    DISABLED="disabled", NORMAL="normal",
+)
+
+
+# ---------- Keyboard stand-in ----------
+
+class _FakeKeyboard:
+    def __init__(self, clock):
+        self.clock = clock
+        self.hooks = []  # (callback, presses only)
+
+    def on_press(self, callback):
+        self.hooks.append((callback, True))
+        return callback
+
+    def hook(self, callback):
+        self.hooks.append((callback, False))
+        return callback
+
+    def unhook(self, callback):
+        self.hooks = [h for h in self.hooks if h[0] is not callback]
+
+    def send(self, name, event_type="down"):
+        # event time follows the virtual clock, as debounce.py reads it
+        event = SimpleNamespace(name=name, event_type=event_type, scan_code=None,
+                                time=self.clock.now / 1000)
+        for callback, presses_only in list(self.hooks):
+            if event_type == "down" or not presses_only:
+                callback(event)
+
+
+# ---------- Synthetic voters ----------
+
+def keys_by_position():
+    by_position = [[] for _ in POSITIONS]
+    for key, (_, position) in KEY_MAPPING.items():
+        by_position[POSITIONS.index(position)].append(key)
+    return by_position
+
+
+def voter_keys(rng, p_repeat=0.08, p_invalid=0.05, p_revote=0.05, p_abandon=0.02):
+    # One voter's key sequence and whether they walk away before finishing.
+    # Repeats, stray keys and a second pick for a voted position are all
+    # things the machine has to ignore.
+    by_position = keys_by_position()
+    n = len(POSITIONS)
+    abandoned = rng.random() < p_abandon
+    if abandoned:
+        n = rng.randrange(1, len(POSITIONS))
+    keys = []
+    for pos in range(n):
+        if rng.random() < p_invalid:
+            keys.append(rng.choice(INVALID_KEYS))
+        key = rng.choice(by_position[pos])
+        keys.append(key)
+        if rng.random() < p_repeat:
+            keys.append(key)
+        if rng.random() < p_revote:
+            keys.append(rng.choice(by_position[rng.randrange(pos + 1)]))
+    return keys, abandoned
+
+
+# ---------- Simulation ----------
+
+def key_path(workdir):
+    # the chain key for a run in workdir: next to it, not inside, as on a
+    # real machine (ballot_chain.key_exposed)
+    return os.path.normpath(os.path.abspath(workdir)) + ".key"
+
+
+class Headless:
+    def __init__(self, workdir=None, seed=0, key_gap_ms=(300, 1500), hold_ms=80,
+                 staff_ms=0, walkup_ms=0, audio_backend=None):
+        self.workdir = workdir
+        self.rng = random.Random(seed)
+        self.key_gap_ms = key_gap_ms
+        self.hold_ms = hold_ms
+        self.staff_ms = staff_ms    # ballot done -> staff clicks Start Voting
+        self.walkup_ms = walkup_ms  # ballot done -> next voter ready at the keypad
+        self.audio_backend = audio_backend or audio.NullBackend()
+        self.clock = VirtualClock()
+        self.keyboard = _FakeKeyboard(self.clock)
+        self.key_latencies = []  # seconds, hook -> handled, per keypress
+        self.ballots = 0
+        self.abandoned = 0
+
+    def __enter__(self):
+        self._own_workdir = self.workdir is None
+        if self._own_workdir:
+            self.workdir = tempfile.mkdtemp(prefix="voting_sim_")
+        self._old_cwd = os.getcwd()
+        os.chdir(self.workdir)
+        for assets in ("symbols", symbol_cache.COMPILED_DIR):
+            source = os.path.join(REPO_DIR, assets)
+            if os.path.isdir(source) and not os.path.exists(assets):
+                try:
+                    os.symlink(source, assets)
+                except OSError:
+                    shutil.copytree(source, assets)
+
+        _Tk.clock = self.clock
+        self._patches = [
+            (voting_machine, "tk", fake_tk),
+            (voting_machine, "simpledialog", SimpleNamespace(askstring=lambda *a, **kw: STAFF_PIN)),
+            (voting_machine, "messagebox", SimpleNamespace(
+                showinfo=lambda *a, **kw: None, showerror=lambda *a, **kw: None,
+                askyesno=lambda *a, **kw: False)),
+            (key_dispatcher, "keyboard", self.keyboard),
+            (symbol_cache, "ImageTk", SimpleNamespace(PhotoImage=_FakePhotoImage)),
+            (symbol_cache, "tk", fake_tk),
+            (voting_machine, "CHAIN_KEY_FILE", key_path(self.workdir)),
+        ]
+        for i, (module, name, value) in enumerate(self._patches):
+            self._patches[i] = (module, name, getattr(module, name))
+            setattr(module, name, value)
+
+        self.machine = voting_machine.VotingMachine()
+        self.machine.audio.backend = self.audio_backend
+        while not self.machine.ready:  # background warm-up runs in real time
+            time.sleep(0.005)
+            self.clock.advance(20)
+        return self
+
+    def __exit__(self, *exc):
+        self.machine._close_storage()
+        for module, name, value in self._patches:
+            setattr(module, name, value)
+        os.chdir(self._old_cwd)
+        if self._own_workdir:
+            shutil.rmtree(self.workdir, ignore_errors=True)
+            try:
+                os.remove(key_path(self.workdir))
+            except FileNotFoundError:
+                pass
+
+    def advance(self, ms):
+        self.clock.advance(ms)
+
+    def press(self, name):
+        # hook thread pushes, then one dispatcher poll handles it; the
+        # release follows hold_ms later
+        t0 = time.perf_counter()
+        self.keyboard.send(name)
+        self.clock.advance(self.machine.dispatcher.poll_ms)
+        self.key_latencies.append(time.perf_counter() - t0)
+        self.clock.advance(self.hold_ms)
+        self.keyboard.send(name, "up")
+
+    def run_voter(self):
+        m = self.machine
+        if m.hook is None:
+            # staff clicks Start Voting while the voter steps up
+            self.advance(max(self.staff_ms, self.walkup_ms))
+            m.start_voting()
+        else:
+            # auto-arm: the hook is still installed, wait for the next ballot
+            while not m.voting_active:
+                self.advance(m.dispatcher.poll_ms)
+            self.advance(self.walkup_ms)
+        keys, abandoned = voter_keys(self.rng)
+        for key in keys:
+            self.press(key)
+            self.advance(self.rng.uniform(*self.key_gap_ms))
+        if abandoned:
+            self.machine.reset_voting()  # staff gives up on the ballot
+            self.abandoned += 1
+        if m.hook is None or not voting_machine.AUTO_ARM:
+            self.advance(2500)  # finalize delay and feedback
+        self.ballots += 1
+
+    def run_voters(self, n):
+        for _ in range(n):
+            self.run_voter()
+
+    def test_keyboard(self, n_keys=10):
+        # staff opens Keyboard Test, tries some keys, closes the window
+        before = list(self.machine.root.children)
+        self.machine.open_test_keyboard()
+        win = next(w for w in self.machine.root.children if w not in before)
+        by_position = keys_by_position()
+        for _ in range(n_keys):
+            keys = self.rng.choice(by_position) if self.rng.random() > 0.2 else INVALID_KEYS
+            self.press(self.rng.choice(keys))
+            self.advance(self.rng.uniform(*self.key_gap_ms))
+        win.options["WM_DELETE_WINDOW"]()
+        self.advance(2500)
+
+    def widget_count(self):
+        def count(widget):
+            return 1 + sum(count(child) for child in widget.children)
+        return count(self.machine.root)
@@ -0,0 +1,114 @@
+# key_dispatcher.py
+
+import time
+import traceback
+from collections import deque
+
+# The keyboard library is imported on first use (see import_keyboard)
+keyboard = None
+
+
+def import_keyboard():
+    global keyboard
+    if keyboard is None:
+        import keyboard
+
+
+class KeyDispatcher:
+    # Hands key events from the keyboard library's listener thread to the Tk
+    # main loop. The hook callback only timestamps the event and appends it
+    # to a bounded deque (append/popleft are atomic in CPython, no lock);
+    # the Tk loop drains it in batches on a short after() poll, so handlers
+    # can touch widgets and files safely.
+
+    def __init__(self, root, poll_ms=10, max_depth=256, batch=32):
+        self.root = root
+        self.poll_ms = poll_ms
+        self.max_depth = max_depth
+        self.batch = batch
+        self._queue = deque()
+        self._handlers = {}  # hook id -> (handler, keyboard hook)
+        self._next_id = 0
+
+        # stats
+        self.dispatched = 0
+        self.dropped = 0      # events refused because the queue was full
+        self.peak_depth = 0
+        self._waits = deque(maxlen=1000)  # recent hook -> handler waits (s)
+
+        self.root.after(self.poll_ms, self._drain)
+
+    def on_press(self, handler):
+        # Same shape as keyboard.on_press, but handler runs on the Tk thread
+        return self._hook(handler, presses_only=True)
+
+    def on_key(self, handler):
+        # keyboard.hook: downs and ups (for debounce.py)
+        return self._hook(handler, presses_only=False)
+
+    def _hook(self, handler, presses_only):
+        import_keyboard()
+        self._next_id += 1
+        hook_id = self._next_id
+        register = keyboard.on_press if presses_only else keyboard.hook
+        hook = register(lambda event: self._push(hook_id, event))
+        self._handlers[hook_id] = (handler, hook)
+        return hook_id
+
+    def unhook(self, hook_id):
+        entry = self._handlers.pop(hook_id, None)
+        if entry:
+            keyboard.unhook(entry[1])
+
+    def depth(self):
+        return len(self._queue)
+
+    # runs on the keyboard listener thread: keep it to an append
+    def _push(self, hook_id, event):
+        if len(self._queue) >= self.max_depth:
+            self.dropped += 1
+            return
+        self._queue.append((time.perf_counter(), hook_id, event))
+
+    def _drain(self):
+        try:
+            self.peak_depth = max(self.peak_depth, len(self._queue))
+            for _ in range(self.batch):
+                try:
+                    queued_at, hook_id, event = self._queue.popleft()
+                except IndexError:
+                    break
+                entry = self._handlers.get(hook_id)
+                if entry is None:
+                    continue  # unhooked while the event was queued
+                self._waits.append(time.perf_counter() - queued_at)
+                self.dispatched += 1
+                try:
+                    entry[0](event)
+                except Exception:
+                    traceback.print_exc()
+        finally:
+            # come straight back if a burst is still queued
+            self.root.after(0 if self._queue else self.poll_ms, self._drain)
+
+    def stats(self):
+        waits = sorted(self._waits)
+
+        def pct(p):
+            return waits[min(len(waits) - 1, int(p * len(waits)))] * 1000 if waits else 0.0
+
+        return {
+            "depth": len(self._queue),
+            "peak_depth": self.peak_depth,
+            "dispatched": self.dispatched,
+            "dropped": self.dropped,
+            "wait_p50_ms": pct(0.50),
+            "wait_p99_ms": pct(0.99),
+            "wait_max_ms": waits[-1] * 1000 if waits else 0.0,
+        }
+
+    def summary(self):
+        s = self.stats()
+        return (f"Key dispatcher: {s['dispatched']} events, {s['dropped']} dropped, "
+                f"peak depth {s['peak_depth']}, wait p50 {s['wait_p50_ms']:.1f} ms / "
+                f"p99 {s['wait_p99_ms']:.1f} ms / max {s['wait_max_ms']:.1f} ms")
@@ -1,28 +1,213 @@
-import keyboard
-import platform
-
-# Beep function for different OS
-def beep():
-    if platform.system() == 'Windows':
-        import winsound
-        winsound.Beep(1000, 100)  # frequency (Hz), duration (ms)
-    else:
-        import os
-        os.system('printf "\a"')  # ANSI beep (may not work on all terminals)
+# keyboard_testing.py
+#
+# Keypad check and qualification before an election.
+#
+#   python keyboard_testing.py                     echo presses as the voting machine sees them
+#   python keyboard_testing.py record [--out keypad_trace.jsonl]
+#       record every raw down/up event until ESC, then report on it
+#   python keyboard_testing.py report keypad_trace.jsonl [--write [debounce.json]]
+#       per key: hook latency, hold time, auto-repeat delay and rate, chatter;
+#       recommends debounce thresholds and with --write saves them for
+#       voting_machine.py (see debounce.py)
+#   python keyboard_testing.py replay keypad_trace.jsonl [--config debounce.json]
+#       run a recorded trace through the debouncer and print what it accepts
+#
+# Recording: press every key a few times normally, hold a couple of them
+# down for a second or two (auto-repeat), and tap quickly on one.
+# Hook latency is the keyboard library's event timestamp to our callback;
+# on Linux that timestamp comes from the kernel, on Windows it is taken in
+# the library's own hook, so it only shows delivery delay.
+
+import sys
+import json
+import math
+import time
+import argparse
+import threading
+from statistics import median
+
+from debounce import DEBOUNCE_FILE, DEFAULTS, Debouncer, load_config, save_config
+
+TRACE_FILE = "keypad_trace.jsonl"
+CHATTER_SCAN_MS = 80  # same key released and pressed again faster than this: a bounce, not a finger
+MIN_CHATTER_MS = 10
+
 
-print("Start typing... (Press ESC to exit)")
+def echo():
+    import keyboard
+    from audio import AudioWorker
 
-last_key = None
+    # One background beeper: winsound on Windows, terminal bell elsewhere
+    audio = AudioWorker(short=(1000, 100))  # frequency (Hz), duration (ms)
+    debounce = Debouncer(load_config())
 
-while True:
-    event = keyboard.read_event()
-    if event.event_type == keyboard.KEY_DOWN:
-        if event.name != last_key:
+    print("Start typing... (Press ESC to exit)")
+
+    while True:
+        event = keyboard.read_event()
+        if debounce.accept(event):
             print(f'You pressed: {event.name}')
-            beep()
+            audio.short_beep()
             if event.name == 'esc':
                 break
-            last_key = event.name
-    elif event.event_type == keyboard.KEY_UP:
-        # Reset last_key on key release to allow next press
-        last_key = None
+
+    audio.wait_idle(1)  # let the ESC beep play before exiting
+    print(debounce.summary())
+
+
+def record(out_path):
+    # Raw events, one JSON object per line, until ESC is released
+    import keyboard
+
+    done = threading.Event()
+    events = []
+
+    def on_event(event):
+        seen = time.time()
+        events.append({"name": event.name, "scan": event.scan_code, "type": event.event_type,
+                       "t": event.time, "seen": seen})
+        if event.name == "esc" and event.event_type == "up":
+            done.set()
+
+    print("Recording raw key events... (ESC to stop)")
+    hook = keyboard.hook(on_event)
+    done.wait()
+    keyboard.unhook(hook)
+
+    events = [e for e in events if e["name"] != "esc"]
+    with open(out_path, "w") as tf:
+        for e in events:
+            tf.write(json.dumps(e) + "\n")
+    print(f"{len(events)} events written to {out_path}")
+    return events
+
+
+def load_trace(path):
+    with open(path) as tf:
+        return [json.loads(line) for line in tf if line.strip()]
+
+
+# ---------- Analysis ----------
+
+def analyze(events):
+    # {key: measurements}. Bounces (a release and re-press inside
+    # CHATTER_SCAN_MS) are folded into the press they belong to.
+    scan = CHATTER_SCAN_MS / 1000
+    keys = {}
+    for e in events:
+        k = keys.get(e["name"])
+        if k is None:
+            k = keys[e["name"]] = {
+                "presses": 0, "latency": [], "holds": [], "repeat_delays": [], "repeat_gaps": [],
+                "bounces": [], "repress_gaps": [],
+                "_held": False, "_down": None, "_last_down": None, "_up": None,
+            }
+        t = e["t"]
+        if e.get("seen") is not None:
+            k["latency"].append(e["seen"] - t)
+
+        if e["type"] == "down":
+            if k["_held"]:
+                # auto-repeat: the first gap is the repeat delay, the rest the rate
+                gap = t - k["_last_down"]
+                (k["repeat_delays"] if k["_last_down"] == k["_down"] else k["repeat_gaps"]).append(gap)
+            elif k["_up"] is not None and t - k["_up"] < scan:
+                k["bounces"].append(t - k["_up"])
+            else:
+                if k["_up"] is not None:
+                    k["holds"].append(k["_up"] - k["_down"])
+                    k["repress_gaps"].append(t - k["_up"])
+                k["presses"] += 1
+                k["_down"] = t
+            k["_held"], k["_last_down"] = True, t
+        else:
+            k["_held"], k["_up"] = False, t
+
+    for k in keys.values():
+        if k["_up"] is not None and k["_down"] is not None and k["_up"] >= k["_down"]:
+            k["holds"].append(k["_up"] - k["_down"])
+        for name in ("_held", "_down", "_last_down", "_up"):
+            del k[name]
+    return keys
+
+
+def recommend(keys):
+    # (config, warnings) covering the worst key on this keypad
+    bounces = [b for k in keys.values() for b in k["bounces"]]
+    repress = [g for k in keys.values() for g in k["repress_gaps"]]
+    repeat = [g for k in keys.values() for g in k["repeat_delays"] + k["repeat_gaps"]]
+    warnings = []
+
+    config = dict(DEFAULTS)
+    if bounces:
+        config["chatter_ms"] = max(MIN_CHATTER_MS, math.ceil(max(bounces) * 1000 * 1.5))
+    if repress and config["chatter_ms"] >= min(repress) * 1000:
+        warnings.append(f"fastest deliberate re-press ({min(repress) * 1000:.0f} ms) is inside the "
+                        f"chatter window ({config['chatter_ms']} ms): replace this keypad")
+    if repeat:
+        config["repeat_window_ms"] = math.ceil(max(repeat) * 1000 * 1.5)
+    else:
+        warnings.append("no auto-repeat recorded (hold a key down while recording); "
+                        f"keeping the default repeat window of {DEFAULTS['repeat_window_ms']} ms")
+    return config, warnings
+
+
+def report(events):
+    keys = analyze(events)
+
+    def ms(values, f=median):
+        return f"{f(values) * 1000:7.1f}" if values else "      -"
+
+    print(f"{'key':>10} {'presses':>7} {'lat p50':>7} {'lat max':>7} {'hold p50':>8} {'hold max':>8} "
+          f"{'rep dly':>7} {'rep Hz':>6} {'bounces':>7} {'bnc max':>7}")
+    for name, k in sorted(keys.items()):
+        rate = f"{1 / median(k['repeat_gaps']):6.1f}" if k["repeat_gaps"] else "     -"
+        print(f"{name:>10} {k['presses']:>7} {ms(k['latency'])} {ms(k['latency'], max)} "
+              f"{ms(k['holds']):>8} {ms(k['holds'], max):>8} {ms(k['repeat_delays'])} {rate} "
+              f"{len(k['bounces']):>7} {ms(k['bounces'], max)}")
+    print("(times in ms)")
+
+    config, warnings = recommend(keys)
+    print(f"\nRecommended debounce: chatter {config['chatter_ms']} ms, "
+          f"repeat window {config['repeat_window_ms']} ms")
+    for w in warnings:
+        print(f"⚠ {w}")
+    return config
+
+
+def replay(events, config):
+    # [(name, t)] of the presses the voting machine would act on
+    debounce = Debouncer(config)
+    accepted = [(e["name"], e["t"]) for e in events if debounce.feed(e["name"], e["type"], e["t"])]
+    return accepted, debounce
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Keypad test and debounce qualification.")
+    sub = parser.add_subparsers(dest="command")
+    p = sub.add_parser("record", help="record raw down/up events until ESC, then report")
+    p.add_argument("--out", default=TRACE_FILE)
+    p.add_argument("--write", nargs="?", const=DEBOUNCE_FILE, help="save the recommended thresholds")
+    p = sub.add_parser("report", help="analyze a recorded trace")
+    p.add_argument("trace")
+    p.add_argument("--write", nargs="?", const=DEBOUNCE_FILE, help="save the recommended thresholds")
+    p = sub.add_parser("replay", help="run a trace through the debouncer")
+    p.add_argument("trace")
+    p.add_argument("--config", default=DEBOUNCE_FILE)
+    args = parser.parse_args()
+
+    if args.command is None:
+        echo()
+    elif args.command == "replay":
+        accepted, debounce = replay(load_trace(args.trace), load_config(args.config))
+        print(" ".join(name for name, _ in accepted))
+        print(debounce.summary())
+    else:
+        events = record(args.out) if args.command == "record" else load_trace(args.trace)
+        if not events:
+            sys.exit("No key events recorded")
+        config = report(events)
+        if args.write:
+            save_config(config, args.write, trace=args.out if args.command == "record" else args.trace,
+                        recorded=time.strftime("%Y-%m-%d %H:%M"))
+            print(f"Saved to {args.write}")
@@ -0,0 +1,160 @@
+# merge_booths.py
+#
+# Combine the vote files of several booths into one tally:
+#
+#   python merge_booths.py booth1/ booth2/ ... [--output combined.csv] [--duplicates skip|keep]
+#
+# Each directory holds one machine's votes.csv and backup_votes.csv. The
+# two copies are streamed side by side and reconciled row by row, then
+# tallied, one process per booth. A directory given twice is only counted
+# once. A file whose contents (by SHA-256) match one from another directory
+# stops the merge: that is either the same USB stick copied twice (or a
+# main file and its backup in separate folders), which must not
+# double-count, or two real booths whose files happen to be identical
+# (say, one identical ballot each), which must both count. Check which,
+# then rerun with --duplicates skip or --duplicates keep. Ballots carry no
+# ordering key, so booths are merged (and written with --output) in the
+# order given.
+
+import os
+import csv
+import hashlib
+import argparse
+from itertools import zip_longest
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+from result import tally_rows, merge_tally, print_results
+from storage import MAIN_CSV, BACKUP_CSV
+
+
+class _HashedLines:
+    # Iterates a file's raw lines, hashing them on the way through
+    def __init__(self, path):
+        self.path = path
+        self.sha = hashlib.sha256()
+        self.lines = 0
+
+    def __iter__(self):
+        if os.path.exists(self.path):
+            with open(self.path, "rb") as f:
+                for line in f:
+                    self.sha.update(line)
+                    self.lines += 1
+                    yield line
+
+
+def reconciled_lines(directory, report):
+    # Yield the booth's rows, taking each one from whichever copy has it.
+    # _finalize_votes writes main first, so a crash can leave main one row
+    # ahead; rows present in only one file are kept. Where both have a row
+    # and they differ, main wins and the conflict is reported.
+    main = _HashedLines(os.path.join(directory, MAIN_CSV))
+    backup = _HashedLines(os.path.join(directory, BACKUP_CSV))
+    for row_no, (m, b) in enumerate(zip_longest(main, backup)):
+        if b is None or m == b:
+            line = m
+        elif m is None:
+            line = b
+            report["backup_only"] += 1
+        elif m.rstrip(b"\r\n") == b.rstrip(b"\r\n"):
+            line = max(m, b, key=len)  # one copy has a torn line ending
+        else:
+            line = m
+            report["conflicts"] += 1
+            if report["first_conflict"] is None:
+                report["first_conflict"] = row_no
+        if b is None and row_no:
+            report["main_only"] += 1
+        if not line.endswith(b"\n"):
+            line += b"\r\n"
+        yield line
+
+    # content hashes of non-empty files, for cross-booth de-duplication
+    report["hashes"] = [f.sha.hexdigest() for f in (main, backup) if f.lines > 1]
+
+
+def _tally_booth(directory):
+    report = {"booth": directory, "backup_only": 0, "main_only": 0,
+              "conflicts": 0, "first_conflict": None}
+    reader = csv.reader(line.decode("utf-8") for line in reconciled_lines(directory, report))
+    positions = next(reader, [])
+    order, counts, rows = tally_rows(reader, len(positions))
+    report.update(positions=positions, order=order, counts=counts, rows=rows)
+    return report
+
+
+def _describe(report):
+    notes = []
+    if report["main_only"]:
+        notes.append(f"{report['main_only']} row(s) missing from backup")
+    if report["backup_only"]:
+        notes.append(f"{report['backup_only']} row(s) missing from main")
+    if report["conflicts"]:
+        notes.append(f"⚠ {report['conflicts']} row(s) differ from backup, "
+                     f"first at row {report['first_conflict']} (main kept)")
+    return f"{report['booth']}: {report['rows']:,} ballots" + (f" ({'; '.join(notes)})" if notes else "")
+
+
+def merge_booths(directories, workers=None, output=None, duplicates=None):
+    # duplicates: what to do with a booth whose file matches another
+    # directory's, "skip" or "keep"; None stops with an error
+    vote_counts = defaultdict(Counter)
+    positions = None
+    kept = []
+    seen = {}  # content hash -> booth it was first imported from
+
+    unique = {}
+    for directory in directories:
+        same = unique.setdefault(os.path.realpath(directory), directory)
+        if same is not directory:
+            print(f"⏭ {directory}: same directory as {same}, skipped")
+    directories = list(unique.values())
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for report in pool.map(_tally_booth, directories):
+            duplicate_of = next((seen[h] for h in report["hashes"] if h in seen), None)
+            if duplicate_of and duplicates is None:
+                raise SystemExit(f"{report['booth']}: votes identical to {duplicate_of}. If it is the same "
+                                 f"booth copied twice rerun with --duplicates skip; if they are two booths "
+                                 f"that happen to match, --duplicates keep")
+            if duplicate_of and duplicates == "skip":
+                print(f"⏭ {report['booth']}: same votes as {duplicate_of}, skipped")
+                continue
+            if duplicate_of:
+                print(f"⚠ {report['booth']}: same votes as {duplicate_of}, kept as a separate booth")
+            if positions is None:
+                positions = report["positions"]
+            elif report["positions"] != positions:
+                raise SystemExit(f"{report['booth']}: positions header differs from {kept[0]}")
+            for h in report["hashes"]:
+                seen[h] = report["booth"]
+            kept.append(report["booth"])
+            print(_describe(report))
+            merge_tally(vote_counts, positions, report["order"], report["counts"])
+
+    if output and kept:
+        with open(output, "wb") as out:
+            for i, directory in enumerate(kept):
+                lines = reconciled_lines(directory, defaultdict(int))
+                header = next(lines, b"")
+                if i == 0:
+                    out.write(header)
+                out.writelines(lines)
+        print(f"Combined votes written to {output}")
+    return vote_counts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Merge several booths' votes into one tally.")
+    parser.add_argument("booths", nargs="+", help="booth directories containing votes.csv / backup_votes.csv")
+    parser.add_argument("--output", help="also write the combined, de-duplicated votes CSV here")
+    parser.add_argument("--workers", type=int, help="processes to use (default: one per core)")
+    parser.add_argument("--duplicates", choices=("skip", "keep"),
+                        help="booths whose votes match another directory's: skip them (same USB stick "
+                             "copied twice) or keep them (separate booths); without it the merge stops")
+    args = parser.parse_args()
+
+    vote_counts = merge_booths(args.booths, args.workers, args.output, args.duplicates)
+    print()
+    print_results(vote_counts)
@@ -0,0 +1,167 @@
+# metrics.py
+
+import os
+import json
+import time
+import cProfile
+import functools
+
+_now_ns = time.perf_counter_ns
+
+
+class Histogram:
+    # Log-linear latency histogram in ns: each power of two is split into 4
+    # buckets, indexed by the bit length and the next two bits, so record()
+    # is a few integer ops. Percentiles are the bucket's upper bound (<25% high).
+
+    __slots__ = ("buckets", "count", "total", "max")
+
+    def __init__(self):
+        self.buckets = [0] * (48 * 4)
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def record(self, ns):
+        b = ns.bit_length()
+        if b >= 3:
+            self.buckets[(min(b, 47) << 2) | ((ns >> (b - 3)) & 3)] += 1
+        else:
+            self.buckets[b << 2] += 1
+        self.count += 1
+        self.total += ns
+        if ns > self.max:
+            self.max = ns
+
+    def percentile(self, p):
+        if not self.count:
+            return 0
+        rank = p * self.count
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if seen >= rank:
+                b, sub = i >> 2, i & 3
+                upper = (5 + sub) << (b - 3) if b >= 3 else 1 << b
+                return min(upper, self.max)
+        return self.max
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "mean_us": self.total / self.count / 1000 if self.count else 0.0,
+            "p50_us": self.percentile(0.50) / 1000,
+            "p99_us": self.percentile(0.99) / 1000,
+            "max_us": self.max / 1000,
+        }
+
+
+class Metrics:
+    def __init__(self):
+        self.histograms = {}
+        self._profiler = None
+        self._profile_left = 0
+
+    def histogram(self, name):
+        # for latencies that aren't one function call (see display.py)
+        return self.histograms.setdefault(name, Histogram())
+
+    def timed(self, name):
+        # Decorator: time every call into histogram <name>
+        hist = self.histogram(name)
+
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                t0 = _now_ns()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    hist.record(_now_ns() - t0)
+            return wrapper
+        return decorator
+
+    def snapshot(self):
+        return {name: hist.summary() for name, hist in self.histograms.items()}
+
+    # ---------- export ----------
+
+    def write_jsonl(self, path, gauges=None):
+        record = {"ts": time.time(), "timings": self.snapshot(), "gauges": gauges or {}}
+        with open(path, "a") as mf:
+            mf.write(json.dumps(record) + "\n")
+
+    def write_prometheus(self, path, gauges=None):
+        # textfile-collector style: whole file replaced atomically each time
+        lines = []
+        for name, hist in self.histograms.items():
+            metric = f"voting_{name.strip('_')}_seconds"
+            lines.append(f"# TYPE {metric} summary")
+            for q in (0.5, 0.99):
+                lines.append(f'{metric}{{quantile="{q}"}} {hist.percentile(q) / 1e9:.9f}')
+            lines.append(f"{metric}_sum {hist.total / 1e9:.9f}")
+            lines.append(f"{metric}_count {hist.count}")
+        for name, value in (gauges or {}).items():
+            lines.append(f"# TYPE voting_{name} gauge")
+            lines.append(f"voting_{name} {value}")
+        tmp = path + ".tmp"
+        with open(tmp, "w") as mf:
+            mf.write("\n".join(lines) + "\n")
+        os.replace(tmp, path)
+
+    def panel_text(self, names):
+        # one short line per hot path for the Staff Control Panel
+        rows = []
+        for name in names:
+            s = self.histograms[name].summary()
+            if s["count"]:
+                rows.append(f"{name}: p50 {s['p50_us']:.0f} µs, p99 {s['p99_us']:.0f} µs ({s['count']})")
+        return "\n".join(rows)
+
+    # ---------- profiling ----------
+
+    def profile_ballots(self, n, path_prefix="profile"):
+        # cProfile the next n ballots; stats are dumped when the window closes
+        self._profiler = cProfile.Profile()
+        self._profile_left = n
+        self._profile_prefix = path_prefix
+        self._profiler.enable()
+
+    def ballot_done(self):
+        if self._profiler is None:
+            return
+        self._profile_left -= 1
+        if self._profile_left <= 0:
+            self.stop_profile()
+
+    def stop_profile(self):
+        if self._profiler is None:
+            return None
+        self._profiler.disable()
+        path = f"{self._profile_prefix}_{time.strftime('%Y%m%d_%H%M%S')}.prof"
+        self._profiler.dump_stats(path)
+        self._profiler = None
+        print(f"cProfile stats written to {path}")
+        return path
+
+
+class PhaseTimer:
+    # Wall-clock breakdown of a sequence of steps (e.g. startup)
+    def __init__(self, start=None):
+        self.phases = []  # (name, seconds)
+        self._last = start if start is not None else time.perf_counter()
+
+    def mark(self, name):
+        # close the phase that ran since the previous mark
+        now = time.perf_counter()
+        self.phases.append((name, now - self._last))
+        self._last = now
+
+    def add(self, name, seconds):
+        self.phases.append((name, seconds))
+
+    def summary(self):
+        return ", ".join(f"{name} {secs * 1000:.0f} ms" for name, secs in self.phases)
+
+
+METRICS = Metrics()
@@ -1,29 +1,383 @@
+import io
+import os
 import csv
+import sys
+import json
+import time
+import hashlib
+import argparse
 from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
 
-# Load votes
-filename = "votes.csv"
-vote_counts = defaultdict(Counter)
+from datetime import datetime
 
-with open(filename, newline='', encoding='utf-8') as f:
-    reader = csv.DictReader(f)
+from ballot import BALLOT_FILE, BallotError, load_ballot
+
+# Target size of one chunk for the parallel engine; bounds per-worker memory
+CHUNK_BYTES = 16 * 1024 * 1024
+
+# Incremental tally state, saved next to the votes file
+CHECKPOINT_SUFFIX = ".tally.json"
+CHECKPOINT_VERSION = 2
+TAIL_BYTES = 4096  # bytes before the checkpoint offset that must be unchanged
+
+
+def tally_csv(filename):
+    vote_counts = defaultdict(Counter)
+    with open(filename, newline='', encoding='utf-8') as f:
+        reader = csv.DictReader(f)
+        for row in reader:
+            for position, candidate in row.items():
+                if candidate:
+                    vote_counts[position][candidate] += 1
+    return vote_counts
+
+
+def tally_csv_compiled(filename, ballot):
+    # Same result as tally_csv, but counts into integer lists through the
+    # compiled ballot's candidate indices. Returns None if the file's header
+    # is not this ballot's positions.
+    with open(filename, newline='', encoding='utf-8') as f:
+        reader = csv.reader(f)
+        if next(reader, None) != ballot.positions:
+            return None
+        order, counters, _ = tally_rows_compiled(reader, ballot)
+    vote_counts = defaultdict(Counter)
+    merge_tally(vote_counts, ballot.positions, order, counters)
+    return vote_counts
+
+
+def tally_rows_compiled(reader, ballot):
+    # tally_rows() for rows laid out as ballot.positions, counted through the
+    # compiled candidate indices. Same (order, counters, rows) result.
+    n = len(ballot.positions)
+    index = ballot.candidate_index
+    counts = [[0] * len(names) for names in ballot.candidates]
+    others = [Counter() for _ in range(n)]  # names not on the ballot
+    first_seen = [[] for _ in range(n)]     # candidates in order of first vote
+    position_order = []
+    rows = 0
+    for row in reader:
+        rows += 1
+        for pos, cand in enumerate(row[:n]):
+            if not cand:
+                continue
+            k = index[pos].get(cand)
+            if k is not None:
+                if not counts[pos][k]:
+                    if not first_seen[pos]:
+                        position_order.append(pos)
+                    first_seen[pos].append(cand)
+                counts[pos][k] += 1
+            else:
+                if cand not in others[pos]:
+                    if not first_seen[pos]:
+                        position_order.append(pos)
+                    first_seen[pos].append(cand)
+                others[pos][cand] += 1
+
+    counters = [Counter() for _ in range(n)]
+    for pos in position_order:
+        counters[pos] = Counter({
+            cand: counts[pos][index[pos][cand]] if cand in index[pos] else others[pos][cand]
+            for cand in first_seen[pos]
+        })
+    return position_order, counters, rows
+
+
+# ---------- Parallel chunked engine ----------
+# The file is split into byte ranges that start right after a newline, so
+# this assumes no quoted field contains a line break (true for votes.csv).
+
+def _chunk_ranges(filename, n_chunks):
+    with open(filename, "rb") as f:
+        header = f.readline()
+        size = os.fstat(f.fileno()).st_size
+        step = max(1, (size - f.tell()) // n_chunks)
+        bounds = [f.tell()]
+        while bounds[-1] < size:
+            f.seek(bounds[-1] + step)
+            f.readline()  # move to the start of the next line
+            bounds.append(min(f.tell(), size))
+    return header, list(zip(bounds, bounds[1:]))
+
+
+def tally_rows(reader, n_cols):
+    # Count csv.reader rows into one Counter per column.
+    # Returns (columns in order of their first vote, like DictReader; counters; rows)
+    counts = [Counter() for _ in range(n_cols)]
+    order = []
+    rows = 0
+    for row in reader:
+        rows += 1
+        for i, cand in enumerate(row[:n_cols]):
+            if cand:
+                if not counts[i]:
+                    order.append(i)
+                counts[i][cand] += 1
+        if len(order) == n_cols:
+            break
+    # every column seen: plain loop, fixed column indices, no dict per row
     for row in reader:
-        for position, candidate in row.items():
-            if candidate:
-                vote_counts[position][candidate] += 1
-
-# Display results
-print("📊 Election Results:\n")
-for position in vote_counts:
-    print(f"\n🪧 {position}")
-    total = sum(vote_counts[position].values())
-    for candidate, count in vote_counts[position].most_common():
-        print(f"  {candidate}: {count} votes")
-
-    # Find winner(s)
-    max_votes = max(vote_counts[position].values())
-    winners = [c for c, v in vote_counts[position].items() if v == max_votes]
-    if len(winners) == 1:
-        print(f"✅ Winner: {winners[0]}")
+        rows += 1
+        for c, cand in zip(counts, row):
+            if cand:
+                c[cand] += 1
+    return order, counts, rows
+
+
+def merge_tally(vote_counts, positions, order, counts):
+    # Fold one tally_rows() result into vote_counts; merging partial tallies
+    # in file order keeps candidates in first-appearance order.
+    for i in order:
+        vote_counts[positions[i]].update(counts[i])
+
+
+def _tally_range(job):
+    filename, start, end, n_cols = job
+    with open(filename, "rb") as f:
+        f.seek(start)
+        data = f.read(end - start).decode("utf-8")
+    return tally_rows(csv.reader(io.StringIO(data, newline="")), n_cols)
+
+
+def tally_csv_parallel(filename, workers=None):
+    workers = workers or os.cpu_count() or 1
+    size = os.path.getsize(filename)
+    header, ranges = _chunk_ranges(filename, max(workers, size // CHUNK_BYTES))
+    positions = next(csv.reader([header.decode("utf-8")]), [])
+    jobs = [(filename, start, end, len(positions)) for start, end in ranges]
+
+    vote_counts = defaultdict(Counter)
+    total_rows = 0
+
+    def merge(results):
+        nonlocal total_rows
+        for order, counts, rows in results:
+            total_rows += rows
+            merge_tally(vote_counts, positions, order, counts)
+
+    if workers == 1:
+        merge(map(_tally_range, jobs))
     else:
-        print(f"🤝 Tie between: {', '.join(winners)}")
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            merge(pool.map(_tally_range, jobs))
+    return vote_counts, total_rows
+
+
+# ---------- Incremental engine ----------
+# A checkpoint holds the byte offset reached, the file's identity (device
+# and inode), the header's hash, the hash of the bytes just before the
+# offset and the counters. If any of those no longer match, or the file is
+# shorter than the offset, the file was replaced, rewritten or truncated and
+# is rescanned from the start. An edit in place further back than TAIL_BYTES
+# is not noticed here; ballot_chain.py verify is the check for that. Only
+# complete lines are counted, so a row being appended right now is picked up
+# next run. New rows go through the compiled ballot when the header matches it.
+
+def _sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def _tail_hash(f, header_len, offset):
+    start = max(header_len, offset - TAIL_BYTES)
+    f.seek(start)
+    return _sha256(f.read(offset - start))
+
+
+def _read_checkpoint(path):
+    try:
+        with open(path, encoding="utf-8") as cf:
+            state = json.load(cf)
+    except (OSError, ValueError):
+        return None
+    return state if state.get("version") == CHECKPOINT_VERSION else None
+
+
+def _write_checkpoint(path, state):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as cf:
+        json.dump(state, cf)
+    os.replace(tmp, path)
+
+
+def tally_csv_incremental(filename, checkpoint=None, ballot=None):
+    # Returns (vote_counts, total rows, new rows, how) where how is "full"
+    # (no usable checkpoint), "incremental" or "rescan" (file was rewritten).
+    checkpoint = checkpoint or filename + CHECKPOINT_SUFFIX
+    state = _read_checkpoint(checkpoint)
+    vote_counts = defaultdict(Counter)
+    total = new = 0
+    how = "full" if state is None else "rescan"
+
+    with open(filename, "rb") as f:
+        header = f.readline()
+        if not header.endswith(b"\n"):
+            return vote_counts, 0, 0, how  # nothing complete yet
+        st = os.fstat(f.fileno())
+        size = st.st_size
+        positions = next(csv.reader([header.decode("utf-8")]), [])
+        if ballot is not None and positions == ballot.positions:
+            count = lambda reader: tally_rows_compiled(reader, ballot)
+        else:
+            count = lambda reader: tally_rows(reader, len(positions))
+        offset = len(header)
+        if (state is not None and state["header_sha256"] == _sha256(header)
+                and state["dev"] == st.st_dev and state["ino"] == st.st_ino
+                and len(header) <= state["offset"] <= size
+                and _tail_hash(f, len(header), state["offset"]) == state["tail_sha256"]):
+            offset = state["offset"]
+            total = state["rows"]
+            for position, counts in state["tallies"].items():
+                vote_counts[position] = Counter(counts)
+            how = "incremental"
+
+        # new rows in blocks cut at the last newline, merged in file order
+        f.seek(offset)
+        while True:
+            block = f.read(CHUNK_BYTES)
+            cut = block.rfind(b"\n") + 1
+            if not cut:
+                break
+            if cut < len(block):
+                f.seek(offset + cut)
+            order, counts, rows = count(csv.reader(io.StringIO(block[:cut].decode("utf-8"), newline="")))
+            merge_tally(vote_counts, positions, order, counts)
+            offset += cut
+            new += rows
+        total += new
+
+        _write_checkpoint(checkpoint, {
+            "version": CHECKPOINT_VERSION,
+            "offset": offset,
+            "dev": st.st_dev,
+            "ino": st.st_ino,
+            "header_sha256": _sha256(header),
+            "tail_sha256": _tail_hash(f, len(header), offset),
+            "rows": total,
+            "tallies": {position: dict(counts) for position, counts in vote_counts.items()},
+        })
+    return vote_counts, total, new, how
+
+
+def follow(filename, interval, checkpoint=None, ballot=None):
+    # Re-tally what _finalize_votes has appended every interval seconds and
+    # print the standings whenever they change (Ctrl+C to stop)
+    shown = None
+    while True:
+        try:
+            vote_counts, total, new, how = tally_csv_incremental(filename, checkpoint, ballot)
+        except FileNotFoundError:
+            vote_counts, total, new, how = None, 0, 0, "waiting"
+        if shown is None or new or how == "rescan":
+            stamp = time.strftime("%H:%M:%S")
+            note = " (file rewritten, rescanned)" if how == "rescan" else ""
+            print(f"\n===== {stamp} · {total:,} ballots{note} =====")
+            if vote_counts:
+                print_results(vote_counts)
+            shown = total
+        time.sleep(interval)
+
+
+def parse_time(text):
+    # "14:30" (today) or an ISO date/time -> epoch seconds
+    try:
+        t = datetime.strptime(text, "%H:%M").time()
+        return datetime.combine(datetime.now().date(), t).timestamp()
+    except ValueError:
+        return datetime.fromisoformat(text).timestamp()
+
+
+def print_db_results(db, session=None, since=None, until=None, group_by=None):
+    from storage import tally_db, turnout_db
+
+    results = tally_db(db, session, since, until, group_by)
+    if group_by is None:
+        print_results(results.get("", defaultdict(Counter)))
+        return
+    print(f"🧾 Ballots by {group_by}:")
+    for grp, ballots, first, last in turnout_db(db, session, since, until, group_by):
+        span = f"{datetime.fromtimestamp(first):%H:%M}–{datetime.fromtimestamp(last):%H:%M}"
+        print(f"  {grp}: {ballots} ({span})")
+    for grp, vote_counts in results.items():
+        print(f"\n===== {grp} =====")
+        print_results(vote_counts)
+
+
+def print_results(vote_counts):
+    print("📊 Election Results:\n")
+    for position in vote_counts:
+        print(f"\n🪧 {position}")
+        total = sum(vote_counts[position].values())
+        for candidate, count in vote_counts[position].most_common():
+            print(f"  {candidate}: {count} votes")
+
+        # Find winner(s)
+        max_votes = max(vote_counts[position].values())
+        winners = [c for c, v in vote_counts[position].items() if v == max_votes]
+        if len(winners) == 1:
+            print(f"✅ Winner: {winners[0]}")
+        else:
+            print(f"🤝 Tie between: {', '.join(winners)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Print election results.")
+    parser.add_argument("filename", nargs="?", help="votes file (default: votes.csv, or votes.bin with --binary)")
+    parser.add_argument("--binary", action="store_true",
+                        help="tally a binary ballot store written by ballot_store.py")
+    parser.add_argument("--workers", type=int, metavar="N",
+                        help="tally the CSV in parallel chunks with N processes (0 = all cores)")
+    parser.add_argument("--ballot", default=BALLOT_FILE,
+                        help="ballot definition for the compiled tally (default: ballot.json)")
+    parser.add_argument("--no-checkpoint", action="store_true",
+                        help=f"full scan, without reading or writing <file>{CHECKPOINT_SUFFIX}")
+    parser.add_argument("--checkpoint", metavar="PATH", help=f"checkpoint file (default: <file>{CHECKPOINT_SUFFIX})")
+    parser.add_argument("--follow", action="store_true", help="keep tailing the file and print updated standings")
+    parser.add_argument("--interval", type=float, default=5.0, help="seconds between updates with --follow")
+    parser.add_argument("--db", metavar="PATH", help="tally a SQLite ballot database (STORAGE_BACKEND = \"sqlite\")")
+    parser.add_argument("--session", help="--db: only this session")
+    parser.add_argument("--since", type=parse_time, help="--db: from this time (HH:MM or ISO)")
+    parser.add_argument("--until", type=parse_time, help="--db: before this time (HH:MM or ISO)")
+    parser.add_argument("--by", choices=("session", "hour", "day"), help="--db: separate results per group")
+    args = parser.parse_args()
+
+    # compiled ballot when the CSV matches it, plain counters otherwise
+    try:
+        ballot = load_ballot(args.ballot)
+    except BallotError:
+        ballot = None
+
+    if args.db:
+        print_db_results(args.db, args.session, args.since, args.until, args.by)
+        sys.exit(0)
+    elif args.binary:
+        from ballot_store import tally_binary
+        vote_counts = tally_binary(args.filename or "votes.bin")
+    elif args.workers is not None:
+        t0 = time.perf_counter()
+        vote_counts, rows = tally_csv_parallel(args.filename or "votes.csv", args.workers)
+        elapsed = time.perf_counter() - t0
+        workers = args.workers or os.cpu_count()
+        print(f"⏱ {rows:,} rows in {elapsed:.2f} s ({rows / elapsed:,.0f} rows/s, {workers} workers)",
+              file=sys.stderr)
+    elif args.follow:
+        try:
+            follow(args.filename or "votes.csv", args.interval, args.checkpoint, ballot)
+        except KeyboardInterrupt:
+            pass
+        sys.exit(0)
+    elif not args.no_checkpoint:
+        t0 = time.perf_counter()
+        vote_counts, rows, new, how = tally_csv_incremental(args.filename or "votes.csv", args.checkpoint, ballot)
+        print(f"⏱ {rows:,} rows ({new:,} parsed, {how}) in {time.perf_counter() - t0:.2f} s",
+              file=sys.stderr)
+    else:
+        vote_counts = None
+        if ballot is not None:
+            vote_counts = tally_csv_compiled(args.filename or "votes.csv", ballot)
+        if vote_counts is None:
+            vote_counts = tally_csv(args.filename or "votes.csv")
+
+    # Display results
+    print_results(vote_counts)
@@ -0,0 +1,120 @@
+# soak.py
+#
+# All-day run in minutes: drives VotingMachine headlessly (see headless.py)
+# through many ballots, opening and closing the Keyboard Test window along
+# the way, and samples what tends to pile up over a day:
+#
+#   RSS, live threads, pending after() callbacks, Tk widgets, PhotoImages,
+#   and Python heap (tracemalloc, with the top growing allocation sites)
+#
+#   python soak.py [--ballots 20000] [--sample-every 1000] [--test-every 500] [--no-tracemalloc]
+#
+# Fails (exit 1) if any of them is still growing over the last third of the
+# run compared with the middle third.
+
+import gc
+import sys
+import time
+import argparse
+import threading
+import tracemalloc
+
+from benchmark import _rss_bytes
+from headless import Headless, _FakePhotoImage
+
+WARM_UP_BALLOTS = 500
+TOP_ALLOCATORS = 10
+
+# sample key -> allowed rise of the last third's max over the middle third's max
+LIMITS = {
+    "threads": lambda peak: 0,
+    "pending_after": lambda peak: 2,
+    "widgets": lambda peak: 0,
+    "photo_images": lambda peak: 0,
+    "rss_mib": lambda peak: 4 + peak * 0.05,
+    "traced_mib": lambda peak: 1 + peak * 0.05,
+}
+
+
+def sample(sim, ballots, traced):
+    gc.collect()  # closed windows sit in reference cycles until a collection
+    rss = _rss_bytes()
+    return {
+        "ballots": ballots,
+        "rss_mib": rss / 2**20 if rss is not None else 0.0,
+        "threads": threading.active_count(),
+        "pending_after": sim.clock.pending(),
+        "widgets": sim.widget_count(),
+        "photo_images": _FakePhotoImage.live,
+        "traced_mib": tracemalloc.get_traced_memory()[0] / 2**20 if traced else 0.0,
+    }
+
+
+def unbounded(samples):
+    # [(key, middle third max, last third max)] for everything still rising
+    n = len(samples)
+    if n < 6:
+        return []
+    middle, last = samples[n // 3:2 * n // 3], samples[2 * n // 3:]
+    growing = []
+    for key, slack in LIMITS.items():
+        a = max(s[key] for s in middle)
+        b = max(s[key] for s in last)
+        if b > a + slack(a):
+            growing.append((key, a, b))
+    return growing
+
+
+def soak(ballots, sample_every, test_every, traced=True, seed=0):
+    columns = ("ballots", "rss_mib", "threads", "pending_after", "widgets", "photo_images", "traced_mib")
+    print("".join(f"{c:>14}" for c in columns))
+
+    if traced:
+        tracemalloc.start()
+    samples = []
+    with Headless(seed=seed) as sim:
+        sim.run_voters(WARM_UP_BALLOTS)  # caches, histograms and files reach steady state
+        first_snapshot = tracemalloc.take_snapshot() if traced else None
+        t0 = time.perf_counter()
+        for done in range(1, ballots + 1):
+            sim.run_voter()
+            if test_every and done % test_every == 0:
+                sim.test_keyboard()
+            if done % sample_every == 0:
+                sim.key_latencies.clear()  # the harness's own list, not the machine's
+                s = sample(sim, done, traced)
+                samples.append(s)
+                print("".join(f"{s[c]:>14.1f}" if isinstance(s[c], float) else f"{s[c]:>14}"
+                              for c in columns))
+        elapsed = time.perf_counter() - t0
+        last_snapshot = tracemalloc.take_snapshot() if traced else None
+
+    print(f"\n{ballots:,} ballots in {elapsed:.0f} s ({ballots / elapsed:,.0f}/s)")
+    if traced:
+        print(f"\nTop allocation growth since warm-up:")
+        stats = [s for s in last_snapshot.compare_to(first_snapshot, "lineno") if s.size_diff > 0]
+        for stat in stats[:TOP_ALLOCATORS]:
+            frame = stat.traceback[0]
+            print(f"  {stat.size_diff / 1024:>9.1f} KiB  {stat.count_diff:>+7}  {frame.filename}:{frame.lineno}")
+        tracemalloc.stop()
+
+    growing = unbounded(samples)
+    for key, a, b in growing:
+        print(f"❌ {key} still growing: {a:.1f} -> {b:.1f}")
+    if not growing:
+        print("✅ Nothing grew without bound" if len(samples) >= 6 else
+              "⚠ Too few samples to judge growth (raise --ballots or lower --sample-every)")
+    return not growing
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Long-running headless soak test.")
+    parser.add_argument("--ballots", type=int, default=20000)
+    parser.add_argument("--sample-every", type=int, default=1000)
+    parser.add_argument("--test-every", type=int, default=500, help="Keyboard Test window cycle (0 = never)")
+    parser.add_argument("--no-tracemalloc", action="store_true", help="faster, without heap tracking")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    ok = soak(args.ballots, args.sample_every, args.test_every, not args.no_tracemalloc, args.seed)
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,332 @@
+# storage.py
+#
+# Where finalized ballots and session counts go. Two interchangeable backends:
+#
+#   CsvStorage     votes.csv + backup_votes.csv + session_data.csv (the original layout)
+#   SqliteStorage  one SQLite database in WAL mode, ballots tagged with their
+#                  session and time, indexed on both
+#
+# Both take each ballot as the exact CSV line bytes plus its row, and call
+# its done() once the ballot is durable (CsvStorage with a writer: from the
+# writer thread after the fsync; SqliteStorage: after the transaction's COMMIT
+# has been synced).
+# That is where the hash chain and the journal catch up. So
+#
+#   python storage.py export votes.db [votes.csv]
+#
+# rebuilds a votes.csv byte for byte identical to what CsvStorage would have
+# written (and what the hash chain in ballot_chain.py was built over).
+# result.py --db tallies the database with GROUP BY queries.
+
+import io
+import os
+import csv
+import argparse
+from collections import Counter, defaultdict
+
+# Vote files of the CSV backend (also what merge_booths.py and
+# ballot_chain.py look for)
+MAIN_CSV = "votes.csv"
+BACKUP_CSV = "backup_votes.csv"
+
+
+def header_line(positions):
+    buf = io.StringIO()
+    csv.writer(buf).writerow(positions)
+    return buf.getvalue().encode("utf-8")
+
+
+class CsvStorage:
+    # writer_latency_ms: append the vote CSVs through a DurableWriter thread
+    # (group commit, fsync) with this latency budget; None writes them inline
+    def __init__(self, main_csv, backup_csv, session_csv, positions, writer_latency_ms=None):
+        self.main_csv = main_csv
+        self.backup_csv = backup_csv
+        self.session_csv = session_csv
+        for f in (main_csv, backup_csv):
+            if not os.path.exists(f):
+                with open(f, "wb") as cf:
+                    cf.write(header_line(positions))
+        with open(main_csv, "rb") as cf:
+            self.header = cf.readline()
+        self.writer = None
+        if writer_latency_ms is not None:
+            from durable_writer import DurableWriter
+            self.writer = DurableWriter((main_csv, backup_csv), max_latency_ms=writer_latency_ms)
+
+    def add_ballot(self, line, row, session, ts, done=None):
+        if self.writer is not None:
+            self.writer.submit(line, done)
+            return
+        for f in (self.main_csv, self.backup_csv):
+            with open(f, "ab") as cf:
+                cf.write(line)
+        if done is not None:
+            done()
+
+    def lines_after(self, rows, offset):
+        # complete rows of votes.csv past byte offset (the end of the hash
+        # chain), in file order; rows is the chain's row count
+        size = os.path.getsize(self.main_csv)
+        if size < offset:
+            print(f"⚠ {self.main_csv} is shorter than its hash chain: truncated or edited "
+                  f"(run ballot_chain.py verify)")
+            return []
+        with open(self.main_csv, "rb") as cf:
+            cf.seek(offset)
+            lines = cf.readlines()
+        if lines and not lines[-1].endswith(b"\n"):
+            lines.pop()  # torn row from a crash, not a ballot
+        return lines
+
+    def sync_backup(self, offset):
+        # At startup, once the hash chain covers votes.csv up to offset. The
+        # writer fsyncs votes.csv before backup_votes.csv, so a power cut in
+        # between leaves the backup short of rows (maybe a torn one) that
+        # main has; those are copied over. Returns the bytes restored.
+        backup_size = os.path.getsize(self.backup_csv)
+        if backup_size >= offset:
+            return 0
+        with open(self.main_csv, "rb") as cf:
+            chained = cf.read(offset)
+        with open(self.backup_csv, "rb") as cf:
+            if cf.read() != chained[:backup_size]:
+                print(f"⚠ {self.backup_csv} differs from {self.main_csv}: not repaired "
+                      f"(run ballot_chain.py verify)")
+                return 0
+        with open(self.backup_csv, "ab") as cf:
+            cf.write(chained[backup_size:])
+            cf.flush()
+            os.fsync(cf.fileno())
+        print(f"Backup: restored {offset - backup_size} byte(s) of {self.backup_csv} lost at the last shutdown")
+        return offset - backup_size
+
+    def load_sessions(self):
+        # every (name, count) record in order; the last one per session wins
+        if not os.path.exists(self.session_csv):
+            return []
+        with open(self.session_csv, newline="") as sf:
+            return [(name, int(count)) for name, count in (r for r in csv.reader(sf) if len(r) == 2)]
+
+    def save_sessions(self, items):
+        # full rewrite: one row per session
+        with open(self.session_csv, "w", newline="") as sf:
+            writer = csv.writer(sf)
+            for name, count in items:
+                writer.writerow([name, count])
+
+    def append_session(self, name, count):
+        with open(self.session_csv, "a", newline="") as sf:
+            csv.writer(sf).writerow([name, count])
+
+    def commit(self):
+        pass  # ballots are in the writer's hands, sessions already in the file
+
+    def close(self, timeout=None):
+        # Waits for queued ballots, at most timeout seconds; returns how
+        # many are still not on disk
+        if self.writer is not None:
+            return self.writer.close(timeout)
+        return 0
+
+
+# ---------- SQLite ----------
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value BLOB NOT NULL);
+CREATE TABLE IF NOT EXISTS ballots (
+    id INTEGER PRIMARY KEY,
+    ts REAL NOT NULL,
+    session TEXT NOT NULL,
+    line BLOB NOT NULL              -- the CSV row exactly as exported
+);
+CREATE TABLE IF NOT EXISTS votes (
+    ballot INTEGER NOT NULL REFERENCES ballots(id),
+    position INTEGER NOT NULL,      -- column in the header
+    candidate TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sessions (
+    seq INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    count INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ballots_session ON ballots(session, id);
+CREATE INDEX IF NOT EXISTS ballots_ts ON ballots(ts);
+CREATE INDEX IF NOT EXISTS votes_ballot ON votes(ballot);
+"""
+
+# Fixed SQL text: sqlite3 keeps these compiled in its statement cache
+INSERT_BALLOT = "INSERT INTO ballots (ts, session, line) VALUES (?, ?, ?)"
+INSERT_VOTE = "INSERT INTO votes (ballot, position, candidate) VALUES (?, ?, ?)"
+UPSERT_SESSION = ("INSERT INTO sessions (name, count) VALUES (?, ?) "
+                  "ON CONFLICT(name) DO UPDATE SET count = excluded.count")
+
+
+def connect(path):
+    import sqlite3  # only the sqlite backend and the queries need it
+    db = sqlite3.connect(path, isolation_level=None)
+    db.execute("PRAGMA journal_mode=WAL")
+    # FULL: a COMMIT is fsynced to the WAL before it returns, so a power cut
+    # can't roll back a ballot whose done() (chain, journal) already ran
+    db.execute("PRAGMA synchronous=FULL")
+    return db
+
+
+class SqliteStorage:
+    # Writes go into one open transaction; commit() (or batch ballots) ends it
+    writer = None
+
+    def __init__(self, path, positions, batch=64):
+        self.path = path
+        self.batch = batch
+        self.db = connect(path)
+        self.db.executescript(SCHEMA)
+        found = self.db.execute("SELECT value FROM meta WHERE key = 'header'").fetchone()
+        if found is None:
+            self.header = header_line(positions)
+            self.db.execute("INSERT INTO meta VALUES ('header', ?)", (self.header,))
+        else:
+            self.header = bytes(found[0])
+        self.pending = 0
+        self._in_tx = False
+        self._done = []  # callbacks for ballots in the open transaction
+
+        # stats
+        self.commits = 0
+        self.committed = 0
+
+    def _begin(self):
+        if not self._in_tx:
+            self.db.execute("BEGIN")
+            self._in_tx = True
+
+    def add_ballot(self, line, row, session, ts, done=None):
+        self._begin()
+        ballot = self.db.execute(INSERT_BALLOT, (ts, session, line)).lastrowid
+        self.db.executemany(INSERT_VOTE, [(ballot, pos, cand) for pos, cand in enumerate(row) if cand])
+        self.pending += 1
+        if done is not None:
+            self._done.append(done)
+        if self.pending >= self.batch:
+            self.commit()
+
+    def lines_after(self, rows, offset):
+        # ballots after the first rows, as the lines export_csv would write
+        return [bytes(line) for (line,) in
+                self.db.execute("SELECT line FROM ballots ORDER BY id LIMIT -1 OFFSET ?", (rows,))]
+
+    def sync_backup(self, offset):
+        return 0  # one database, no second copy
+
+    def load_sessions(self):
+        return self.db.execute("SELECT name, count FROM sessions ORDER BY seq").fetchall()
+
+    def save_sessions(self, items):
+        self._begin()
+        self.db.executemany(UPSERT_SESSION, items)
+
+    def append_session(self, name, count):
+        self._begin()
+        self.db.execute(UPSERT_SESSION, (name, count))
+
+    def commit(self):
+        if self._in_tx:
+            self.db.execute("COMMIT")
+            self._in_tx = False
+            self.commits += 1
+            self.committed += self.pending
+            self.pending = 0
+            done, self._done = self._done, []
+            for callback in done:
+                callback()
+
+    def close(self, timeout=None):
+        self.commit()
+        self.db.close()
+        return 0
+
+
+# ---------- Queries ----------
+
+GROUPS = {
+    None: "''",
+    "session": "b.session",
+    "hour": "strftime('%Y-%m-%d %H:00', b.ts, 'unixepoch', 'localtime')",
+    "day": "strftime('%Y-%m-%d', b.ts, 'unixepoch', 'localtime')",
+}
+
+
+def _where(session=None, since=None, until=None):
+    clauses, params = [], []
+    if session is not None:
+        clauses.append("b.session = ?")
+        params.append(session)
+    if since is not None:
+        clauses.append("b.ts >= ?")
+        params.append(since)
+    if until is not None:
+        clauses.append("b.ts < ?")
+        params.append(until)
+    return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+
+def tally_db(path, session=None, since=None, until=None, group_by=None):
+    # {group: vote_counts} (group is '' without group_by). Rows come back in
+    # order of each candidate's first vote, so positions and candidates end
+    # up in the same order as tallying the exported CSV with result.py.
+    db = connect(path)
+    try:
+        header = bytes(db.execute("SELECT value FROM meta WHERE key = 'header'").fetchone()[0])
+        positions = next(csv.reader([header.decode("utf-8")]))
+        where, params = _where(session, since, until)
+        group = GROUPS[group_by]
+        rows = db.execute(
+            f"SELECT {group} AS grp, v.position, v.candidate, COUNT(*), MIN(v.rowid) AS first "
+            f"FROM votes v JOIN ballots b ON b.id = v.ballot{where} "
+            f"GROUP BY grp, v.position, v.candidate ORDER BY first", params)
+        results = {}
+        for grp, pos, candidate, count, _ in rows:
+            results.setdefault(grp, defaultdict(Counter))[positions[pos]][candidate] = count
+        return results
+    finally:
+        db.close()
+
+
+def turnout_db(path, session=None, since=None, until=None, group_by="session"):
+    # [(group, ballots, first ts, last ts)]
+    db = connect(path)
+    try:
+        where, params = _where(session, since, until)
+        return db.execute(
+            f"SELECT {GROUPS[group_by]} AS grp, COUNT(*), MIN(b.ts), MAX(b.ts) "
+            f"FROM ballots b{where} GROUP BY grp ORDER BY MIN(b.id)", params).fetchall()
+    finally:
+        db.close()
+
+
+def export_csv(path, csv_path):
+    # Header + every ballot line in insertion order: byte-identical to CsvStorage
+    db = connect(path)
+    try:
+        header = bytes(db.execute("SELECT value FROM meta WHERE key = 'header'").fetchone()[0])
+        rows = 0
+        with open(csv_path, "wb") as cf:
+            cf.write(header)
+            for (line,) in db.execute("SELECT line FROM ballots ORDER BY id"):
+                cf.write(line)
+                rows += 1
+        return rows
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ballot database tools.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("export", help="write the ballots as votes.csv")
+    p.add_argument("db")
+    p.add_argument("csv", nargs="?", default="votes.csv")
+    args = parser.parse_args()
+
+    n = export_csv(args.db, args.csv)
+    print(f"Exported {n:,} ballots to {args.csv}")
@@ -0,0 +1,154 @@
+# symbol_cache.py
+
+import os
+import json
+import tkinter as tk
+from collections import OrderedDict
+
+SYMBOLS_DIR = "symbols"
+SYMBOL_SIZE = (400, 400)  # display size on the student screen
+# Pre-scaled symbols from compile_symbols.py; used instead of PIL when fresh
+COMPILED_DIR = "symbols_compiled"
+MANIFEST_FILE = "manifest.json"
+
+# PIL is heavy to import, so it is loaded on first use (see import_pil)
+Image = ImageTk = None
+
+
+def import_pil():
+    global Image, ImageTk
+    if Image is None:
+        from PIL import Image
+    if ImageTk is None:
+        from PIL import ImageTk
+
+
+def load_compiled(compiled_dir=COMPILED_DIR):
+    # (candidate, size) -> compiled file, for entries whose source png is
+    # unchanged (size + mtime, so startup doesn't hash every file)
+    try:
+        with open(os.path.join(compiled_dir, MANIFEST_FILE)) as mf:
+            entries = json.load(mf).get("entries", [])
+        # entries that aren't objects are skipped like any other bad entry
+        entries = sorted((e for e in entries if isinstance(e, dict)),
+                         key=lambda e: e.get("format") != "ppm")  # ppm loads fastest
+    except (OSError, ValueError, AttributeError, TypeError):
+        return {}
+    compiled = {}
+    for e in entries:
+        try:
+            st = os.stat(e["source"])
+            path = os.path.join(compiled_dir, e["output"])
+            if (st.st_size == e["source_size"] and st.st_mtime_ns == e["source_mtime_ns"]
+                    and os.path.exists(path)):
+                compiled.setdefault((e["candidate"], tuple(e["size"])), path)
+        except (OSError, KeyError, TypeError):
+            continue
+    return compiled
+
+
+class SymbolCache:
+    # Decoded + scaled candidate symbols, keyed by (candidate, size).
+    # Entries are evicted least-recently-used once max_bytes is exceeded.
+
+    def __init__(self, max_bytes, symbols_dir=SYMBOLS_DIR, compiled_dir=COMPILED_DIR):
+        self.max_bytes = max_bytes
+        self.symbols_dir = symbols_dir
+        self.compiled = load_compiled(compiled_dir) if compiled_dir else {}
+        self._entries = OrderedDict()  # (candidate, size) -> (image, nbytes)
+        self.bytes_used = 0
+
+        # stats
+        self.hits = 0
+        self.misses = 0      # lookups that had to decode (i.e. a voter waited)
+        self.preloads = 0    # images cached ahead of time by preload() (the warm-up)
+        self.evictions = 0
+
+    def path_for(self, candidate):
+        safe_name = candidate.replace(" ", "_")
+        return os.path.join(self.symbols_dir, safe_name + ".png")
+
+    def get(self, candidate, size):
+        key = (candidate, size)
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+        self.misses += 1
+        return self._load(key)
+
+    def preload(self, decoded, size):
+        # Tk thread: cache what decode() produced ahead of time (off the Tk
+        # thread), {candidate: image}, so no keypress pays for a decode
+        for candidate, img in decoded.items():
+            self.add_decoded(candidate, size, img)
+        self.preloads += len(decoded)
+
+    def needs_pil(self, candidates, size):
+        return any((c, size) not in self.compiled for c in candidates)
+
+    def decode(self, candidate, size):
+        # PIL decode + resize only, so it is safe off the Tk thread.
+        # None if the file is missing or unreadable. A compiled asset is
+        # returned as its path: Tk loads it directly, nothing to decode.
+        compiled = self.compiled.get((candidate, size))
+        if compiled is not None:
+            return compiled
+        path = self.path_for(candidate)
+        if not os.path.exists(path):
+            return None
+        import_pil()
+        try:
+            img = Image.open(path)
+            return img.resize(size)
+        except Exception as e:
+            print(f"Error loading symbol for {candidate}: {e}")
+            return None
+
+    def add_decoded(self, candidate, size, img):
+        # Tk thread: wrap an image from decode() and cache it
+        if img is None:
+            image = None
+        elif isinstance(img, str):
+            try:
+                image = tk.PhotoImage(file=img)
+            except tk.TclError as e:
+                print(f"Error loading compiled symbol for {candidate}: {e}")
+                self.compiled.pop((candidate, size), None)  # fall back to PIL next time
+                image = None
+        else:
+            import_pil()
+            image = ImageTk.PhotoImage(img)
+        # missing symbols are cached too (as None) so we don't stat() per key
+        nbytes = size[0] * size[1] * 4 if image is not None else 0
+        self._store((candidate, size), image, nbytes)
+        return image
+
+    def _load(self, key):
+        candidate, size = key
+        return self.add_decoded(candidate, size, self.decode(candidate, size))
+
+    def _store(self, key, image, nbytes):
+        self._entries[key] = (image, nbytes)
+        self.bytes_used += nbytes
+        while self.bytes_used > self.max_bytes and len(self._entries) > 1:
+            _, (_, old_bytes) = self._entries.popitem(last=False)
+            self.bytes_used -= old_bytes
+            self.evictions += 1
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "preloads": self.preloads,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+            "bytes": self.bytes_used,
+        }
+
+    def summary(self):
+        s = self.stats()
+        return (f"Symbol cache: {s['hits']} hits, {s['misses']} misses, "
+                f"{s['preloads']} preloaded, {s['evictions']} evicted, "
+                f"{s['entries']} entries / {s['bytes'] // 1024} KiB")
@@ -0,0 +1,47 @@
+# test_journal.py
+#
+# The vote writer thread finalizes ballots in the journal while the Tk
+# thread records the next voter's keys into it. A slow fsync on the writer
+# side must not hold up a keypress.
+#
+#   python -m pytest test_journal.py
+
+import os
+import threading
+import time
+
+from vote_journal import VoteJournal
+
+SLOW_FSYNC_S = 2.0
+
+
+def test_record_does_not_wait_for_finalize_fsync(tmp_path, monkeypatch):
+    journal = VoteJournal(str(tmp_path / "votes_journal.log"))
+    journal.begin()
+    journal.record("Head Boy", "A")
+    sealed = journal.seal(b"A\r\n", 3)
+    journal.begin()  # next voter, as with auto-arm
+
+    in_fsync = threading.Event()
+    real_fsync = os.fsync
+
+    def fsync(fd):
+        # only the writer thread's disk is slow
+        if threading.current_thread().name == "durable-writer":
+            in_fsync.set()
+            time.sleep(SLOW_FSYNC_S)
+        real_fsync(fd)
+
+    monkeypatch.setattr(os, "fsync", fsync)
+    writer = threading.Thread(target=journal.finalize, args=(sealed,), name="durable-writer")
+    writer.start()
+    assert in_fsync.wait(5)
+
+    t0 = time.perf_counter()
+    journal.record("Head Boy", "B")  # a keypress on the Tk thread
+    elapsed = time.perf_counter() - t0
+    writer.join()
+    journal.close()
+
+    assert elapsed < SLOW_FSYNC_S / 4
+    assert VoteJournal(journal.path).replay() == [(journal.open_ballot, {"Head Boy": "B"}, None)]
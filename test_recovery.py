@@ -0,0 +1,165 @@
+# test_recovery.py
+#
+# Crash and restart cycles, run headless (see headless.py). A crash at some
+# point of the commit path is faked by making the steps after it no-ops for
+# one launch; the next launch in the same directory has to end up with every
+# ballot written exactly once, chained, closed in the journal and counted once.
+# Rows the journal didn't seal must never be chained.
+#
+#   python -m pytest test_recovery.py
+
+import os
+
+import pytest
+
+import ballot_chain
+import storage
+import vote_journal
+import voting_machine
+from ballot_chain import BallotChain
+from durable_writer import DurableWriter
+from headless import Headless, key_path, keys_by_position
+from voting_machine import CHAIN_FILE, CHAIN_SIG_FILE, JOURNAL_FILE, MAIN_CSV, BACKUP_CSV, VOTES_DB
+
+
+def vote(sim):
+    # one voter, first candidate for every position
+    sim.machine.start_voting()
+    for keys in keys_by_position():
+        sim.press(keys[0])
+        sim.advance(500)
+    sim.advance(2500)  # finalize delay
+
+
+def rows(path):
+    with open(path, "rb") as f:
+        return f.read().splitlines()[1:]
+
+
+def votes_csv(workdir):
+    # the file the chain is over: votes.csv, or what sqlite exports
+    if voting_machine.STORAGE_BACKEND == "sqlite":
+        path = os.path.join(workdir, "exported.csv")
+        storage.export_csv(os.path.join(workdir, VOTES_DB), path)
+        return path
+    return os.path.join(workdir, MAIN_CSV)
+
+
+def problems(workdir, anchors=()):
+    key = ballot_chain.load_key(key_path(workdir))
+    return ballot_chain.verify(votes_csv(workdir), os.path.join(workdir, CHAIN_FILE),
+                               os.path.join(workdir, CHAIN_SIG_FILE), key, anchors=anchors)
+
+
+@pytest.fixture(params=["csv", "sqlite"])
+def backend(request, monkeypatch):
+    monkeypatch.setattr(voting_machine, "STORAGE_BACKEND", request.param)
+    return request.param
+
+
+def crash_and_restart(workdir, monkeypatch, *crashed):
+    # vote once with the crashed steps disabled, then launch again
+    with monkeypatch.context() as m:
+        for cls, name, *fake in crashed:
+            m.setattr(cls, name, fake[0] if fake else lambda *a, **kw: None)
+        with Headless(workdir=str(workdir)) as sim:
+            vote(sim)
+            if sim.machine.storage.writer is not None:
+                sim.machine.storage.writer.flush()
+    with Headless(workdir=str(workdir)) as sim:
+        total = sim.machine.total_students
+    return total
+
+
+def check_recovered(workdir, total):
+    main = rows(votes_csv(workdir))
+    assert len(main) == 1
+    if voting_machine.STORAGE_BACKEND == "csv":
+        assert rows(os.path.join(workdir, BACKUP_CSV)) == main
+    assert problems(workdir) == []
+    assert vote_journal.VoteJournal(os.path.join(workdir, JOURNAL_FILE)).replay() == []
+    assert total == 1
+
+
+def test_row_chained_but_not_finalized(tmp_path, monkeypatch, backend):
+    # crash between the chain append and the journal's F record
+    total = crash_and_restart(tmp_path, monkeypatch, (vote_journal.VoteJournal, "finalize"))
+    check_recovered(tmp_path, total)
+
+
+def test_row_written_but_not_chained(tmp_path, monkeypatch, backend):
+    # crash right after the fsync: row on disk, no chain entry, no F
+    total = crash_and_restart(tmp_path, monkeypatch, (BallotChain, "append"),
+                              (vote_journal.VoteJournal, "finalize"))
+    check_recovered(tmp_path, total)
+
+
+@pytest.mark.parametrize("torn", [False, True])
+def test_row_in_main_only(tmp_path, monkeypatch, torn):
+    # power cut between the fsyncs of votes.csv and backup_votes.csv,
+    # with none or part of the row in the backup
+    def main_only(writer, batch):
+        data = b"".join(d for d, _, _ in batch)
+        writer._files[0].write(data)
+        if torn:
+            writer._files[1].write(data[:len(data) // 2])
+
+    total = crash_and_restart(tmp_path, monkeypatch, (DurableWriter, "_commit", main_only),
+                              (BallotChain, "append"), (vote_journal.VoteJournal, "finalize"))
+    check_recovered(tmp_path, total)
+    key = ballot_chain.load_key(key_path(tmp_path))
+    assert ballot_chain.verify(os.path.join(tmp_path, BACKUP_CSV), os.path.join(tmp_path, CHAIN_FILE),
+                               key=key) == []
+
+
+def test_row_never_written(tmp_path, monkeypatch, backend):
+    # crash with the row still queued: it is written at the next launch
+    storage_class = storage.SqliteStorage if backend == "sqlite" else storage.CsvStorage
+    total = crash_and_restart(tmp_path, monkeypatch, (storage_class, "add_ballot"))
+    check_recovered(tmp_path, total)
+
+
+def test_unsealed_row_not_chained(tmp_path):
+    # a row added to votes.csv while the machine was off is not the
+    # machine's to sign: it stays outside the chain and verify reports it
+    with Headless(workdir=str(tmp_path)) as sim:
+        vote(sim)
+    stuffed = rows(os.path.join(tmp_path, MAIN_CSV))[0] + b"\r\n"
+    for name in (MAIN_CSV, BACKUP_CSV):
+        with open(os.path.join(tmp_path, name), "ab") as f:
+            f.write(stuffed)
+    with Headless(workdir=str(tmp_path)) as sim:
+        assert sim.machine.chain.rows == 1
+        assert "not written by this machine" in sim.machine.voting_status.options["text"]
+    assert any("not in the chain" in p for p in problems(tmp_path))
+
+
+def test_rebuilt_chain_fails_anchor(tmp_path):
+    # with the key in hand a rebuilt chain re-signs cleanly; only the head
+    # written down off the machine catches it
+    with Headless(workdir=str(tmp_path)) as sim:
+        vote(sim)
+        vote(sim)
+        assert not sim.machine.key_exposed
+    anchor = ballot_chain.format_anchor(*sim.machine.chain.head)
+    assert problems(tmp_path, [anchor]) == []
+
+    main = os.path.join(tmp_path, MAIN_CSV)
+    with open(main, "rb") as f:
+        header, *lines = f.read().splitlines(keepends=True)
+    first, rest = lines[1].split(b",", 1)
+    other = next(name for name, position in voting_machine.KEY_MAPPING.values()
+                 if position == voting_machine.POSITIONS[0] and name.encode() != first)
+    lines[1] = other.encode() + b"," + rest  # the second voter's Head Boy vote, changed
+    with open(main, "wb") as f:
+        f.write(header + b"".join(lines))
+    for name in (CHAIN_FILE, CHAIN_SIG_FILE):
+        os.remove(os.path.join(tmp_path, name))
+    chain = BallotChain(main, os.path.join(tmp_path, CHAIN_FILE), os.path.join(tmp_path, CHAIN_SIG_FILE),
+                        key_path(tmp_path), header=header)
+    for line in lines:
+        chain.append(line)
+    chain.close()
+
+    assert problems(tmp_path) == []
+    assert any("recorded anchor" in p for p in problems(tmp_path, [anchor]))
@@ -0,0 +1,203 @@
+# vote_journal.py
+
+import os
+import csv
+import hashlib
+import threading
+
+# Record types (first CSV field), each followed by the ballot id:
+#   B,<id>                       ballot started
+#   V,<id>,<position>,<candidate> one selection
+#   S,<id>,<end offset>,<sha256>  ballot finished, its row queued for the vote CSVs
+#   F,<id>                       ballot written to the vote CSVs
+#   A,<id>                       ballot discarded (reset / not recovered)
+#
+# A finished ballot is sealed (no longer open) while its row is on the way to
+# disk, and gets its F once the row is committed, so with auto-arm the next
+# ballot can be open while the last is in flight. The S record says where
+# the row will end in votes.csv (as the hash chain counts it) and hashes its
+# bytes, so after a crash between the row reaching the disk and the F,
+# recovery can tell the row is already there and not write it twice.
+
+
+class VoteJournal:
+    # Append-only write-ahead log of the ballot in progress.
+    # fsync_every: fsync after this many records (0 = leave it to the OS);
+    # seal/finalize/abort records are always fsynced.
+    # finalize(id) comes from the vote writer thread, hence the lock. It only
+    # covers the state and the write into the log; the fsyncs run after it
+    # is released, so a keypress's record() never waits on the writer
+    # thread's fsync of an F record.
+
+    def __init__(self, path, fsync_every=1, max_bytes=1024 * 1024):
+        self.path = path
+        self.fsync_every = fsync_every
+        self.max_bytes = max_bytes
+        self.ballot_id = 0
+        self.open_ballot = None
+        self._file = None
+        self._writer = None
+        self._unsynced = 0
+        self._sealed = set()  # ballots waiting for their row to be committed
+        self._rolling = False  # a _roll_up is writing the fresh log
+        self._lock = threading.RLock()
+
+    def replay(self):
+        # Returns [(ballot id, {position: candidate}, seal)] for every ballot
+        # a crash left without an F or A record, oldest first (sealed ballots
+        # whose F never made it, then at most one in progress). seal is
+        # (end offset, sha256 hex) from the S record, None if not sealed.
+        ballots = {}
+        seals = {}
+        if os.path.exists(self.path):
+            with open(self.path, newline="", encoding="utf-8") as jf:
+                for line in jf:
+                    if not line.endswith("\n"):
+                        break  # torn write from the crash
+                    rec = next(csv.reader([line]), [])
+                    try:
+                        kind, bid = rec[0], int(rec[1])
+                    except (IndexError, ValueError):
+                        continue
+                    self.ballot_id = max(self.ballot_id, bid)
+                    if kind == "B":
+                        ballots[bid] = {}
+                    elif kind == "V" and bid in ballots and len(rec) == 4:
+                        ballots[bid][rec[2]] = rec[3]
+                    elif kind == "S" and bid in ballots and len(rec) == 4:
+                        seals[bid] = (int(rec[2]), rec[3])
+                    elif kind in ("F", "A"):
+                        ballots.pop(bid, None)
+        self.open_ballot = None
+        return [(bid, votes, seals.get(bid)) for bid, votes in ballots.items()]
+
+    def resume(self, ballot_id):
+        # make a ballot from replay() the open one again
+        self.open_ballot = ballot_id
+
+    def begin(self):
+        # open_ballot only changes on the calling (Tk) thread
+        if self.open_ballot is not None:
+            self.abort()
+        with self._lock:
+            self.ballot_id += 1
+            self.open_ballot = self.ballot_id
+            fd = self._append(["B", self.ballot_id])
+        _fsync(fd)
+
+    def record(self, position, candidate):
+        if self.open_ballot is None:
+            self.begin()
+        with self._lock:
+            fd = self._append(["V", self.open_ballot, position, candidate])
+        _fsync(fd)
+
+    def seal(self, line, end_offset):
+        # the open ballot is complete and its row (line, ending at end_offset)
+        # about to be queued: returns its id
+        fd = None
+        with self._lock:
+            ballot_id, self.open_ballot = self.open_ballot, None
+            if ballot_id is not None:
+                self._sealed.add(ballot_id)
+                fd = self._append(["S", ballot_id, end_offset, hashlib.sha256(line).hexdigest()], sync=True)
+        _fsync(fd)
+        return ballot_id
+
+    def finalize(self, ballot_id=None):
+        # ballot_id: a sealed ballot whose row is now on disk (default: the open one)
+        with self._lock:
+            if ballot_id is None:
+                ballot_id, self.open_ballot = self.open_ballot, None
+            if ballot_id is None:
+                return
+            self._sealed.discard(ballot_id)
+            fd = self._append(["F", ballot_id], sync=True)
+        _fsync(fd)
+        self._roll_up()
+
+    def abort(self):
+        with self._lock:
+            if self.open_ballot is None:
+                return
+            fd = self._append(["A", self.open_ballot], sync=True)
+            self.open_ballot = None
+        _fsync(fd)
+        self._roll_up()
+
+    def close(self):
+        with self._lock:
+            if self._file:
+                if self._unsynced:
+                    os.fsync(self._file.fileno())
+                    self._unsynced = 0
+                self._file.close()
+                self._file = None
+
+    def _append(self, rec, sync=False):
+        # Under the lock. Returns a duplicate of the log's descriptor when
+        # the record is due an fsync, for the caller to pass to _fsync()
+        # once the lock is released (the log may be closed or replaced by
+        # then; the duplicate still points at the file written to).
+        if self._file is None:
+            self._file = open(self.path, "a", newline="", encoding="utf-8")
+            self._writer = csv.writer(self._file)
+            if self._file.tell() and not self._ends_with_newline():
+                self._file.write("\r\n")  # terminate a torn record before appending
+        self._writer.writerow(rec)
+        self._file.flush()
+        self._unsynced += 1
+        if sync or (self.fsync_every and self._unsynced >= self.fsync_every):
+            self._unsynced = 0
+            return os.dup(self._file.fileno())
+        return None
+
+    def _ends_with_newline(self):
+        with open(self.path, "rb") as jf:
+            jf.seek(-1, os.SEEK_END)
+            return jf.read(1) == b"\n"
+
+    def _idle(self):
+        return self.open_ballot is None and not self._sealed and self._file is not None
+
+    def _roll_up(self):
+        # Nothing in the log is needed once no ballot is open or sealed, so
+        # start a fresh file when it gets big. It holds one F record with the
+        # last id, so ids keep counting up (the aggregator drops an id it
+        # has seen), and only replaces the log once it is on disk: a crash
+        # leaves the old log or the new one, never an empty one. The fresh
+        # file is written outside the lock and swapped in only if nothing
+        # was recorded meanwhile.
+        with self._lock:
+            if self._rolling or not self._idle() or self._file.tell() <= self.max_bytes:
+                return
+            self._rolling = True
+            last_id = self.ballot_id
+        tmp = self.path + ".tmp"
+        try:
+            with open(tmp, "w", newline="", encoding="utf-8") as tf:
+                csv.writer(tf).writerow(["F", last_id])
+                tf.flush()
+                os.fsync(tf.fileno())
+            with self._lock:
+                if self._idle() and self.ballot_id == last_id:
+                    self._file.close()
+                    self._file = None  # reopened for appending by the next record
+                    self._unsynced = 0
+                    os.replace(tmp, self.path)
+        except OSError as e:
+            print(f"⚠ Journal roll-over failed ({e}); keeping the current log")
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)  # not swapped in: a ballot started meanwhile, try next time
+            with self._lock:
+                self._rolling = False
+
+
+def _fsync(fd):
+    # fsync and close a descriptor from _append(); called without the lock
+    if fd is not None:
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
@@ -1,15 +1,28 @@
 # voting_machine.py
 
+import io
 import os
 import csv
 import sys
 import time
+import platform
 import threading
-import winsound
-import keyboard
+import traceback
+_STARTUP_T0 = time.perf_counter()
+
+# PIL, keyboard and winsound are imported lazily (warm-up thread / first use)
 import tkinter as tk
 from tkinter import simpledialog, messagebox
-from PIL import Image, ImageTk
+from audio import AudioWorker
+from symbol_cache import SymbolCache, import_pil
+from key_dispatcher import KeyDispatcher, import_keyboard
+from vote_journal import VoteJournal
+from metrics import METRICS, PhaseTimer
+from display import DisplayScheduler
+from debounce import DEBOUNCE_FILE, Debouncer, load_config
+from ballot import BALLOT_FILE, load_ballot, unpack
+from ballot_chain import BallotChain, KEY_FILE, format_anchor, key_exposed
+from storage import CsvStorage, SqliteStorage
 
 # ----------------- CONFIGURATION -----------------
 
@@ -19,49 +32,83 @@ STAFF_PIN = "1234"
 # Toggle whether to show student symbol screen
 ENABLE_STUDENT_SCREEN = True
 
+# Auto-arm: after Start Voting the keyboard stays hooked for the whole run.
+# A completed ballot is recorded at once (long beep) and the next one is
+# armed ARM_GUARD_MS later, without a staff click; keys in between are
+# ignored. Staff use Pause / Resume to stop between voters.
+AUTO_ARM = False
+ARM_GUARD_MS = 1000
+NEXT_VOTER_TEXT = "Next voter, please"
+
 # Beep settings
 SHORT_BEEP_FREQ, SHORT_BEEP_DUR = 1000, 100  # Hz, ms
 LONG_BEEP_FREQ, LONG_BEEP_DUR   = 1500, 1000  # Hz, ms
 
-
-# CSV files
-MAIN_CSV   = "votes.csv"
-BACKUP_CSV = "backup_votes.csv"
+# Symbol images: display size (set in symbol_cache.py, shared with
+# compile_symbols.py) and memory cap for the decoded-image cache
+from symbol_cache import SYMBOL_SIZE
+SYMBOL_CACHE_MAX_BYTES = 64 * 1024 * 1024
+SYMBOL_SHOW_MS = 2000  # how long a voted symbol stays on the student screen
+
+# Storage backend for ballots and session counts (see storage.py):
+#   "csv"    votes.csv + backup_votes.csv + session_data.csv
+#   "sqlite" VOTES_DB, with session and time per ballot; export votes.csv
+#            with `python storage.py export votes.db`
+STORAGE_BACKEND = "csv"
+VOTES_DB = "votes.db"
+STORAGE_COMMIT_MS = 0  # sqlite: ballots finalized within this window share a transaction
+
+# CSV files (vote file names live in storage.py, shared with the offline tools)
+from storage import MAIN_CSV, BACKUP_CSV
 SESSION_DATA_CSV = "session_data.csv"
-TEMP_CSV   = "votes_temp.csv"
-
-# Positions in fixed order
-POSITIONS = [
-    "Head Boy",
-    "Sports Captain - Girl",
-    "Arts Captain - Boy",
-    "Arts Captain - Girl",
-    "Co-curricular Activity Monitor - Boy",
-    "Co-curricular Activity Monitor - Girl"
-]
-
-# Key → (Candidate, Position)
-KEY_MAPPING = {
-    "2":  ("Fahmi Hamdhan",    POSITIONS[0]),
-    "3":  ("Rayan Muhammed VP",POSITIONS[0]),
-    "5":  ("Bibi Bismil PK",   POSITIONS[1]),
-    "6":  ("Fathima Marwa K",  POSITIONS[1]),
-    "7":  ("Shiya Fathima",    POSITIONS[1]),
-    "9":  ("Fizan E",          POSITIONS[2]),
-    "0":  ("Shahrul Muhammed K",POSITIONS[2]),
-    "-":  ("Siyan KP",         POSITIONS[2]),
-    "\\": ("Azaza Subair",     POSITIONS[3]),
-    "backspace": ("Faiza Firoz K", POSITIONS[3]),
-    "home":      ("Alhadi Ansad K", POSITIONS[4]),
-    "page up":   ("Muhammed Adhil", POSITIONS[4]),
-    "/":         ("Aamiya Jamal",    POSITIONS[5]),
-    "*":         ("Ayisha Nuha K",   POSITIONS[5]),
-}
+# CSV backend: ballots are appended and fsynced by a writer thread (see
+# durable_writer.py); a row may wait this long for others to share its
+# fsync. None writes them inline on the Tk thread, without fsync.
+VOTE_WRITER_LATENCY_MS = 0
+VOTE_WRITER_CLOSE_TIMEOUT_S = 10  # exit waits at most this long for queued ballots (pulled USB stick)
+SESSION_COMPACT_EVERY = 200  # rewrite session_data.csv after this many appended records
+
+# Hash chain over votes.csv rows, with HMAC-signed checkpoints (see ballot_chain.py)
+CHAIN_FILE = "votes_chain.log"
+CHAIN_SIG_FILE = "votes_chain.sig"
+CHAIN_KEY_FILE = KEY_FILE  # outside this directory, ideally on staff-only removable media; verifying needs it
+CHAIN_CHECKPOINT_EVERY = 500  # sign the chain after this many ballots (and at shutdown)
+
+# Write-ahead journal for the ballot in progress (replayed at launch)
+JOURNAL_FILE = "votes_journal.log"
+JOURNAL_FSYNC_EVERY = 1  # fsync after every N selections (0 = leave it to the OS)
+
+# Optional live feed of finalized ballots to aggregator.py (None = off).
+# Ballot ids come from the journal, so start a fresh aggregator state when
+# the journal is cleared for a new election.
+AGGREGATOR_ADDRESS = None  # e.g. "192.168.1.10:8765" or "unix:/tmp/voting_aggregator.sock"
+AGGREGATOR_BOOTH_ID = platform.node() or "booth"
+AGGREGATOR_OUTBOX = "aggregator_outbox.jsonl"  # ballots not yet acked by the aggregator
+
+# Performance metrics, exported periodically and shown on the staff panel
+METRICS_FILE = "metrics.jsonl"  # JSON lines; give it a .prom name for Prometheus text format
+METRICS_INTERVAL_MS = 10000
+PROFILE_BALLOTS = 0  # >0: cProfile the first N ballots into profile_<time>.prof
+
+# Ballot: positions, candidates and their keys, compiled from ballot.json
+BALLOT = load_ballot(BALLOT_FILE)
+
+# Name-based views of the ballot
+POSITIONS = BALLOT.positions
+KEY_MAPPING = BALLOT.key_mapping()  # Key → (Candidate, Position)
+
+# Timed hot paths, in the order shown on the staff panel
+HOT_PATHS = ("on_key_press", "get_symbol_image", "_save_temp", "_finalize_votes",
+             "_append_session_record", "_update_session_label", "_save_session_data",
+             "student_feedback")
 
 # --------------------------------------------------
 
 class VotingMachine:
     def __init__(self):
+        self.startup = PhaseTimer(start=_STARTUP_T0)
+        self.startup.mark("modules")
+
         # --- PIN check at launch -----------------------------------
         temp_root = tk.Tk()
         temp_root.withdraw()
@@ -71,13 +118,34 @@ class VotingMachine:
             temp_root.destroy()
             sys.exit(1)
         temp_root.destroy()
+        self.startup.mark("PIN prompt")
         # -----------------------------------------------------------
 
         # --- State initialization ---
         self.voting_active = False
-        self.votes = {}
-        self.last_key = None
+        self.votes = BALLOT.new_state()
+        self.debounce = Debouncer(load_config(DEBOUNCE_FILE))
         self.hook = None
+        self._arm_after = None      # auto-arm: pending _arm_next
+        self.pause_pending = False  # auto-arm: pause once the current voter is done
+        self.handoffs = 0
+        self.symbol_cache = SymbolCache(SYMBOL_CACHE_MAX_BYTES)
+        self.audio = AudioWorker(short=(SHORT_BEEP_FREQ, SHORT_BEEP_DUR),
+                                 long=(LONG_BEEP_FREQ, LONG_BEEP_DUR))
+        self.journal = VoteJournal(JOURNAL_FILE, fsync_every=JOURNAL_FSYNC_EVERY)
+        self.resume_ballot = False
+        self.sink = None
+        if AGGREGATOR_ADDRESS:
+            from booth_sink import BoothSink
+            self.sink = BoothSink(AGGREGATOR_ADDRESS, AGGREGATOR_BOOTH_ID, AGGREGATOR_OUTBOX)
+
+        # --- Storage (creates the vote CSVs if missing) ---
+        if STORAGE_BACKEND == "sqlite":
+            self.storage = SqliteStorage(VOTES_DB, POSITIONS)
+        else:
+            self.storage = CsvStorage(MAIN_CSV, BACKUP_CSV, SESSION_DATA_CSV, POSITIONS,
+                                      writer_latency_ms=VOTE_WRITER_LATENCY_MS)
+        self._commit_after = None
 
         # --- Session loading & auto‑creation ---
         self.total_students = 0
@@ -85,17 +153,17 @@ class VotingMachine:
         self.session_counts = {}
 
         # 1) Read existing session rows (if any)
-        rows = []
-        if os.path.exists(SESSION_DATA_CSV):
-            with open(SESSION_DATA_CSV, newline="") as sf:
-                rows = [r for r in csv.reader(sf) if len(r) == 2]
+        rows = self.storage.load_sessions()
 
         # 2) If we have past sessions, load them & create the next one
+        #    (counts are appended as they change, so the last row per session wins)
+        self.session_records = len(rows)
         if rows:
             for name, count in rows:
-                self.session_names.append(name)
-                self.session_counts[name] = int(count)
-                self.total_students += int(count)
+                if name not in self.session_counts:
+                    self.session_names.append(name)
+                self.session_counts[name] = count
+            self.total_students = sum(self.session_counts.values())
 
             last_num = int(self.session_names[-1].split()[-1])
             new_sess = f"Session {last_num + 1}"
@@ -109,24 +177,174 @@ class VotingMachine:
             self.session_counts  = {"Session 1": 0}
             self.current_session = "Session 1"
 
-        # --- Prepare vote CSVs if missing ---
-        for f in (MAIN_CSV, BACKUP_CSV):
-            if not os.path.exists(f):
-                with open(f, "w", newline="") as cf:
-                    writer = csv.writer(cf)
-                    writer.writerow(POSITIONS)
+        # chained over the CSV rows; with sqlite, over the rows storage.py exports
+        chained_csv = MAIN_CSV if isinstance(self.storage, CsvStorage) else None
+        self.chain = BallotChain(chained_csv, CHAIN_FILE, CHAIN_SIG_FILE, CHAIN_KEY_FILE,
+                                 CHAIN_CHECKPOINT_EVERY, header=self.storage.header)
+        self.key_exposed = key_exposed(CHAIN_KEY_FILE, CHAIN_FILE)
+        if self.key_exposed:
+            print(f"Warning: chain key {CHAIN_KEY_FILE} is in the election directory; "
+                  "anyone who copies the votes can re-sign the chain")
+        self.startup.mark("state")
 
         # --- Build the GUIs ---
         self.build_staff_window()
         if ENABLE_STUDENT_SCREEN:
             self.build_student_window()
+        self.startup.mark("windows")
+
+        # --- Recover a ballot interrupted by a crash / power cut ---
+        self._recover_ballot()
+        self.startup.mark("recovery")
+
+        # --- Heavy imports + symbol decoding in the background ---
+        # Start Voting stays disabled until this finishes
+        self._start_warm_up()
+
+        # --- Metrics export / profiling ---
+        if PROFILE_BALLOTS:
+            METRICS.profile_ballots(PROFILE_BALLOTS)
+        self.root.after(METRICS_INTERVAL_MS, self._metrics_tick)
+
+    def _start_warm_up(self):
+        self.ready = False
+        self._warm = None
+        self.start_btn.config(state=tk.DISABLED, text="Warming up…")
+        threading.Thread(target=self._warm_up, name="warm-up", daemon=True).start()
+        self.root.after(20, self._finish_warm_up)
+
+    def _warm_up(self):
+        # background thread: imports and PIL decoding only, no Tk calls.
+        # A failure is handed over too, so the panel can show it.
+        try:
+            self._warm = self._warm_up_steps()
+        except Exception as e:
+            traceback.print_exc()
+            self._warm = e
+
+    def _warm_up_steps(self):
+        timer = PhaseTimer()
+        import_keyboard()
+        timer.mark("import keyboard")
+        candidates = [name for names in BALLOT.candidates for name in names]
+        if self.symbol_cache.needs_pil(candidates, SYMBOL_SIZE):  # not all compiled
+            import_pil()
+            timer.mark("import PIL")
+
+        missing = [c for c in candidates if not os.path.exists(self.symbol_cache.path_for(c))]
+        timer.mark("validate symbols")
+
+        decoded = {c: self.symbol_cache.decode(c, SYMBOL_SIZE) for c in candidates}
+        timer.mark("decode symbols")
+        return timer, missing, decoded
+
+    def _finish_warm_up(self):
+        if self._warm is None:
+            self.root.after(20, self._finish_warm_up)
+            return
+        if isinstance(self._warm, Exception):
+            # Start Voting stays disabled: without the keyboard hook or symbols there is no voting
+            self.start_btn.config(state=tk.DISABLED, text="Warm-up failed")
+            self.voting_status.config(text=f"❌ Warm-up failed: {self._warm}", fg="red")
+            return
+        timer, missing, decoded = self._warm
+        t0 = time.perf_counter()
+        self.symbol_cache.preload(decoded, SYMBOL_SIZE)
+        timer.add("photo images", time.perf_counter() - t0)
+
+        unreadable = [c for c, img in decoded.items() if img is None and c not in missing]
+        if missing or unreadable:
+            problems = [f"missing: {', '.join(missing)}"] if missing else []
+            problems += [f"unreadable: {', '.join(unreadable)}"] if unreadable else []
+            print("Symbol check: " + "; ".join(problems))
+            self.voting_status.config(text=f"⚠ {len(missing) + len(unreadable)} candidate symbol(s) "
+                                           "missing or unreadable", fg="red")
+
+        self.ready = True
+        self.start_btn.config(state=tk.NORMAL, text="Start Voting")
+        self.startup.mark("warm-up")
+        print(f"Startup: {self.startup.summary()} (warm-up: {timer.summary()})")
+
+    def _recover_ballot(self):
+        # Rows are queued in order, so each sealed ballot's row ends at the
+        # offset its S record gives. Rows past the end of the chain are
+        # chained only where they are those ballots (crash between the write
+        # and the chain); a sealed ballot the chain covers reached the disk
+        # and was counted, only its F was lost.
+        replayed = self.journal.replay()
+        tail = self.storage.lines_after(self.chain.rows, self.chain.offset)
+        adopted = self.chain.adopt(tail, [seal for _, _, seal in replayed
+                                          if seal is not None and seal[0] > self.chain.offset])
+        if adopted < len(tail):
+            self.voting_status.config(text=f"⚠ {len(tail) - adopted} vote row(s) not written by this "
+                                           "machine: run ballot_chain.py verify", fg="red")
+        self.storage.sync_backup(self.chain.offset)  # rows a crash kept out of the backup
+        self._queued_end = self.chain.offset  # where the next queued row starts
+        saved = 0
+        for ballot_id, votes, seal in replayed:
+            self.journal.resume(ballot_id)
+            self.votes.clear()
+            # drop anything that doesn't match the current ballot
+            for position, candidate in votes.items():
+                slot = BALLOT.index_of(position, candidate)
+                if slot is not None:
+                    self.votes.select(*slot)
+
+            if seal is not None and seal[0] <= self.chain.offset:
+                self.journal.finalize()
+                self._send_ballot(ballot_id, BALLOT.row(self.votes))  # in case the crash beat the outbox
+                self.votes.clear()
+            elif seal is not None or len(self.votes) == len(POSITIONS):
+                # voter had finished; we died before the row reached the disk
+                self._finalize_votes()
+                self.votes.clear()
+                if seal is None:
+                    self._count_ballot()  # a sealed ballot was counted when it was finished
+                saved += 1
+            else:
+                self._recover_unfinished()
+        if saved:
+            messagebox.showinfo("Recovered", f"{saved} completed ballot(s) interrupted by a shutdown "
+                                "have been saved.", parent=self.root)
+
+    def _recover_unfinished(self):
+        if self.votes and messagebox.askyesno(
+            "Unfinished Ballot",
+            f"An unfinished ballot ({len(self.votes)}/{len(POSITIONS)} votes) was interrupted.\n\n"
+            "Restore it so the voter can finish? (No discards it.)",
+            parent=self.root
+        ):
+            # picked up again by the next Start Voting
+            self.resume_ballot = True
+        else:
+            self.votes.clear()
+            self.journal.abort()
 
-
+    @METRICS.timed("_save_session_data")
     def _save_session_data(self):
-        with open(SESSION_DATA_CSV, "w", newline="") as sf:
-            writer = csv.writer(sf)
-            for name in self.session_names:
-                writer.writerow([name, self.session_counts[name]])
+        # full rewrite: compacts the appended records down to one row per session
+        self.storage.save_sessions([(name, self.session_counts[name]) for name in self.session_names])
+        self._schedule_commit()
+        self.session_records = len(self.session_names)
+
+    @METRICS.timed("_append_session_record")
+    def _append_session_record(self, name):
+        # per-ballot path: one appended row, compacted every SESSION_COMPACT_EVERY
+        if self.session_records - len(self.session_names) >= SESSION_COMPACT_EVERY:
+            self._save_session_data()
+            return
+        self.storage.append_session(name, self.session_counts[name])
+        self._schedule_commit()
+        self.session_records += 1
+
+    def _schedule_commit(self):
+        # one storage transaction per burst of writes, committed from the Tk loop
+        if self._commit_after is None:
+            self._commit_after = self.root.after(STORAGE_COMMIT_MS, self._commit_storage)
+
+    def _commit_storage(self):
+        self._commit_after = None
+        self.storage.commit()
 
     def on_close_request(self):
         pin = simpledialog.askstring(
@@ -139,6 +357,8 @@ class VotingMachine:
             if self.voting_active and self.votes:
                 self._finalize_votes()
             self._save_session_data()
+            self._close_storage()
+            self._report_stats()
             self.root.destroy()
             os._exit(0)
         else:
@@ -147,6 +367,22 @@ class VotingMachine:
 
 
 
+    def _close_storage(self):
+        # Waits for queued ballots, so the chain and journal catch up. A
+        # pulled USB stick mustn't hang the exit: whatever isn't on disk by
+        # the timeout stays open in the journal and is saved at next launch.
+        unwritten = self.storage.close(timeout=VOTE_WRITER_CLOSE_TIMEOUT_S)
+        if unwritten:
+            messagebox.showerror(
+                "Ballots not saved",
+                f"{unwritten} ballot(s) could not be written to {MAIN_CSV} / {BACKUP_CSV} "
+                f"({self.storage.writer.error}).\n\nThey are kept in {JOURNAL_FILE} and will be "
+                f"saved when the voting machine is next started. Check the USB drive first.",
+                parent=self.root)
+        self.journal.close()
+        self.chain.close()
+        print(f"Chain head: {format_anchor(*self.chain.head)} (write on the close-of-poll form)")
+
     def build_staff_window(self):
         self.root = tk.Tk()
         self.root.title("Staff Control Panel")
@@ -154,6 +390,9 @@ class VotingMachine:
         # Intercept the window “X” close
         self.root.protocol("WM_DELETE_WINDOW", self.on_close_request)
 
+        # Key events are queued by the hook thread and handled on this Tk loop
+        self.dispatcher = KeyDispatcher(self.root)
+
         self.start_btn = tk.Button(self.root, text="Start Voting", width=20, command=self.start_voting)
         self.start_btn.grid(row=0, column=0, padx=10, pady=10, sticky="w")
 
@@ -180,6 +419,11 @@ class VotingMachine:
         self.new_session_btn = tk.Button(self.root, text="New Session", width=20, command=self.increment_session)
         self.new_session_btn.grid(row=0, column=3, padx=10, pady=10, sticky="w")
 
+        if AUTO_ARM:
+            self.pause_btn = tk.Button(self.root, text="Pause", width=20, state="disabled",
+                                       command=self.toggle_pause)
+            self.pause_btn.grid(row=0, column=5, padx=10, pady=10, sticky="w")
+
         self.voting_status = tk.Label(self.root, text="", font=("Arial", 16, "bold"), fg="green")
         self.voting_status.grid(row=1, column=0, columnspan=4, pady=5, sticky="n")
 
@@ -189,13 +433,37 @@ class VotingMachine:
         self.session_labels = {}
         self.update_session_display()
 
+        # Hot-path timings, refreshed by _metrics_tick
+        self.metrics_var = tk.StringVar()
+        tk.Label(self.root, textvariable=self.metrics_var, font=("Arial", 9), fg="gray",
+                 justify="left").grid(row=4, column=0, columnspan=4, padx=10, sticky="w")
+
+        # Chain head, to write down off the machine (ballot_chain.py verify --anchor)
+        self.chain_var = tk.StringVar()
+        tk.Label(self.root, textvariable=self.chain_var, font=("Courier", 10),
+                 fg="red" if self.key_exposed else "black").grid(
+            row=5, column=0, columnspan=4, padx=10, sticky="w")
+        self._update_chain_head()
+
     def update_session_display(self):
+        # full rebuild; per-ballot updates go through _update_session_label
         for widget in self.session_frame.winfo_children():
             widget.destroy()
+        self.session_labels = {}
         tk.Label(self.session_frame, text="🗂️ Session Counts", font=("Arial", 12, "bold")).pack()
         for name in self.session_names:
-            label = tk.Label(self.session_frame, text=f"{name}: {self.session_counts[name]} students", font=("Arial", 11))
+            self._update_session_label(name)
+
+    @METRICS.timed("_update_session_label")
+    def _update_session_label(self, name):
+        text = f"{name}: {self.session_counts[name]} students"
+        label = self.session_labels.get(name)
+        if label is None:
+            label = tk.Label(self.session_frame, text=text, font=("Arial", 11))
             label.pack(anchor="w")
+            self.session_labels[name] = label
+        else:
+            label.config(text=text)
 
     def increment_session(self):
         # Ask for PIN before allowing new session creation
@@ -210,8 +478,8 @@ class VotingMachine:
         self.session_counts[new_session] = 0
         self.current_session = new_session
         self.session_var.set(f"🧾 Current Session: {self.current_session}")
-        self.update_session_display()
-        self._save_session_data()
+        self._update_session_label(new_session)
+        self._append_session_record(new_session)
 
     def save_and_stop(self):
         pin = simpledialog.askstring("PIN Required", "Enter 4‑digit staff PIN:", show="*")
@@ -228,47 +496,54 @@ class VotingMachine:
             pass
         
         self._save_session_data()
+        self._close_storage()
+        self._report_stats()
         self.root.destroy()
         os._exit(0)  # hard exit to ensure keyboard unhooks
 
+    @METRICS.timed("get_symbol_image")
     def get_symbol_image(self, candidate):
-        safe_name = candidate.replace(" ", "_")
-        path = os.path.join("symbols", safe_name + ".png")  # or .png
-        if not os.path.exists(path):
-            return None
-        try:
-            img = Image.open(path)
-            img = img.resize((400, 400))  # adjust size as needed
-            return ImageTk.PhotoImage(img)
-        except Exception as e:
-            print(f"Error loading symbol for {candidate}: {e}")
-            return None
+        # served from the preloaded cache; a miss here means a voter waited on a decode
+        return self.symbol_cache.get(candidate, SYMBOL_SIZE)
     
 
     def build_student_window(self):
         self.student_win = tk.Toplevel(self.root)
         self.student_win.title("Student Vote Display")
         self.student_win.configure(background="white")
-        self.student_label = tk.Label(self.student_win, text="", font=("Arial", 48), bg="white")
+        # blank image slot the size of a symbol: clearing doesn't resize the label
+        self._blank_symbol = tk.PhotoImage(width=SYMBOL_SIZE[0], height=SYMBOL_SIZE[1])
+        self.student_label = tk.Label(self.student_win, text="", image=self._blank_symbol,
+                                      compound="center", font=("Arial", 48), bg="white")
         self.student_label.pack(expand=True, fill="both", padx=20, pady=20)
+        self.student_display = DisplayScheduler(
+            self.student_win, {"symbol": self.student_label},
+            {"symbol": {"image": self._blank_symbol, "text": ""}}, name="student")
         self.student_win.withdraw()  # hide until voting starts
 
     def start_voting(self):
+        if not self.ready:
+            return  # still warming up
         self.voting_active = True
-        self.votes.clear()
+        if self.resume_ballot:
+            # continue the ballot restored from the journal
+            self.resume_ballot = False
+        else:
+            self.votes.clear()
+            self.journal.begin()
 
         # Show progress label
-        self.progress_var.set("Votes cast: 0/6")
+        self.progress_var.set(f"Votes cast: {len(self.votes)}/{len(POSITIONS)}")
         self.progress_label.grid(row=1, column=0, columnspan=2, pady=10, sticky="w")
         self.start_btn.config(state=tk.DISABLED)
 
         # Show student screen (if enabled)
         if ENABLE_STUDENT_SCREEN:
             self.student_win.deiconify()
-            self.student_label.config(image="", text="")  # clear any old content
+            self.student_display.clear()  # clear any old content
 
         # Hook keyboard input
-        self.hook = keyboard.on_press(self.on_key_press)
+        self.hook = self.dispatcher.on_key(self.on_key_press)
 
         # Disable session and stop buttons during voting
         self.new_session_btn.config(state="disabled")
@@ -278,6 +553,9 @@ class VotingMachine:
 
         # Show voting status
         self.voting_status.config(text="✅ Voting in Progress", fg="green")
+        if AUTO_ARM:
+            self.pause_pending = False
+            self.pause_btn.config(text="Pause", state="normal")
 
 
 
@@ -289,69 +567,159 @@ class VotingMachine:
         self._cleanup_session()
         messagebox.showinfo("Reset", "Voting session has been reset.")
 
+    @METRICS.timed("on_key_press")
     def on_key_press(self, event):
-        if not self.voting_active or event.event_type != "down":
+        if not self.voting_active:
             return
-        name = event.name
-        # disable long press
-        if name == self.last_key:
+        # long presses, auto-repeat and key chatter (thresholds from debounce.json)
+        if not self.debounce.accept(event):
             return
-        self.last_key = name
+        name = event.name
 
-        if name not in KEY_MAPPING:
-            return
+        code = BALLOT.lookup(name, event.scan_code)
+        if code < 0:
+            return  # not a ballot key
 
-        candidate, position = KEY_MAPPING[name]
-        if position in self.votes:
+        pos, cand = unpack(code)
+        if not self.votes.select(pos, cand):
             return  # already voted this position
+        candidate, position = BALLOT.candidates[pos][cand], POSITIONS[pos]
 
         # record vote
-        self.votes[position] = candidate
         self._short_beep()
-        self._save_temp()
+        self._save_temp(position, candidate)
 
         # update progress
         count = len(self.votes)
-        self.progress_var.set(f"Votes cast: {count}/6")
+        self.progress_var.set(f"Votes cast: {count}/{len(POSITIONS)}")
 
         # student screen feedback
         if ENABLE_STUDENT_SCREEN:
             symbol = self.get_symbol_image(candidate)
             if symbol:
-                self.student_label.config(image=symbol)
-                self.student_label.image = symbol  # keep a reference
+                self.student_display.show(SYMBOL_SHOW_MS, symbol={"image": symbol, "text": ""})
             else:
-                self.student_label.config(text="(No symbol found)")
-            self.student_win.after(2000, lambda: self.student_label.config(image="", text=""))
+                self.student_display.show(SYMBOL_SHOW_MS, symbol={"image": self._blank_symbol,
+                                                                  "text": "(No symbol found)"})
 
         # if done
-        if count == len(POSITIONS):
+        if count == len(POSITIONS) and AUTO_ARM:
+            self._handoff()
+        elif count == len(POSITIONS):
             def delayed_finalize():
                 self._long_beep()
                 self._finalize_votes()
                 self._end_session()
 
-            delay = 2000 if ENABLE_STUDENT_SCREEN else 0
+            delay = SYMBOL_SHOW_MS if ENABLE_STUDENT_SCREEN else 0
             self.root.after(delay, delayed_finalize)
 
 
-    def _save_temp(self):
-        # write current votes to temp CSV
-        row = [ self.votes.get(pos, "") for pos in POSITIONS ]
-        with open(TEMP_CSV, "w", newline="") as tf:
-            csv.writer(tf).writerow(row)
+    @METRICS.timed("_save_temp")
+    def _save_temp(self, position, candidate):
+        # append just this selection to the journal
+        self.journal.record(position, candidate)
 
+    @METRICS.timed("_finalize_votes")
     def _finalize_votes(self):
-        # append to main and backup
-        row = [ self.votes[pos] for pos in POSITIONS ]
-        for f in (MAIN_CSV, BACKUP_CSV):
-            with open(f, "a", newline="") as cf:
-                csv.writer(cf).writerow(row)
-        # remove temp
-        try: os.remove(TEMP_CSV)
-        except: pass
+        # store the ballot (positions not voted stay blank), then extend the
+        # hash chain with exactly the CSV bytes
+        row = BALLOT.row(self.votes)
+        buf = io.StringIO()
+        csv.writer(buf).writerow(row)
+        line = buf.getvalue().encode("utf-8")
+        self._queued_end += len(line)
+        ballot_id = self.journal.seal(line, self._queued_end)
+
+        def durable():
+            # the row is on disk: chain it and close the ballot in the journal
+            self.chain.append(line)
+            if ballot_id is not None:  # finalize(None) would close whatever ballot is open by then
+                self.journal.finalize(ballot_id)
+
+        self.storage.add_ballot(line, row, self.current_session, time.time(), durable)
+        self._schedule_commit()
+        if ballot_id is not None:
+            self._send_ballot(ballot_id, row)
+        else:
+            # never journaled, so it has no id of its own: any id we made up
+            # could be one the aggregator already counted and would drop
+            print("⚠ Ballot saved without a journal entry: not sent to the aggregator")
+
+    def _send_ballot(self, ballot_id, row):
+        # the ballot's sealed journal id: the same on a recovered ballot, so
+        # the aggregator counts it once
+        if self.sink is not None:
+            self.sink.submit(ballot_id, {POSITIONS[pos]: name for pos, name in enumerate(row) if name})
+
+    # ---------- auto-arm ----------
+
+    def _handoff(self):
+        # Record the finished ballot now; the voter's last symbol stays up
+        # while the next ballot arms after the guard
+        self.voting_active = False  # keys during the guard are ignored
+        self._long_beep()
+        self._finalize_votes()
+        self.votes.clear()
+        self._count_ballot()
+        self.handoffs += 1
+        self.progress_var.set("✔ Ballot recorded")
+        self._arm_after = self.root.after(ARM_GUARD_MS, self._arm_next)
+
+    def _arm_next(self):
+        self._arm_after = None
+        if self.pause_pending:
+            self._pause()
+            return
+        self.debounce.reset()  # nothing held through the guard carries over
+        self.journal.begin()
+        self.voting_active = True
+        self.progress_var.set(f"Votes cast: 0/{len(POSITIONS)}")
+        if ENABLE_STUDENT_SCREEN:
+            # drop the last symbol's deadline; clear + show land in one redraw
+            self.student_display.clear()
+            self.student_display.show(symbol={"text": NEXT_VOTER_TEXT})
+
+    def _cancel_arm(self):
+        if self._arm_after is not None:
+            self.root.after_cancel(self._arm_after)
+            self._arm_after = None
+
+    def toggle_pause(self):
+        if self.hook is None:
+            self.start_voting()  # resume
+        elif self.votes:
+            # a voter is mid-ballot: stop once they're done
+            self.pause_pending = True
+            self.pause_btn.config(text="Pausing after this voter…", state="disabled")
+        else:
+            self._pause()
+
+    def _pause(self):
+        # between voters: unhook and hand the panel back to staff
+        self._cancel_arm()
+        self.pause_pending = False
+        self.voting_active = False
+        self.votes.clear()
+        if self.hook:
+            self.dispatcher.unhook(self.hook)
+            self.hook = None
+        self.debounce.reset()
+        self.journal.abort()  # the armed ballot has no votes
+        if ENABLE_STUDENT_SCREEN:
+            self.student_display.clear()
+        self.start_btn.config(state=tk.NORMAL)
+        self.new_session_btn.config(state="normal")
+        self.stop_btn.config(state="normal")
+        self.test_keyboard_btn.config(state="normal")
+        self.voting_status.config(text="⏸ Paused", fg="orange")
+        self.progress_label.grid_remove()
+        self.pause_btn.config(text="Resume", state="normal")
 
     def _cleanup_session(self):
+        self._cancel_arm()
+        if AUTO_ARM:
+            self.pause_btn.config(text="Pause", state="disabled")
         # ✅ 1. If voting was active and votes exist, finalize and exit early
         if self.voting_active and self.votes:
             self._finalize_votes()
@@ -361,29 +729,27 @@ class VotingMachine:
         # ✅ 2. Otherwise, reset to blank state
         self.voting_active = False
         self.votes.clear()
-        self.progress_var.set("Votes cast: 0/6")
+        self.resume_ballot = False
+        self.progress_var.set(f"Votes cast: 0/{len(POSITIONS)}")
         self.start_btn.config(state=tk.NORMAL)
 
         # ✅ 3. Keep student screen open and blank (if enabled)
         if ENABLE_STUDENT_SCREEN:
-            self.student_label.config(image="", text="")
+            self.student_display.clear()
 
         # ✅ 4. Unhook keyboard if any
         if self.hook:
-            keyboard.unhook(self.hook)
+            self.dispatcher.unhook(self.hook)
             self.hook = None
 
-        self.last_key = None
+        self.debounce.reset()
 
         # ✅ 5. Re-enable buttons
         self.new_session_btn.config(state="normal")
         self.test_keyboard_btn.config(state="normal")
 
-        # ✅ 6. Remove temporary vote file
-        try:
-            os.remove(TEMP_CSV)
-        except:
-            pass
+        # ✅ 6. Discard the unfinished ballot in the journal
+        self.journal.abort()
 
     def open_test_keyboard(self):
         pin = simpledialog.askstring("PIN Required", "Enter 4-digit staff PIN to test keyboard:", show="*")
@@ -406,46 +772,44 @@ class VotingMachine:
         lbl_position = tk.Label(test_win, text="", font=("Arial", 14), bg="white")
         lbl_position.pack(pady=10)
 
-        lbl_symbol = tk.Label(test_win, bg="white")
+        blank_symbol = tk.PhotoImage(width=SYMBOL_SIZE[0], height=SYMBOL_SIZE[1])
+        lbl_symbol = tk.Label(test_win, image=blank_symbol, compound="center", bg="white")
         lbl_symbol.pack(pady=20)
 
+        display = DisplayScheduler(
+            test_win,
+            {"key": lbl_key, "candidate": lbl_candidate, "position": lbl_position, "symbol": lbl_symbol},
+            {"key": {"text": "Press a key…"}, "candidate": {"text": ""}, "position": {"text": ""},
+             "symbol": {"image": blank_symbol, "text": ""}},
+            name="test")
+
         # Function to handle key press in test mode
         def on_test_key(event):
             name = event.name
-            lbl_key.config(text=f"Key: {name}")
-
-            if name in KEY_MAPPING:
-                candidate, position = KEY_MAPPING[name]
-                lbl_candidate.config(text=f"Candidate: {candidate}")
-                lbl_position.config(text=f"Position: {position}")
-
+            code = BALLOT.lookup(name, event.scan_code)
+            if code >= 0:
+                pos, cand = unpack(code)
+                candidate, position = BALLOT.candidates[pos][cand], POSITIONS[pos]
                 symbol = self.get_symbol_image(candidate)
-                if symbol:
-                    lbl_symbol.config(image=symbol)
-                    lbl_symbol.image = symbol
-                else:
-                    lbl_symbol.config(text="(No symbol)", image="")
-                
+                display.show(
+                    SYMBOL_SHOW_MS,  # reset after 2 seconds
+                    key={"text": f"Key: {name}"},
+                    candidate={"text": f"Candidate: {candidate}"},
+                    position={"text": f"Position: {position}"},
+                    symbol={"image": symbol, "text": ""} if symbol else
+                           {"image": blank_symbol, "text": "(No symbol)"})
                 self._short_beep()
-
-                # Reset after 2 seconds
-                test_win.after(2000, lambda: (
-                    lbl_key.config(text="Press a key…"),
-                    lbl_candidate.config(text=""),
-                    lbl_position.config(text=""),
-                    lbl_symbol.config(image="", text="")
-                ))
             else:
-                lbl_candidate.config(text="Unknown key")
-                lbl_position.config(text="")
-                lbl_symbol.config(image="", text="")
+                display.show(key={"text": f"Key: {name}"}, candidate={"text": "Unknown key"},
+                             position={"text": ""}, symbol={"image": blank_symbol, "text": ""})
 
         # Bind key press listener only for this window
-        keyboard_hook = keyboard.on_press(on_test_key)
+        keyboard_hook = self.dispatcher.on_press(on_test_key)
 
         # When closed, unhook
         def on_test_close():
-            keyboard.unhook(keyboard_hook)
+            self.dispatcher.unhook(keyboard_hook)
+            display.cancel()
             test_win.destroy()
 
         test_win.protocol("WM_DELETE_WINDOW", on_test_close)
@@ -458,29 +822,24 @@ class VotingMachine:
         # Hide student window if enabled
         # Clear student screen if enabled
         if ENABLE_STUDENT_SCREEN:
-            self.student_label.config(image="", text="")  # keep window open but blank
+            self.student_display.clear()  # keep window open but blank
 
         # Unhook keyboard listener
         if self.hook:
-            keyboard.unhook(self.hook)
+            self.dispatcher.unhook(self.hook)
             self.hook = None
 
-        self.last_key = None
+        self.debounce.reset()
         self.votes.clear()
-
-        # Increment total student count
-        self.total_students += 1
-        self.count_var.set(f"🧑‍🎓 Total Students Voted: {self.total_students}")
-
-        # Update current session vote count
-        self.session_counts[self.current_session] += 1
-        self.update_session_display()
+        self._count_ballot()
 
         # Re-enable staff buttons
         self.start_btn.config(state=tk.NORMAL)
         self.new_session_btn.config(state="normal")
         self.stop_btn.config(state="normal")
         self.test_keyboard_btn.config(state="normal")
+        if AUTO_ARM:
+            self.pause_btn.config(text="Pause", state="disabled")
 
 
         # Clear voting status
@@ -488,17 +847,90 @@ class VotingMachine:
 
         # Hide the progress count
         self.progress_label.grid_remove()
-        self._save_session_data()
-
 
+    def _count_ballot(self):
+        # Increment total student count
+        self.total_students += 1
+        self.count_var.set(f"🧑‍🎓 Total Students Voted: {self.total_students}")
 
+        # Update current session vote count
+        self.session_counts[self.current_session] += 1
+        self._update_session_label(self.current_session)
+        self._append_session_record(self.current_session)
+        METRICS.ballot_done()
+
+
+
+
+
+    def _metrics_tick(self):
+        self._export_metrics()
+        self._update_chain_head()
+        self.root.after(METRICS_INTERVAL_MS, self._metrics_tick)
+
+    def _update_chain_head(self):
+        # chain.head is replaced whole by the writer thread, so this read is safe
+        text = f"🔗 Chain head {format_anchor(*self.chain.head)}"
+        if self.key_exposed:
+            text += "  ⚠ key in election directory"
+        self.chain_var.set(text)
+
+    def _export_metrics(self):
+        keys = self.dispatcher.stats()
+        gauges = {
+            "students_voted": self.total_students,
+            "key_queue_depth": keys["depth"],
+            "key_queue_peak_depth": keys["peak_depth"],
+            "key_events_dropped": keys["dropped"],
+            "key_wait_p99_ms": round(keys["wait_p99_ms"], 3),
+            "symbol_cache_hits": self.symbol_cache.hits,
+            "symbol_cache_misses": self.symbol_cache.misses,
+            "beeps_played": self.audio.played,
+        }
+        if self.sink is not None:
+            gauges["aggregator_queued"] = self.sink.pending()
+        if self.storage.writer is not None:
+            writer = self.storage.writer.stats()
+            gauges["vote_writer_queue_depth"] = writer["depth"]
+            gauges["vote_writer_peak_depth"] = writer["peak_depth"]
+            gauges["vote_writer_commit_p99_ms"] = round(writer["commit_p99_ms"], 3)
+        try:
+            if METRICS_FILE.endswith(".prom"):
+                METRICS.write_prometheus(METRICS_FILE, gauges)
+            else:
+                METRICS.write_jsonl(METRICS_FILE, gauges)
+        except OSError as e:
+            print(f"Error writing metrics: {e}")
+
+        self.metrics_var.set(
+            METRICS.panel_text(HOT_PATHS) +
+            f"\nkey queue: depth {keys['depth']}, wait p99 {keys['wait_p99_ms']:.1f} ms"
+            f" · symbol cache misses: {self.symbol_cache.misses}"
+        )
 
+    def _report_stats(self):
+        # final metrics on shutdown
+        METRICS.stop_profile()
+        self._export_metrics()
+        print(self.symbol_cache.summary())
+        print(self.dispatcher.summary())
+        print(self.audio.summary())
+        print(self.debounce.summary())
+        if self.storage.writer is not None:
+            print(self.storage.writer.summary())
+        if AUTO_ARM:
+            print(f"Auto-arm: {self.handoffs} ballot(s) handed off without a staff click")
+        if ENABLE_STUDENT_SCREEN:
+            print(self.student_display.summary())
+        if self.sink is not None:
+            print(self.sink.summary())
+            self.sink.close()
 
     def _short_beep(self):
-        threading.Thread(target=lambda: winsound.Beep(SHORT_BEEP_FREQ, SHORT_BEEP_DUR), daemon=True).start()
+        self.audio.short_beep()
 
     def _long_beep(self):
-        threading.Thread(target=lambda: winsound.Beep(LONG_BEEP_FREQ, LONG_BEEP_DUR), daemon=True).start()
+        self.audio.long_beep()
 
     def run(self):
         self.root.mainloop()